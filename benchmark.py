@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the point cloud processing paths on synthetic or real maps
+"""
+
+import sys
+import argparse
+import time
+import numpy as np
+from pathlib import Path
+
+# Add src directory to Python path
+src_dir = Path(__file__).parent / "src"
+sys.path.insert(0, str(src_dir))
+
+from point_cloud_data import PointCloudData
+
+
+def timed(function, *args, repeat: int = 3, **kwargs) -> float:
+    """Best wall time of several runs of a function, in seconds"""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def synthetic_map(num_points: int, passes: int = 4, seed: int = 0) -> PointCloudData:
+    """
+    Street scene recorded in several passes, as merged multi-pass maps are
+
+    Every pass sweeps the whole street, so consecutive points in the
+    file are close together but each area appears once per pass, far apart
+    in memory.
+    """
+    rng = np.random.default_rng(seed)
+    per_pass = num_points // passes
+    sweeps = []
+    for _ in range(passes):
+        # The sensor moves along x; each pass samples ground, facades and a few cars
+        x = np.sort(rng.uniform(0, 500, per_pass))
+        kind = rng.random(per_pass)
+        y = rng.uniform(-10, 10, per_pass)
+        z = rng.normal(0, 0.03, per_pass)
+        facade = kind < 0.3
+        y[facade] = np.where(rng.random(facade.sum()) < 0.5, -12.0, 12.0) + rng.normal(0, 0.05, facade.sum())
+        z[facade] = rng.uniform(0, 15, facade.sum())
+        car = (kind > 0.9)
+        z[car] = rng.uniform(0.2, 1.6, car.sum())
+        y[car] = np.round(y[car] / 4) * 4 + rng.uniform(-0.9, 0.9, car.sum())
+        sweeps.append(np.column_stack([x, y, z]) + [350000.0, 5800000.0, 40.0])
+    return PointCloudData.from_points(np.concatenate(sweeps))
+
+
+def load_map(args) -> PointCloudData:
+    """Map under test: a PCD file if given, a synthetic one otherwise"""
+    if args.file:
+        from point_cloud_loader import PointCloudLoader
+        loader = PointCloudLoader()
+        if not loader.load_pcd(args.file, downsample_for_preview=False):
+            sys.exit(f"Could not load {args.file}")
+        data = loader.get_point_data()
+        if len(data) > args.points:
+            data = data.select(np.sort(np.random.default_rng(0).choice(len(data), args.points, replace=False)))
+        return data
+    return synthetic_map(args.points)
+
+
+def benchmark_morton(data: PointCloudData, radius: float = 0.5, dbscan_points: int = 300000):
+    """Neighbour searches over the points in file order and in Morton order"""
+    from scipy.spatial import cKDTree
+    from sklearn.cluster import DBSCAN
+    from utils import compute_point_density, morton_order, remove_outliers, voxel_keys
+
+    t0 = time.perf_counter()
+    order = morton_order(data.xyz)
+    reorder_time = time.perf_counter() - t0
+    print(f"Morton reorder of {len(data):,} points: {reorder_time:.3f}s")
+
+    variants = {'file order': data, 'morton order': data.select(order)}
+    # The DBSCAN subset is a spatial window so both variants cluster the same points
+    window = data.xyz[:, 0] <= np.quantile(data.xyz[:, 0], min(1.0, dbscan_points / len(data)))
+
+    rows = []
+    for name, cloud in variants.items():
+        xyz = cloud.xyz
+        sub = cloud.select(window if name == 'file order' else window[order]).xyz
+        tree = cKDTree(xyz)
+        results = {
+            'kd-tree build': timed(cKDTree, xyz),
+            'kd-tree knn (k=16)': timed(tree.query, xyz, k=16, repeat=1),
+            'point density': timed(compute_point_density, sub, radius, repeat=1),
+            'dbscan': timed(DBSCAN(eps=radius, min_samples=10).fit, sub, repeat=1),
+            'outlier removal': timed(remove_outliers, cloud, repeat=1),
+            'voxel unique': timed(lambda: np.unique(voxel_keys(xyz, 0.2), return_inverse=True)),
+        }
+        rows.append((name, results))
+
+    print(f"\n{'operation':<22}" + "".join(f"{name:>16}" for name, _ in rows) + f"{'speedup':>10}")
+    for operation in rows[0][1]:
+        before, after = rows[0][1][operation], rows[1][1][operation]
+        print(f"{operation:<22}{before:>15.3f}s{after:>15.3f}s{before / after:>9.2f}x")
+
+
+def benchmark_tensor(data: PointCloudData):
+    """Open3D conversions and algorithms through legacy clouds and through the tensor bridge"""
+    import open3d as o3d
+    from point_cloud_data import tensor_to_numpy
+    from utils import estimate_normals, remove_outliers, segment_plane_ransac
+
+    data = data.copy()
+    if data.colors is None:
+        data.colors = np.random.default_rng(0).integers(0, 256, (len(data), 3), dtype=np.uint8)
+
+    def copies(buffers):
+        # Buffers Open3D ended up with that do not share memory with the container
+        sources = [data.xyz, data.colors]
+        return sum(not any(np.shares_memory(b, src) for src in sources) for b in buffers)
+
+    legacy = data.to_open3d()
+    tensor = data.to_tensor()
+    legacy_copies = copies([np.asarray(legacy.points), np.asarray(legacy.colors)])
+    tensor_copies = copies([tensor_to_numpy(tensor.point.positions), tensor_to_numpy(tensor.point.colors)])
+    legacy_mb = (np.asarray(legacy.points).nbytes + np.asarray(legacy.colors).nbytes) / 1e6
+    print(f"Conversion copies: legacy {legacy_copies} ({legacy_mb:.0f} MB), tensor {tensor_copies}")
+
+    def legacy_plane():
+        data.to_open3d().segment_plane(distance_threshold=0.1, ransac_n=3, num_iterations=1000)
+
+    def legacy_normals():
+        data.to_open3d().estimate_normals(o3d.geometry.KDTreeSearchParamHybrid(radius=0.5, max_nn=30))
+
+    def tensor_outliers():
+        data.select(np.flatnonzero(tensor_to_numpy(data.to_tensor().remove_statistical_outliers(20, 2.0)[1])))
+
+    operations = {
+        'conversion': (data.to_open3d, data.to_tensor),
+        'plane segmentation': (legacy_plane, lambda: segment_plane_ransac(data)),
+        'normals': (legacy_normals, lambda: estimate_normals(data)),
+        'outlier removal': (lambda: remove_outliers(data), tensor_outliers),
+    }
+    print(f"\n{'operation':<22}{'legacy':>12}{'tensor':>12}{'speedup':>10}")
+    for operation, (before_fn, after_fn) in operations.items():
+        before, after = timed(before_fn, repeat=1), timed(after_fn, repeat=1)
+        print(f"{operation:<22}{before:>11.3f}s{after:>11.3f}s{before / after:>9.2f}x")
+
+
+def benchmark_clustering(data: PointCloudData, eps: float = 0.5, min_samples: int = 10,
+                         sizes=(1000000, 10000000, 50000000), dbscan_points: int = 2000000):
+    """Voxel connected components against DBSCAN on the above-ground points of growing maps"""
+    from sklearn.cluster import DBSCAN
+    from sklearn.metrics import adjusted_rand_score
+    from utils import voxel_connected_components
+
+    sizes = [size for size in sizes if size < len(data)] + [len(data)]
+    rng = np.random.default_rng(0)
+    print(f"{'map points':>12}{'clustered':>12}{'dbscan':>12}{'voxel':>12}{'speedup':>10}{'ARI':>8}")
+    for size in sizes:
+        cloud = data if size == len(data) else data.select(np.sort(rng.choice(len(data), size, replace=False)))
+        # Same height rule the detector falls back to without a ground plane
+        z = cloud.xyz[:, 2]
+        points = cloud.xyz[z > np.percentile(z, 10) + 0.2]
+
+        t0 = time.perf_counter()
+        voxel_labels = voxel_connected_components(points, eps, 3)
+        voxel_time = time.perf_counter() - t0
+
+        line = f"{size:>12,}{len(points):>12,}"
+        if len(points) <= dbscan_points:
+            t0 = time.perf_counter()
+            dbscan_labels = DBSCAN(eps=eps, min_samples=min_samples).fit(points).labels_
+            dbscan_time = time.perf_counter() - t0
+            # Agreement on the points DBSCAN did not call noise
+            kept = dbscan_labels >= 0
+            agreement = adjusted_rand_score(dbscan_labels[kept], voxel_labels[kept])
+            line += f"{dbscan_time:>11.2f}s{voxel_time:>11.2f}s{dbscan_time / voxel_time:>9.1f}x{agreement:>8.3f}"
+        else:
+            line += f"{'skipped':>12}{voxel_time:>11.2f}s{'':>10}{'':>8}"
+        print(line)
+
+
+BENCHMARKS = {
+    'clustering': benchmark_clustering,
+    'morton': benchmark_morton,
+    'tensor': benchmark_tensor,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point cloud processing benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help="benchmark to run")
+    parser.add_argument('--file', help="PCD map to use instead of a synthetic one")
+    parser.add_argument('--points', type=int, default=2000000, help="number of points (sampled from --file)")
+    args = parser.parse_args()
+
+    data = load_map(args)
+    print(f"Benchmark '{args.benchmark}' on {len(data):,} points")
+    BENCHMARKS[args.benchmark](data)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,14 +7,27 @@ import numpy as np
 import open3d as o3d
 from sklearn.cluster import DBSCAN, KMeans
 from sklearn.preprocessing import StandardScaler
+from scipy.spatial import cKDTree
 from scipy.spatial.distance import cdist
 import logging
-from typing import List, Tuple, Dict, Optional
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Tuple, Dict, Optional, Union
 from dataclasses import dataclass
 
+from point_cloud_data import COUNT_ATTRIBUTE, PointCloudData, as_point_data
+from utils import (GroundGrid, connected_components, fit_ground_grid, segment_plane_ransac,
+                   voxel_connected_components)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tiles overlap by this many eps cells: DBSCAN core points need their whole
+# eps neighbourhood, and the neighbours of those, inside the tile
+TILE_MARGIN_CELLS = 2
+
 
 @dataclass
 class DetectionResult:
@@ -30,23 +43,67 @@ class DynamicObjectDetector:
     """Class for detecting dynamic objects in point clouds"""
     
     def __init__(self):
-        self.point_cloud = None
+        self.point_data = None  # PointCloudData being processed
+        self.attributes = {}  # Extra per-point fields (e.g. intensity) aligned with the points
+        self.weights = None  # Input points behind each point after duplicate removal (None = 1 each)
         self.ground_plane = None
+        self.ground_grid: Optional[GroundGrid] = None  # Local ground surface, when fitted per cell
         self.detection_params = {
             'height_threshold': 0.2,      # Points above ground plane
+            'ground_method': 'plane',     # 'plane' (one RANSAC plane) or 'grid' (local plane per XY cell)
+            'ground_cell_size': 3.0,      # XY cell edge (m) of the 'grid' ground
             'cluster_eps': 0.5,           # DBSCAN epsilon
             'cluster_min_samples': 10,    # DBSCAN min samples
+            'cluster_method': 'dbscan',   # 'dbscan' or 'voxel' (connected components of eps voxels)
+            'voxel_min_points': 3,        # Points an eps voxel needs to join a 'voxel' cluster
+            'tile_size': None,            # XY tile edge (m) for parallel clustering (step 3 only), None for one pass
+            'max_workers': None,          # Clustering processes for tiles (CPU count if None)
             'vehicle_height_range': (0.5, 3.0),  # Typical vehicle height
             'vehicle_width_range': (1.0, 3.0),   # Typical vehicle width
             'vehicle_length_range': (2.0, 8.0),  # Typical vehicle length
             'density_threshold': 0.1,     # Point density threshold
             'road_width_estimate': 20.0,  # Estimated road width for filtering
+            'attribute_columns': ['intensity'],  # Per-point fields summarised for each cluster
         }
     
-    def set_point_cloud(self, point_cloud: o3d.geometry.PointCloud):
-        """Set the point cloud for processing"""
-        self.point_cloud = point_cloud
+    def set_point_cloud(self, point_cloud: Union[PointCloudData, o3d.geometry.PointCloud],
+                        attributes: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Set the point cloud for processing
+        
+        Args:
+            point_cloud: PointCloudData to process (an Open3D cloud is converted once)
+            attributes: Extra per-point fields, one array per field aligned with the points
+        """
+        self.point_data = as_point_data(point_cloud)
+        self.attributes = {}
+        for name, values in (attributes or {}).items():
+            if len(values) == len(self.point_data):
+                self.attributes[name] = values
+            else:
+                logger.warning(f"Ignoring attribute '{name}': {len(values)} values for {len(self.point_data)} points")
+        
+        # Deduplicated clouds weigh every point by the duplicates it replaced
+        counts = self.attributes.get(COUNT_ATTRIBUTE, self.point_data.attributes.get(COUNT_ATTRIBUTE))
+        self.weights = np.asarray(counts, dtype=np.float64) if counts is not None else None
         self.ground_plane = None
+        self.ground_grid = None
+    
+    def set_region(self, store, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        Process the tiles of a TileStore that touch a box instead of a whole cloud
+        
+        Args:
+            store: TileStore to read from
+            bbox: Optional (min_bound, max_bound) in world coordinates
+            
+        Returns:
+            StoreRegion of the points being processed, for mapping results back
+        """
+        data, region = store.read_region(bbox)
+        columns = self.detection_params['attribute_columns']
+        self.set_point_cloud(data, {name: data.attributes[name] for name in columns if name in data.attributes})
+        return region
     
     def detect_ground_plane(self) -> Optional[np.ndarray]:
         """
@@ -55,19 +112,21 @@ class DynamicObjectDetector:
         Returns:
             Ground plane coefficients [a, b, c, d] for ax + by + cz + d = 0
         """
-        if self.point_cloud is None:
+        if self.point_data is None:
             logger.error("No point cloud set")
             return None
         
         try:
-            # Use RANSAC to find ground plane
-            plane_model, inliers = self.point_cloud.segment_plane(
+            # Use RANSAC to find ground plane on the container's own float32 buffers
+            plane_model, inliers = segment_plane_ransac(
+                self.point_data,
                 distance_threshold=0.1,
                 ransac_n=3,
                 num_iterations=1000
             )
             
             self.ground_plane = plane_model
+            self.ground_grid = None
             logger.info(f"Ground plane detected: {plane_model}")
             logger.info(f"Ground plane inliers: {len(inliers)}")
             
@@ -77,9 +136,40 @@ class DynamicObjectDetector:
             logger.error(f"Error detecting ground plane: {e}")
             return None
     
+    def detect_local_ground(self) -> Optional[GroundGrid]:
+        """
+        Detect the ground as one plane per XY cell, following hills and banked roads
+        
+        Returns:
+            GroundGrid of the local ground surface
+        """
+        if self.point_data is None:
+            logger.error("No point cloud set")
+            return None
+        
+        try:
+            self.ground_grid = fit_ground_grid(self.point_data.points, self.detection_params['ground_cell_size'])
+            self.ground_plane = None
+            logger.info(f"Local ground fitted in {len(self.ground_grid.keys)} cells "
+                        f"of {self.ground_grid.cell_size} m")
+            return self.ground_grid
+            
+        except Exception as e:
+            logger.error(f"Error detecting local ground: {e}")
+            return None
+    
+    def detect_ground(self):
+        """Detect the ground with the method chosen in detection_params['ground_method']"""
+        method = self.detection_params['ground_method']
+        if method == 'grid':
+            return self.detect_local_ground()
+        if method != 'plane':
+            raise ValueError(f"Unknown ground method: {method}")
+        return self.detect_ground_plane()
+    
     def filter_by_height(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Filter points by height above ground plane
+        Filter points by height above the local ground surface or the ground plane
         
         Args:
             points: Point array (N, 3)
@@ -87,6 +177,10 @@ class DynamicObjectDetector:
         Returns:
             Tuple of (above_ground_indices, ground_indices)
         """
+        if self.ground_grid is not None:
+            above_ground = self.ground_grid.height(points) > self.detection_params['height_threshold']
+            return np.where(above_ground)[0], np.where(~above_ground)[0]
+        
         if self.ground_plane is None:
             logger.warning("No ground plane detected, using Z-coordinate")
             # Use simple Z-threshold if no ground plane
@@ -106,7 +200,7 @@ class DynamicObjectDetector:
     
     def cluster_points(self, points: np.ndarray, indices: np.ndarray) -> List[np.ndarray]:
         """
-        Cluster points using optimized DBSCAN for large datasets
+        Cluster points with DBSCAN (sampled for large datasets) or voxel connected components
         
         Args:
             points: Point array
@@ -122,8 +216,22 @@ class DynamicObjectDetector:
         
         logger.info(f"Clustering {len(cluster_points)} points...")
         
+        method = self.detection_params['cluster_method']
+        if method not in ('dbscan', 'voxel'):
+            raise ValueError(f"Unknown clustering method: {method}")
+        
+        if method == 'voxel':
+            # Linear-time alternative to DBSCAN: no sampling needed on large datasets
+            labels = voxel_connected_components(
+                cluster_points,
+                self.detection_params['cluster_eps'],
+                self.detection_params['voxel_min_points'],
+                self._weights_of(indices)
+            )
+            clusters = self._clusters_from_labels(indices, labels)
+            
         # For large datasets, use optimized approach
-        if len(cluster_points) > 30000:
+        elif len(cluster_points) > 30000:
             logger.info("Large dataset detected, using optimized clustering...")
             
             # Sample points for faster clustering
@@ -138,51 +246,176 @@ class DynamicObjectDetector:
             clustering = DBSCAN(
                 eps=self.detection_params['cluster_eps'],
                 min_samples=max(5, self.detection_params['cluster_min_samples'] // 2)
-            ).fit(sample_points)
+            ).fit(sample_points, sample_weight=self._weights_of(indices[sample_indices]))
             
-            # Find cluster centers and assign all points
-            clusters = []
-            unique_labels = np.unique(clustering.labels_)
+            # Every point takes the label of its nearest labelled sample within eps,
+            # so clusters stay disjoint and keep the shape the sample traced
+            labelled = clustering.labels_ >= 0
+            tree = cKDTree(sample_points[labelled])
+            distances, nearest = tree.query(
+                cluster_points, k=1,
+                distance_upper_bound=self.detection_params['cluster_eps'],
+                workers=-1
+            )
+            labels = np.full(len(cluster_points), -1)
+            found = np.isfinite(distances)
+            labels[found] = clustering.labels_[labelled][nearest[found]]
             
-            for label in unique_labels:
-                if label == -1:  # Noise points
-                    continue
-                
-                # Get cluster center
-                cluster_mask = clustering.labels_ == label
-                cluster_sample_points = sample_points[cluster_mask]
-                cluster_center = np.mean(cluster_sample_points, axis=0)
-                
-                # Find all points within cluster radius of center
-                distances = np.linalg.norm(cluster_points - cluster_center, axis=1)
-                cluster_radius = self.detection_params['cluster_eps'] * 1.5
-                within_cluster = distances <= cluster_radius
-                
-                if np.sum(within_cluster) >= self.detection_params['cluster_min_samples']:
-                    cluster_indices = indices[within_cluster]
-                    clusters.append(cluster_indices)
+            clusters = self._clusters_from_labels(indices, labels)
             
         else:
             # Standard DBSCAN for smaller datasets
             clustering = DBSCAN(
                 eps=self.detection_params['cluster_eps'],
                 min_samples=self.detection_params['cluster_min_samples']
-            ).fit(cluster_points)
+            ).fit(cluster_points, sample_weight=self._weights_of(indices))
             
-            clusters = []
-            unique_labels = np.unique(clustering.labels_)
+            clusters = self._clusters_from_labels(indices, clustering.labels_)
+        
+        logger.info(f"Found {len(clusters)} clusters from {len(indices)} points")
+        return clusters
+    
+    def cluster_points_tiled(self, points: np.ndarray, indices: np.ndarray) -> List[np.ndarray]:
+        """
+        Cluster points tile by tile in a process pool and stitch clusters across tile borders
+        
+        The XY plane is cut into tiles of detection_params['tile_size'] on the
+        eps grid, each grown by TILE_MARGIN_CELLS cells on every side. Workers
+        read the points from shared memory and cluster their tile with full
+        DBSCAN or voxel components. A point in the overlap that is linked
+        (a DBSCAN core point, or a point of a dense voxel) both in its own
+        tile and in a neighbour joins the two tile clusters with union-find;
+        every point keeps the label of the tile that owns it. The result is the
+        untiled clustering of the same method, without the sampling the
+        untiled DBSCAN falls back to on large inputs.
+        
+        Only this clustering step is tiled: detect_dynamic_objects still fits
+        the ground, filters by height and classifies clusters in one pass over
+        the whole cloud.
+        
+        Args:
+            points: Point array
+            indices: Indices of points to cluster
             
-            for label in unique_labels:
-                if label == -1:  # Noise points
-                    continue
-                
-                cluster_mask = clustering.labels_ == label
-                cluster_indices = indices[cluster_mask]
-                clusters.append(cluster_indices)
+        Returns:
+            List of cluster indices
+        """
+        if len(indices) == 0:
+            return []
         
+        params = self.detection_params
+        if params['cluster_method'] not in ('dbscan', 'voxel'):
+            raise ValueError(f"Unknown clustering method: {params['cluster_method']}")
+        eps = params['cluster_eps']
+        # Margins only reach into the eight neighbouring tiles, so a tile is never narrower than its margin
+        tile_cells = max(int(round(params['tile_size'] / eps)), TILE_MARGIN_CELLS)
+        
+        # Tiles are whole eps cells of the grid the untiled voxel clustering uses,
+        # so voxels are never split between tiles
+        cluster_points = points[indices]
+        origin = cluster_points.min(axis=0) - eps
+        tiles = np.floor((cluster_points[:, :2] - origin[:2]) / eps).astype(np.int64) // tile_cells
+        
+        # Sort by tile so every tile owns a contiguous run of rows
+        tile_keys = tiles[:, 0] * (tiles[:, 1].max() + 1) + tiles[:, 1]
+        order = np.argsort(tile_keys, kind='stable')
+        indices, cluster_points, tiles = indices[order], cluster_points[order], tiles[order]
+        _, starts, counts = np.unique(tile_keys[order], return_index=True, return_counts=True)
+        tile_ids = [tuple(tiles[start]) for start in starts]
+        runs = {tile: (start, start + count) for tile, start, count in zip(tile_ids, starts, counts)}
+        del tiles, tile_keys, order
+        
+        jobs = []
+        for tx, ty in tile_ids:
+            neighbours = [runs[(tx + dx, ty + dy)] for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                          if (tx + dx, ty + dy) in runs]
+            lo = np.array([tx, ty]) * tile_cells - TILE_MARGIN_CELLS
+            hi = np.array([tx + 1, ty + 1]) * tile_cells + TILE_MARGIN_CELLS
+            jobs.append((neighbours, lo, hi))
+        
+        weights = self._weights_of(indices)
+        arrays = [cluster_points] + ([weights] if weights is not None else [])
+        shared = [SharedMemory(create=True, size=max(array.nbytes, 1)) for array in arrays]
+        executor = None
+        try:
+            for shm, array in zip(shared, arrays):
+                np.ndarray(array.shape, array.dtype, buffer=shm.buf)[:] = array
+            buffers = [(shm.name, array.shape, array.dtype.str) for shm, array in zip(shared, arrays)]
+            tile_args = ([buffers] * len(jobs), *zip(*jobs), [origin] * len(jobs), [params] * len(jobs))
+            
+            workers = min(params['max_workers'] or os.cpu_count() or 1, len(jobs))
+            logger.info(f"Clustering {len(indices)} points in {len(jobs)} tiles on {workers} processes...")
+            if workers > 1:
+                # Spawned workers: forking a process that runs GUI and Open3D threads is not safe
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                results = list(executor.map(cluster_tile, *tile_args))
+            else:
+                results = list(map(cluster_tile, *tile_args))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            for shm in shared:
+                shm.close()
+                shm.unlink()
+        
+        # Label ids are made global by offsetting each tile's labels
+        offsets = np.cumsum([0] + [labels.max() + 1 if len(labels) else 0 for _, labels, _ in results])
+        owner_of_row = np.repeat(np.arange(len(jobs)), counts)
+        owner_labels = np.full(len(indices), -1, dtype=np.int64)
+        owner_linked = np.zeros(len(indices), dtype=bool)
+        owned = []
+        for tile, (rows, labels, linked) in enumerate(results):
+            own = owner_of_row[rows] == tile
+            owner_labels[rows[own]] = np.where(labels[own] >= 0, labels[own] + offsets[tile], -1)
+            owner_linked[rows[own]] = linked[own]
+            owned.append(own)
+        
+        edges_a, edges_b = [], []
+        for tile, ((rows, labels, linked), own) in enumerate(zip(results, owned)):
+            overlap = ~own & linked
+            overlap[overlap] = owner_linked[rows[overlap]]
+            edges_a.append(labels[overlap] + offsets[tile])
+            edges_b.append(owner_labels[rows[overlap]])
+        
+        if offsets[-1] == 0:
+            logger.info(f"Found 0 clusters from {len(indices)} points")
+            return []
+        components = connected_components(offsets[-1], np.concatenate(edges_a), np.concatenate(edges_b))
+        labels = np.where(owner_labels >= 0, components[np.maximum(owner_labels, 0)], -1)
+        
+        clusters = self._clusters_from_labels(indices, labels)
         logger.info(f"Found {len(clusters)} clusters from {len(indices)} points")
         return clusters
     
+    def _clusters_from_labels(self, indices: np.ndarray, labels: np.ndarray) -> List[np.ndarray]:
+        """
+        Group points by cluster label, dropping noise and clusters with too little support
+        
+        Args:
+            indices: Indices of the labelled points
+            labels: Cluster label of each point, -1 for noise
+            
+        Returns:
+            List of cluster indices
+        """
+        keep = labels >= 0
+        indices, labels = indices[keep], labels[keep]
+        if len(labels) == 0:
+            return []
+        
+        order = np.argsort(labels, kind='stable')
+        unique_labels, starts = np.unique(labels[order], return_index=True)
+        weights = self._weights_of(indices)
+        support = np.bincount(labels, weights=weights)[unique_labels]
+        
+        groups = np.split(indices[order], starts[1:])
+        min_samples = self.detection_params['cluster_min_samples']
+        return [group for group, count in zip(groups, support) if count >= min_samples]
+    
+    def _weights_of(self, indices: np.ndarray) -> Optional[np.ndarray]:
+        """DBSCAN sample weights of some points, or None when every point counts once"""
+        return self.weights[indices] if self.weights is not None else None
+    
     def analyze_cluster_geometry(self, points: np.ndarray, cluster_indices: np.ndarray) -> Dict:
         """
         Analyze geometric properties of a cluster
@@ -205,8 +438,9 @@ class DynamicObjectDetector:
         center = (min_bound + max_bound) / 2
         volume = np.prod(dimensions)
         
-        # Calculate point density
-        density = len(cluster_points) / max(volume, 1e-6)
+        # Calculate point density, counting the duplicates each point replaced
+        weighted_points = float(self.weights[cluster_indices].sum()) if self.weights is not None else len(cluster_points)
+        density = weighted_points / max(volume, 1e-6)
         
         # Check if dimensions match typical vehicles
         height, width, length = sorted(dimensions)
@@ -217,16 +451,23 @@ class DynamicObjectDetector:
             self.detection_params['vehicle_length_range'][0] <= length <= self.detection_params['vehicle_length_range'][1]
         )
         
-        return {
+        geometry = {
             'center': center,
             'dimensions': dimensions,
             'volume': volume,
             'density': density,
             'num_points': len(cluster_points),
+            'weighted_points': weighted_points,
             'vehicle_like': vehicle_like,
             'min_bound': min_bound,
             'max_bound': max_bound
         }
+        
+        # Summaries of extra fields, e.g. mean_intensity
+        for name, values in self.attributes.items():
+            geometry[f'mean_{name}'] = float(np.mean(values[cluster_indices]))
+        
+        return geometry
     
     def classify_clusters(self, points: np.ndarray, clusters: List[np.ndarray]) -> Tuple[List[np.ndarray], List[np.ndarray]]:
         """
@@ -279,29 +520,37 @@ class DynamicObjectDetector:
         """
         Main method to detect dynamic objects
         
+        With detection_params['tile_size'] set, clustering runs in parallel XY
+        tiles (see cluster_points_tiled). Ground fitting, the height filter and
+        cluster classification are not tiled and see the whole cloud at once.
+        
         Args:
             method: Detection method ("geometric", "statistical", "hybrid")
             
         Returns:
             DetectionResult object
         """
-        if self.point_cloud is None:
+        if self.point_data is None:
             raise ValueError("No point cloud set")
         
-        points = np.asarray(self.point_cloud.points)
+        # World coordinates are only expanded to float64 for the detection pass
+        points = self.point_data.points
         
         logger.info(f"Starting dynamic object detection with method: {method}")
         logger.info(f"Processing {len(points)} points")
         
-        # Step 1: Detect ground plane
-        self.detect_ground_plane()
+        # Step 1: Detect ground
+        self.detect_ground()
         
         # Step 2: Filter points by height
         above_ground_indices, ground_indices = self.filter_by_height(points)
         logger.info(f"Found {len(above_ground_indices)} points above ground")
         
         # Step 3: Cluster above-ground points
-        clusters = self.cluster_points(points, above_ground_indices)
+        if self.detection_params['tile_size']:
+            clusters = self.cluster_points_tiled(points, above_ground_indices)
+        else:
+            clusters = self.cluster_points(points, above_ground_indices)
         
         # Step 4: Classify clusters
         dynamic_clusters, static_clusters = self.classify_clusters(points, clusters)
@@ -344,6 +593,53 @@ class DynamicObjectDetector:
         return result
 
 
+def cluster_tile(buffers: List[Tuple[str, Tuple[int, ...], str]], neighbours: List[Tuple[int, int]],
+                 lo: np.ndarray, hi: np.ndarray, origin: np.ndarray,
+                 params: Dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cluster the points of one overlapping tile (process pool worker)
+    
+    Args:
+        buffers: (shared memory name, shape, dtype) of the tile-sorted points
+            and, if any, of their weights
+        neighbours: Row ranges of the tile and of the tiles around it
+        lo: First eps cell (x, y) of the tile including its margin
+        hi: Cell past the last one of the tile including its margin
+        origin: Origin of the eps grid
+        params: Detection parameters
+        
+    Returns:
+        Tuple of (rows of the tile's points, cluster label per row with -1
+        for noise, mask of rows that may link clusters across tiles)
+    """
+    eps = params['cluster_eps']
+    rows = np.concatenate([np.arange(start, stop) for start, stop in neighbours])
+    arrays = []
+    for name, shape, dtype in buffers:
+        shm = SharedMemory(name=name)
+        try:
+            # Fancy indexing copies the rows out, so the mapping can be closed right away
+            arrays.append(np.ndarray(shape, dtype, buffer=shm.buf)[rows])
+        finally:
+            shm.close()
+    points = arrays[0]
+    weights = arrays[1] if len(arrays) > 1 else None
+    
+    cells = np.floor((points[:, :2] - origin[:2]) / eps).astype(np.int64)
+    inside = np.all((cells >= lo) & (cells < hi), axis=1)
+    rows, points = rows[inside], points[inside]
+    weights = weights[inside] if weights is not None else None
+    
+    if params['cluster_method'] == 'voxel':
+        labels = voxel_connected_components(points, eps, params['voxel_min_points'], weights, origin)
+        return rows, labels, labels >= 0
+    
+    clustering = DBSCAN(eps=eps, min_samples=params['cluster_min_samples']).fit(points, sample_weight=weights)
+    core = np.zeros(len(rows), dtype=bool)
+    core[clustering.core_sample_indices_] = True
+    return rows, clustering.labels_, core
+
+
 def test_detector():
     """Test the dynamic object detector"""
     from point_cloud_loader import PointCloudLoader
@@ -351,7 +647,7 @@ def test_detector():
     loader = PointCloudLoader()
     if loader.load_pcd("data/points.pcd"):
         detector = DynamicObjectDetector()
-        detector.set_point_cloud(loader.get_point_cloud())
+        detector.set_point_cloud(loader.get_point_data())
         
         result = detector.detect_dynamic_objects()
         print(f"Detection result: {len(result.dynamic_indices)} dynamic points")
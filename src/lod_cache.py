@@ -0,0 +1,285 @@
+"""
+Level-of-Detail Cache Module
+Persists multi-resolution previews of point cloud files in sidecar directories
+"""
+
+import hashlib
+import json
+import logging
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Any
+
+import numpy as np
+
+from point_cloud_data import PointCloudData
+from utils import voxel_downsample_arrays
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CACHE_DIR_NAME = ".lidar_cache"
+MANIFEST_NAME = "manifest.json"
+# Sidecar file of the block index of a map, stored next to its entries
+BLOCK_INDEX_SUFFIX = ".blocks.npz"
+# Hex digest of file_cache_key(), the suffix of every entry directory
+KEY_PATTERN = r"[0-9a-f]{32}"
+# Seconds within which repeated lookups of an entry share one recorded access
+ACCESS_RESOLUTION = 60.0
+
+
+def file_cache_key(file_path: str, sample_blocks: int = 16, block_size: int = 64 * 1024) -> str:
+    """
+    Compute a cache key from file size, modification time and sampled content
+
+    Hashing a few evenly spaced blocks instead of the whole file keeps the
+    key cheap for multi-GB maps while still catching in-place rewrites that
+    preserve size and mtime.
+
+    Args:
+        file_path: Path to the source file
+        sample_blocks: Number of blocks hashed across the file
+        block_size: Size of each hashed block in bytes
+
+    Returns:
+        Hex digest identifying this version of the file
+    """
+    stat = Path(file_path).stat()
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    with open(file_path, 'rb') as f:
+        step = max(block_size, stat.st_size // sample_blocks)
+        for offset in range(0, stat.st_size, step):
+            f.seek(offset)
+            digest.update(f.read(block_size))
+
+    return digest.hexdigest()
+
+
+class LODCache:
+    """Sidecar cache of voxel pyramids, stored in a .lidar_cache directory next to each map"""
+
+    def __init__(self, max_cache_bytes: int = 2 * 1024 ** 3, coarse_points: int = 200000,
+                 max_levels: int = 8):
+        """
+        Args:
+            max_cache_bytes: Size bound of each .lidar_cache directory
+            coarse_points: Target point count of the coarsest level
+            max_levels: Maximum number of pyramid levels
+        """
+        self.max_cache_bytes = max_cache_bytes
+        self.coarse_points = coarse_points
+        self.max_levels = max_levels
+
+    def entry_dir(self, file_path: str, key: Optional[str] = None) -> Path:
+        """Directory holding the pyramid of one version of a file"""
+        file_path = Path(file_path)
+        key = key if key is not None else file_cache_key(str(file_path))
+        return file_path.parent / CACHE_DIR_NAME / f"{file_path.name}.{key}"
+
+    def lookup(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the cached pyramid of a file
+
+        Args:
+            file_path: Path to the source file
+
+        Returns:
+            Manifest dictionary, or None if the file has no valid cache entry
+        """
+        entry = self.entry_dir(file_path)
+        manifest_path = entry / MANIFEST_NAME
+        if not manifest_path.exists():
+            return None
+
+        try:
+            manifest = json.loads(manifest_path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable LOD cache entry {entry}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        # Record the access for LRU eviction, at most once per ACCESS_RESOLUTION
+        now = time.time()
+        if now - manifest.get('last_access', 0) > ACCESS_RESOLUTION:
+            manifest['last_access'] = now
+            try:
+                manifest_path.write_text(json.dumps(manifest, indent=2))
+            except OSError as e:
+                logger.warning(f"Could not record access to LOD cache entry {entry}: {e}")
+        manifest['entry_dir'] = str(entry)
+        return manifest
+
+    def build(self, file_path: str, points: np.ndarray, colors: Optional[np.ndarray] = None,
+              finest_voxel_size: Optional[float] = None, origin: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Build and store the voxel pyramid of a file
+
+        Level 0 is the finest; every following level doubles the voxel size,
+        like the levels of an octree, until the coarse point target is reached.
+
+        Args:
+            file_path: Path to the source file
+            points: Full-resolution points (N, 3), relative to origin when given
+            colors: Optional uint8 colors (N, 3)
+            finest_voxel_size: Voxel size of level 0 (derived from the extent if None)
+            origin: Offset of points, e.g. PointCloudData.origin
+
+        Returns:
+            Manifest dictionary of the new entry
+        """
+        t0 = time.perf_counter()
+        file_path = Path(file_path)
+        key = file_cache_key(str(file_path))
+        entry = self.entry_dir(str(file_path), key)
+
+        # Older versions of the same file are never read again; other sidecars
+        # of the file (e.g. the .blocks.npz block index) are not entries
+        entry_name = re.compile(re.escape(file_path.name) + r"\." + KEY_PATTERN + r"(\.tmp)?")
+        for stale in entry.parent.glob(f"{file_path.name}.*"):
+            if stale != entry and stale.is_dir() and entry_name.fullmatch(stale.name):
+                shutil.rmtree(stale, ignore_errors=True)
+
+        tmp_entry = entry.with_name(entry.name + ".tmp")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        tmp_entry.mkdir(parents=True)
+
+        local_min = points.min(axis=0).astype(np.float64)
+        origin = local_min + (np.zeros(3) if origin is None else np.asarray(origin, dtype=np.float64))
+        if finest_voxel_size is None:
+            # Roughly one voxel per 8 points over the XY footprint
+            extent = np.maximum(points.max(axis=0) - local_min, 1e-6)
+            finest_voxel_size = float(np.sqrt(extent[0] * extent[1] * 8.0 / max(len(points), 1)))
+            finest_voxel_size = max(finest_voxel_size, 0.01)
+
+        levels = []
+        level_points, level_colors = points, colors
+        voxel_size = finest_voxel_size
+        for level in range(self.max_levels):
+            # Coarser levels are built from the previous level, not from the full cloud
+            level_points, level_colors = voxel_downsample_arrays(level_points, voxel_size, level_colors)
+
+            np.save(tmp_entry / f"level_{level}_points.npy", (level_points - local_min).astype(np.float32))
+            if level_colors is not None:
+                np.save(tmp_entry / f"level_{level}_colors.npy",
+                        np.clip(np.round(level_colors), 0, 255).astype(np.uint8))
+            levels.append({
+                'level': level,
+                'voxel_size': voxel_size,
+                'num_points': int(len(level_points)),
+                'has_colors': level_colors is not None
+            })
+
+            if len(level_points) <= self.coarse_points:
+                break
+            voxel_size *= 2.0
+
+        manifest = {
+            'source': str(file_path),
+            'key': key,
+            'original_num_points': int(len(points)),
+            'origin': origin.tolist(),
+            'levels': levels,
+            'created': time.time(),
+            'last_access': time.time()
+        }
+        (tmp_entry / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp_entry.rename(entry)
+        manifest['entry_dir'] = str(entry)
+
+        logger.info(f"Built {len(levels)} LOD levels for {file_path.name} in {time.perf_counter()-t0:.3f}s: "
+                    f"{[lvl['num_points'] for lvl in levels]}")
+        self.evict(entry.parent, keep=entry)
+        return manifest
+
+    def load_level(self, manifest: Dict[str, Any], level: int,
+                   bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> PointCloudData:
+        """
+        Read one pyramid level, optionally only the part inside a box
+
+        Level arrays are memory-mapped, so cropping a fine level to a region
+        only pages in what is needed for the crop.
+
+        Args:
+            manifest: Manifest returned by lookup() or build()
+            level: Level index (0 is the finest)
+            bbox: Optional (min_bound, max_bound) in world coordinates
+
+        Returns:
+            PointCloudData in the float32 frame of the pyramid
+        """
+        entry = Path(manifest['entry_dir'])
+        origin = np.asarray(manifest['origin'])
+        points = np.load(entry / f"level_{level}_points.npy", mmap_mode='r')
+        colors_path = entry / f"level_{level}_colors.npy"
+        colors = np.load(colors_path, mmap_mode='r') if colors_path.exists() else None
+
+        if bbox is not None:
+            local_min = (np.asarray(bbox[0]) - origin).astype(np.float32)
+            local_max = (np.asarray(bbox[1]) - origin).astype(np.float32)
+            inside = np.all((points >= local_min) & (points <= local_max), axis=1)
+            points = points[inside]
+            colors = colors[inside] if colors is not None else None
+
+        # The stored arrays already are the container layout, so no conversion is needed
+        return PointCloudData(np.array(points), origin, np.array(colors) if colors is not None else None)
+
+    def pick_level(self, manifest: Dict[str, Any], max_points: int) -> int:
+        """Finest level with at most max_points points (the coarsest level if none fits)"""
+        for entry in manifest['levels']:
+            if entry['num_points'] <= max_points:
+                return entry['level']
+        return manifest['levels'][-1]['level']
+
+    def evict(self, cache_dir: Path, keep: Optional[Path] = None):
+        """
+        Delete least recently used entries until the cache directory fits the size bound
+
+        Block index sidecars count towards the bound too; their last use is
+        the time they were written.
+
+        Args:
+            cache_dir: A .lidar_cache directory
+            keep: Entry that must survive (e.g. the one just built)
+        """
+        entries = []
+        for entry in Path(cache_dir).iterdir():
+            if entry == keep:
+                continue
+            manifest_path = entry / MANIFEST_NAME
+            if entry.is_dir() and manifest_path.exists():
+                try:
+                    last_access = json.loads(manifest_path.read_text()).get('last_access', 0)
+                except (OSError, ValueError):
+                    last_access = 0
+            elif entry.is_file() and entry.name.endswith(BLOCK_INDEX_SUFFIX):
+                last_access = entry.stat().st_mtime
+            else:
+                continue
+            entries.append((last_access, entry_size(entry), entry))
+
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and keep.exists():
+            total += entry_size(keep)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_cache_bytes:
+                break
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Evicted LOD cache entry {entry.name} ({size / (1024*1024):.1f} MB)")
+
+
+def entry_size(entry: Path) -> int:
+    """Bytes held by a cache entry directory or sidecar file"""
+    if entry.is_dir():
+        return sum(f.stat().st_size for f in entry.iterdir())
+    return entry.stat().st_size
@@ -50,13 +50,54 @@ class LoaderWorker(QThread):
     def run(self):
         try:
             self.progress_updated.emit(20)
-            success = self.loader.load_pcd(self.file_path, downsample_for_preview=self.downsample)
+            if Path(self.file_path).is_dir():
+                success = self.loader.load_directory(self.file_path, downsample_for_preview=self.downsample)
+            else:
+                success = self.loader.load_pcd(self.file_path, downsample_for_preview=self.downsample,
+                                               use_lod_cache=self.downsample)
+            if success:
+                # Mapped files are only decoded on first access; do it off the GUI thread
+                self.progress_updated.emit(50)
+                self.loader.get_point_data()
             self.progress_updated.emit(100)
             self.loading_completed.emit(success)
         except Exception as e:
             self.error_occurred.emit(str(e))
 
 
+class SaverWorker(QThread):
+    """Worker thread for saving PCD files"""
+    
+    progress_updated = pyqtSignal(int)
+    saving_completed = pyqtSignal(bool)  # success
+    error_occurred = pyqtSignal(str)
+    
+    def __init__(self, loader: PointCloudLoader, file_path: str, point_cloud=None,
+                 exclude_preview_indices: Optional[np.ndarray] = None, precision: str = 'float32'):
+        super().__init__()
+        self.loader = loader
+        self.file_path = file_path
+        self.point_cloud = point_cloud
+        self.exclude_preview_indices = exclude_preview_indices
+        self.precision = precision
+    
+    def run(self):
+        try:
+            self.progress_updated.emit(5)
+            point_cloud = self.point_cloud
+            if self.exclude_preview_indices is not None:
+                # Carrying deletions over to every original point is part of the work
+                point_cloud = self.loader.get_full_resolution_cloud(self.exclude_preview_indices)
+            self.progress_updated.emit(20)
+            success = self.loader.save_pcd(
+                self.file_path, point_cloud, precision=self.precision,
+                progress=lambda fraction: self.progress_updated.emit(20 + int(80 * fraction)))
+            self.progress_updated.emit(100)
+            self.saving_completed.emit(success)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+
 class DetectionWorker(QThread):
     """Worker thread for running detection algorithms"""
     
@@ -76,8 +117,7 @@ class DetectionWorker(QThread):
             self.status_updated.emit("Инициализация...")
             
             # Check if we have too many points
-            points = np.asarray(self.detector.point_cloud.points)
-            self.status_updated.emit(f"Обработка {len(points):,} точек...")
+            self.status_updated.emit(f"Обработка {len(self.detector.point_data):,} точек...")
             
             self.progress_updated.emit(10)
             self.status_updated.emit("Обнаружение плоскости земли...")
@@ -121,6 +161,12 @@ class ParameterPanel(QWidget):
         ground_group = QGroupBox("Обнаружение земли")
         ground_layout = QVBoxLayout()
         
+        self.ground_method = QComboBox()
+        self.ground_method.addItem("Одна плоскость", 'plane')
+        self.ground_method.addItem("Локальная сетка", 'grid')
+        ground_layout.addWidget(QLabel("Модель земли:"))
+        ground_layout.addWidget(self.ground_method)
+        
         self.height_threshold = QDoubleSpinBox()
         self.height_threshold.setRange(0.1, 2.0)
         self.height_threshold.setValue(0.2)
@@ -136,6 +182,12 @@ class ParameterPanel(QWidget):
         cluster_group = QGroupBox("Кластеризация")
         cluster_layout = QVBoxLayout()
         
+        self.cluster_method = QComboBox()
+        self.cluster_method.addItem("DBSCAN", 'dbscan')
+        self.cluster_method.addItem("Воксельные компоненты", 'voxel')
+        cluster_layout.addWidget(QLabel("Метод кластеризации:"))
+        cluster_layout.addWidget(self.cluster_method)
+        
         self.cluster_eps = QDoubleSpinBox()
         self.cluster_eps.setRange(0.1, 2.0)
         self.cluster_eps.setValue(0.5)
@@ -186,8 +238,10 @@ class ParameterPanel(QWidget):
         """Emit current parameters"""
         params = {
             'height_threshold': self.height_threshold.value(),
+            'ground_method': self.ground_method.currentData(),
             'cluster_eps': self.cluster_eps.value(),
             'cluster_min_samples': self.min_samples.value(),
+            'cluster_method': self.cluster_method.currentData(),
             'vehicle_height_range': (self.vehicle_height_min.value(), self.vehicle_height_max.value()),
         }
         self.parameters_changed.emit(params)
@@ -196,8 +250,10 @@ class ParameterPanel(QWidget):
         """Get current parameters as dictionary"""
         return {
             'height_threshold': self.height_threshold.value(),
+            'ground_method': self.ground_method.currentData(),
             'cluster_eps': self.cluster_eps.value(),
             'cluster_min_samples': self.min_samples.value(),
+            'cluster_method': self.cluster_method.currentData(),
             'vehicle_height_range': (self.vehicle_height_min.value(), self.vehicle_height_max.value()),
         }
 
@@ -311,6 +367,7 @@ class MainWindow(QMainWindow):
         self.detection_result = None
         self.detection_worker = None
         self.loader_worker = None
+        self.saver_worker = None
         self.current_file_path = None
         
         # UI components
@@ -492,6 +549,11 @@ class MainWindow(QMainWindow):
         load_action.triggered.connect(self.load_file)
         file_menu.addAction(load_action)
         
+        load_dir_action = QAction('Загрузить папку тайлов...', self)
+        load_dir_action.setShortcut('Ctrl+Shift+O')
+        load_dir_action.triggered.connect(self.load_directory)
+        file_menu.addAction(load_dir_action)
+        
         save_action = QAction('Сохранить PCD...', self)
         save_action.setShortcut('Ctrl+S')
         save_action.triggered.connect(self.save_file)
@@ -574,6 +636,13 @@ class MainWindow(QMainWindow):
         if file_path:
             self._start_loading(file_path, downsample)
     
+    def load_directory(self):
+        """Load a directory of PCD tiles as one cloud"""
+        directory = QFileDialog.getExistingDirectory(self, "Загрузить папку тайлов")
+        
+        if directory:
+            self._start_loading(directory, downsample=True)
+    
     def load_full_file(self):
         """Load full PCD file without downsampling"""
         if self.current_file_path:
@@ -621,7 +690,11 @@ class MainWindow(QMainWindow):
         if success:
             info = self.loader.get_info()
             self.statistics_panel.update_file_info(info)
-            self.detector.set_point_cloud(self.loader.get_point_cloud())
+            
+            # Extra fields only line up with the points at full resolution
+            attributes = {} if info.get('is_downsampled', False) else \
+                self.loader.get_columns(self.detector.detection_params['attribute_columns'])
+            self.detector.set_point_cloud(self.loader.get_point_data(), attributes)
             
             # Show loading info
             if info.get('is_downsampled', False):
@@ -643,7 +716,7 @@ class MainWindow(QMainWindow):
     
     def save_file(self):
         """Save the current point cloud"""
-        if self.loader.get_point_cloud() is None:
+        if self.loader.get_point_data() is None:
             QMessageBox.warning(self, "Предупреждение", "Нет данных для сохранения")
             return
         
@@ -652,22 +725,62 @@ class MainWindow(QMainWindow):
         )
         
         if file_path:
+            if self.saver_worker and self.saver_worker.isRunning():
+                QMessageBox.information(self, "Информация", "Сохранение уже выполняется")
+                return
+            
             self.statusBar().showMessage("Сохранение файла...")
             
             # Get current point cloud (may be modified)
-            current_pc = self.visualizer.get_current_point_cloud() if self.visualizer else self.loader.get_point_cloud()
+            current_pc = self.visualizer.get_current_point_data() if self.visualizer else self.loader.get_point_data()
+            exclude_preview_indices = None
             
-            success = self.loader.save_pcd(file_path, current_pc)
+            # Points deleted in the 3D view are preview rows; pasted points have no original behind them
+            deleted = self.visualizer.get_deleted_indices() if self.visualizer else np.array([], dtype=np.int64)
+            deleted = deleted[deleted < len(self.loader.get_point_data())]
             
-            if success:
-                self.statusBar().showMessage("Файл сохранен")
-            else:
-                QMessageBox.critical(self, "Ошибка", "Не удалось сохранить файл")
-                self.statusBar().showMessage("Ошибка сохранения")
+            # Tile directories are reduced per tile and keep no full-resolution copy
+            has_original = 'tiles' not in self.loader.metadata
+            if self.loader.is_downsampled() and has_original and (self.detection_result is not None or len(deleted) > 0):
+                # Detection and deletions were made on the preview; carry them over to every original point
+                answer = QMessageBox.question(
+                    self, "Сохранение",
+                    "Сохранить полную карту (без сжатия) с удалёнными динамическими объектами и точками?",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                )
+                if answer == QMessageBox.StandardButton.Yes:
+                    dynamic = self.detection_result.dynamic_indices if self.detection_result is not None else deleted[:0]
+                    exclude_preview_indices = np.union1d(dynamic, deleted).astype(np.int64)
+            
+            self.progress_bar.setVisible(True)
+            self.progress_bar.setRange(0, 100)
+            
+            # Write in a worker thread so large maps do not freeze the window
+            self.saver_worker = SaverWorker(self.loader, file_path, current_pc, exclude_preview_indices)
+            self.saver_worker.progress_updated.connect(self.progress_bar.setValue)
+            self.saver_worker.saving_completed.connect(self.on_file_saved)
+            self.saver_worker.error_occurred.connect(self.on_saving_error)
+            self.saver_worker.start()
+    
+    def on_file_saved(self, success: bool):
+        """Handle file saving completion"""
+        self.progress_bar.setVisible(False)
+        
+        if success:
+            self.statusBar().showMessage("Файл сохранен")
+        else:
+            QMessageBox.critical(self, "Ошибка", "Не удалось сохранить файл")
+            self.statusBar().showMessage("Ошибка сохранения")
+    
+    def on_saving_error(self, error_msg: str):
+        """Handle saving error"""
+        self.progress_bar.setVisible(False)
+        QMessageBox.critical(self, "Ошибка сохранения", error_msg)
+        self.statusBar().showMessage("Ошибка сохранения")
     
     def run_detection(self):
         """Run dynamic object detection"""
-        if self.loader.get_point_cloud() is None:
+        if self.loader.get_point_data() is None:
             QMessageBox.warning(self, "Предупреждение", "Сначала загрузите PCD файл")
             return
         
@@ -730,7 +843,7 @@ class MainWindow(QMainWindow):
     
     def open_visualizer(self):
         """Open the 3D visualizer"""
-        if self.loader.get_point_cloud() is None:
+        if self.loader.get_point_data() is None:
             QMessageBox.warning(self, "Предупреждение", "Сначала загрузите PCD файл")
             return
         
@@ -744,7 +857,7 @@ class MainWindow(QMainWindow):
         # Initialize and run visualizer in separate thread
         def run_visualizer():
             if self.visualizer.initialize("LIDAR Editor - 3D View"):
-                self.visualizer.set_point_cloud(self.loader.get_point_cloud())
+                self.visualizer.set_point_cloud(self.loader.get_point_data())
                 
                 # Apply detection results if available
                 if self.detection_result:
@@ -809,6 +922,10 @@ class MainWindow(QMainWindow):
             self.loader_worker.terminate()
             self.loader_worker.wait()
         
+        if self.saver_worker and self.saver_worker.isRunning():
+            # Finish the save the user asked for instead of discarding it
+            self.saver_worker.wait()
+        
         event.accept()
 
 
@@ -0,0 +1,399 @@
+"""
+Map Catalog Module
+SQLite index of map files with an R-tree over their bounds for spatial lookup
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from point_cloud_loader import PointCloudLoader, load_block_index, read_pcd_header
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    data_format TEXT,
+    fields TEXT,
+    num_points INTEGER,
+    min_x REAL, min_y REAL, min_z REAL,
+    max_x REAL, max_y REAL, max_z REAL,
+    histogram BLOB,
+    histogram_bins INTEGER,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_rtree USING rtree(
+    id, min_x, max_x, min_y, max_y, min_z, max_z
+);
+"""
+
+# Rows are committed in batches so an interrupted run keeps most of its work
+COMMIT_EVERY = 256
+
+# INSERT ... ON CONFLICT DO UPDATE needs SQLite 3.24; row ids are read back with
+# a SELECT instead of RETURNING, which would need 3.35
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+
+def describe_file(file_path: str, histogram_bins: int = 0) -> Dict[str, Any]:
+    """
+    Collect the catalogue entry of one PCD file
+
+    Bounds come from the file's block index, which is built (and kept in the
+    .lidar_cache sidecar for later bbox loads) if it does not exist yet. The
+    optional histogram counts points on a bins x bins XY grid over the
+    bounds and costs one more pass over the file.
+
+    Args:
+        file_path: Path to PCD file
+        histogram_bins: Size of the XY histogram (0 for none)
+
+    Returns:
+        Dictionary with the columns of the files table
+    """
+    path = Path(file_path)
+    stat = path.stat()
+    header = read_pcd_header(str(path))
+    entry = {
+        'path': str(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'data_format': header.data_format,
+        'fields': json.dumps(header.fields),
+        'num_points': header.points,
+        'min': None,
+        'max': None,
+        'histogram': None,
+        'histogram_bins': None
+    }
+    if header.points == 0:
+        return entry
+
+    index = load_block_index(str(path), header)
+    min_bound = np.nanmin(index['min'], axis=0)
+    max_bound = np.nanmax(index['max'], axis=0)
+    if not (np.all(np.isfinite(min_bound)) and np.all(np.isfinite(max_bound))):
+        return entry
+    entry['min'], entry['max'] = min_bound.tolist(), max_bound.tolist()
+
+    if histogram_bins > 0:
+        histogram = np.zeros((histogram_bins, histogram_bins), dtype=np.uint32)
+        extent = [[min_bound[0], max_bound[0]], [min_bound[1], max_bound[1]]]
+        for block in PointCloudLoader().iter_chunks(str(path)):
+            finite = np.isfinite(block['x']) & np.isfinite(block['y'])
+            counts, _, _ = np.histogram2d(block['x'][finite], block['y'][finite],
+                                          bins=histogram_bins, range=extent)
+            histogram += counts.astype(np.uint32)
+        entry['histogram'] = histogram.tobytes()
+        entry['histogram_bins'] = histogram_bins
+    return entry
+
+
+class MapCatalog:
+    """
+    Catalogue of map files in a local SQLite database
+
+    Each file has a row with its path, header info, point count, bounds,
+    mtime and an optional coarse XY histogram, and its bounds in an R-tree,
+    so the files covering an area are found without opening any of them.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite database file (created if missing)
+
+        Raises:
+            RuntimeError: If the SQLite library is older than MIN_SQLITE_VERSION
+        """
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise RuntimeError(f"The map catalogue needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} "
+                               f"or newer, found {sqlite3.sqlite_version}")
+        self.db_path = str(db_path)
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def index_directory(self, directory: str, pattern: str = "*.pcd", recursive: bool = True,
+                        **kwargs) -> Dict[str, int]:
+        """
+        Bring the catalogue of a directory up to date
+
+        Files no longer on disk are dropped from the catalogue.
+
+        Args:
+            directory: Directory to scan
+            pattern: Glob pattern for file names
+            recursive: Whether to descend into subdirectories
+            **kwargs: Passed on to index_files()
+
+        Returns:
+            Counts of added, updated, unchanged, removed and failed files
+        """
+        directory = Path(directory).resolve()
+        paths = directory.rglob(pattern) if recursive else directory.glob(pattern)
+        paths = sorted(str(p) for p in paths if p.is_file())
+
+        present = set(paths)
+        prefix = str(directory).rstrip('/') + '/'
+        gone = [row['path'] for row in self.connection.execute(
+                    "SELECT path FROM files WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+                if row['path'] not in present]
+        counts = self.index_files(paths, **kwargs)
+        counts['removed'] += self.remove(gone)
+        return counts
+
+    def index_files(self, paths: List[str], histogram_bins: int = 0, max_workers: int = 8,
+                    force: bool = False) -> Dict[str, int]:
+        """
+        Index files, only reading those that are new or changed
+
+        A file counts as changed when its size or mtime differs from the
+        catalogue. Files that no longer exist are dropped from the catalogue.
+        Files are read concurrently; the database is written from the
+        calling thread only.
+
+        Args:
+            paths: Files to index
+            histogram_bins: Size of the XY histogram of each file (0 for none)
+            max_workers: Number of files read concurrently
+            force: Re-read every file even if it looks unchanged
+
+        Returns:
+            Counts of added, updated, unchanged, removed and failed files
+        """
+        t0 = time.perf_counter()
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        known = {row['path']: (row['size'], row['mtime_ns'], row['histogram_bins'])
+                 for row in self.connection.execute("SELECT path, size, mtime_ns, histogram_bins FROM files")}
+
+        stale = []
+        vanished = []
+        for path in (str(Path(p).resolve()) for p in paths):
+            try:
+                stat = Path(path).stat()
+            except FileNotFoundError:
+                vanished.append(path)
+                continue
+            entry = known.get(path)
+            wants_histogram = histogram_bins > 0 and (entry is None or entry[2] != histogram_bins)
+            if not force and entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns) \
+                    and not wants_histogram:
+                counts['unchanged'] += 1
+            else:
+                stale.append(path)
+
+        def safe_describe(path):
+            try:
+                return describe_file(path, histogram_bins)
+            except Exception as e:
+                logger.warning(f"Could not index {path}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i, (path, entry) in enumerate(zip(stale, executor.map(safe_describe, stale))):
+                if entry is None:
+                    if Path(path).exists():
+                        counts['failed'] += 1
+                    else:
+                        # Deleted between the scan and the read
+                        vanished.append(path)
+                    continue
+                counts['updated' if path in known else 'added'] += 1
+                self._store(entry)
+                if (i + 1) % COMMIT_EVERY == 0:
+                    self.connection.commit()
+        self.connection.commit()
+        counts['removed'] = self.remove(vanished)
+
+        logger.info(f"Indexed {len(paths)} files in {time.perf_counter()-t0:.3f}s: {counts}")
+        return counts
+
+    def remove(self, paths: List[str]) -> int:
+        """
+        Drop files from the catalogue
+
+        Returns:
+            Number of rows removed
+        """
+        removed = 0
+        for path in paths:
+            row = self.connection.execute("SELECT id FROM files WHERE path = ?", (str(path),)).fetchone()
+            if row is None:
+                continue
+            self.connection.execute("DELETE FROM files_rtree WHERE id = ?", (row['id'],))
+            self.connection.execute("DELETE FROM files WHERE id = ?", (row['id'],))
+            removed += 1
+        self.connection.commit()
+        return removed
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """Catalogue entry of one file, or None if it is not indexed"""
+        row = self.connection.execute("SELECT * FROM files WHERE path = ?",
+                                      (str(Path(path).resolve()),)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def query(self, bbox: Tuple[np.ndarray, np.ndarray]) -> List[Dict[str, Any]]:
+        """
+        Files whose bounds intersect a box
+
+        The R-tree stores 32-bit bounds rounded outwards, so its candidates
+        are checked again against the exact bounds of the files table.
+
+        Args:
+            bbox: (min_bound, max_bound) in world coordinates
+
+        Returns:
+            Catalogue entries ordered by path
+        """
+        low = [float(v) for v in bbox[0]]
+        high = [float(v) for v in bbox[1]]
+        rows = self.connection.execute(
+            """
+            SELECT f.* FROM files_rtree r JOIN files f ON f.id = r.id
+            WHERE r.max_x >= ? AND r.min_x <= ? AND r.max_y >= ? AND r.min_y <= ?
+              AND r.max_z >= ? AND r.min_z <= ?
+              AND f.max_x >= ? AND f.min_x <= ? AND f.max_y >= ? AND f.min_y <= ?
+              AND f.max_z >= ? AND f.min_z <= ?
+            ORDER BY f.path
+            """,
+            (low[0], high[0], low[1], high[1], low[2], high[2]) * 2).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def paths_in_bbox(self, bbox: Tuple[np.ndarray, np.ndarray]) -> List[str]:
+        """Paths of the files whose bounds intersect a box, e.g. for PointCloudLoader.load_tiles()"""
+        return [entry['path'] for entry in self.query(bbox)]
+
+    def estimate_points(self, bbox: Tuple[np.ndarray, np.ndarray]) -> int:
+        """
+        Estimate how many points lie in a box without reading any file
+
+        Files with a histogram contribute the counts of the cells the box
+        overlaps, weighted by the overlapping area; other files contribute
+        the share of their points matching the overlap of their XY bounds.
+
+        Args:
+            bbox: (min_bound, max_bound) in world coordinates
+
+        Returns:
+            Estimated point count
+        """
+        low, high = np.asarray(bbox[0], dtype=np.float64), np.asarray(bbox[1], dtype=np.float64)
+        total = 0.0
+        for entry in self.query(bbox):
+            file_min, file_max = np.asarray(entry['min'])[:2], np.asarray(entry['max'])[:2]
+            histogram = entry['histogram']
+            if histogram is None:
+                histogram = np.array([[entry['num_points']]], dtype=np.float64)
+            bins = histogram.shape[0]
+
+            # Overlap of the box with every cell, as a fraction of the cell, per axis
+            weights = []
+            for axis in range(2):
+                edges = np.linspace(file_min[axis], file_max[axis], bins + 1)
+                width = np.maximum(edges[1:] - edges[:-1], 1e-9)
+                overlap = np.minimum(edges[1:], high[axis]) - np.maximum(edges[:-1], low[axis])
+                weights.append(np.clip(overlap / width, 0.0, 1.0))
+            total += float(weights[0] @ histogram @ weights[1])
+        return int(round(total))
+
+    def _store(self, entry: Dict[str, Any]):
+        """Insert or replace the row and R-tree entry of a file"""
+        min_bound = entry['min'] if entry['min'] is not None else [None] * 3
+        max_bound = entry['max'] if entry['max'] is not None else [None] * 3
+        self.connection.execute(
+            """
+            INSERT INTO files (path, size, mtime_ns, data_format, fields, num_points,
+                               min_x, min_y, min_z, max_x, max_y, max_z,
+                               histogram, histogram_bins, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size, mtime_ns = excluded.mtime_ns,
+                data_format = excluded.data_format, fields = excluded.fields,
+                num_points = excluded.num_points,
+                min_x = excluded.min_x, min_y = excluded.min_y, min_z = excluded.min_z,
+                max_x = excluded.max_x, max_y = excluded.max_y, max_z = excluded.max_z,
+                histogram = excluded.histogram, histogram_bins = excluded.histogram_bins,
+                indexed_at = excluded.indexed_at
+            """,
+            (entry['path'], entry['size'], entry['mtime_ns'], entry['data_format'], entry['fields'],
+             entry['num_points'], *min_bound, *max_bound, entry['histogram'], entry['histogram_bins'],
+             time.time()))
+        file_id = self.connection.execute("SELECT id FROM files WHERE path = ?", (entry['path'],)).fetchone()[0]
+
+        self.connection.execute("DELETE FROM files_rtree WHERE id = ?", (file_id,))
+        if entry['min'] is not None:
+            self.connection.execute(
+                "INSERT INTO files_rtree VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, min_bound[0], max_bound[0], min_bound[1], max_bound[1], min_bound[2], max_bound[2]))
+
+    def _entry(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Turn a files row into a dictionary with decoded fields, bounds and histogram"""
+        entry = dict(row)
+        entry['fields'] = json.loads(entry['fields']) if entry['fields'] else []
+        entry['min'] = [entry.pop('min_x'), entry.pop('min_y'), entry.pop('min_z')]
+        entry['max'] = [entry.pop('max_x'), entry.pop('max_y'), entry.pop('max_z')]
+        if entry['histogram'] is not None:
+            bins = entry['histogram_bins']
+            entry['histogram'] = np.frombuffer(entry['histogram'], dtype=np.uint32).reshape(bins, bins)
+        return entry
+
+
+def main():
+    """Command line entry point: index directories or list the files covering a box"""
+    parser = argparse.ArgumentParser(description="Catalogue of PCD map files")
+    parser.add_argument('db', help="SQLite catalogue file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index_parser = commands.add_parser('index', help="index or re-index directories")
+    index_parser.add_argument('directories', nargs='+')
+    index_parser.add_argument('--pattern', default="*.pcd")
+    index_parser.add_argument('--histogram-bins', type=int, default=0)
+    index_parser.add_argument('--workers', type=int, default=8)
+
+    query_parser = commands.add_parser('query', help="list the files intersecting a box")
+    query_parser.add_argument('bbox', nargs=6, type=float, metavar='V',
+                              help="min_x min_y min_z max_x max_y max_z")
+    args = parser.parse_args()
+
+    with MapCatalog(args.db) as catalog:
+        if args.command == 'index':
+            for directory in args.directories:
+                counts = catalog.index_directory(directory, args.pattern, histogram_bins=args.histogram_bins,
+                                                 max_workers=args.workers)
+                print(f"{directory}: {counts}")
+        else:
+            bbox = (np.array(args.bbox[:3]), np.array(args.bbox[3:]))
+            for entry in catalog.query(bbox):
+                print(f"{entry['path']}\t{entry['num_points']}")
+            print(f"~{catalog.estimate_points(bbox):,} points in the box")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Point Cloud Data Module
+Compact structure-of-arrays storage for large point clouds
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import open3d as o3d
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Points are converted to float32 in blocks of this many rows to bound temporaries
+CONVERT_CHUNK_POINTS = 4 * 1024 * 1024
+
+# Attribute with the number of input points each point stands for after duplicate removal
+COUNT_ATTRIBUTE = 'dup_count'
+
+# Attribute with the row of every point in the file it was loaded from; select() and copy()
+# carry it, so a save of any subset or copy finds the fields left on disk. Never written out.
+ROW_ATTRIBUTE = 'source_row'
+
+
+def numpy_to_tensor(array: np.ndarray) -> o3d.core.Tensor:
+    """Wrap a numpy array as an Open3D tensor through DLPack; contiguous arrays are not copied"""
+    return o3d.core.Tensor.from_dlpack(np.ascontiguousarray(array).__dlpack__())
+
+
+def tensor_to_numpy(tensor: o3d.core.Tensor) -> np.ndarray:
+    """Writable numpy view of a CPU tensor; tensors on other devices are copied to the host"""
+    return (tensor if tensor.is_cpu else tensor.cpu()).numpy()
+
+
+def origin_of(axis: np.ndarray) -> float:
+    """Floor of the smallest finite value of a coordinate column, 0 if it has none"""
+    low = axis.min() if len(axis) else 0.0
+    if not np.isfinite(low):
+        finite = axis[np.isfinite(axis)]
+        low = finite.min() if len(finite) else 0.0
+    return float(np.floor(low))
+
+
+def colors_to_uint8(colors: np.ndarray) -> np.ndarray:
+    """Convert colors in [0, 1] (or already uint8) into uint8 (N, 3)"""
+    colors = np.asarray(colors)
+    if colors.dtype == np.uint8:
+        return colors
+    return np.clip(np.round(colors * 255.0), 0, 255).astype(np.uint8)
+
+
+class PointCloudData:
+    """
+    Point cloud stored as float32 xyz relative to a float64 origin
+
+    Open3D keeps float64 points and float64 colors, 48 bytes per point.
+    Here points take 12 bytes and colors 3; the float64 origin (the floor
+    of the minimum corner) keeps millimetre precision on maps tens of
+    kilometres from the coordinate origin. Open3D algorithms with a tensor
+    implementation run on to_tensor(), which shares these buffers; legacy
+    Open3D clouds are only built by to_open3d() for the renderer and for
+    algorithms without one.
+    """
+
+    __slots__ = ('origin', 'xyz', 'colors', 'normals', 'attributes')
+
+    def __init__(self, xyz: np.ndarray, origin: Optional[np.ndarray] = None,
+                 colors: Optional[np.ndarray] = None, normals: Optional[np.ndarray] = None,
+                 attributes: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Args:
+            xyz: float32 points (N, 3) relative to origin
+            origin: float64 offset added to xyz to get world coordinates
+            colors: Optional uint8 colors (N, 3)
+            normals: Optional float32 normals (N, 3)
+            attributes: Optional per-point columns, e.g. intensity
+        """
+        self.xyz = np.ascontiguousarray(xyz, dtype=np.float32).reshape(-1, 3)
+        self.origin = np.zeros(3) if origin is None else np.asarray(origin, dtype=np.float64)
+        self.colors = colors_to_uint8(colors) if colors is not None else None
+        self.normals = np.asarray(normals, dtype=np.float32) if normals is not None else None
+        self.attributes = dict(attributes) if attributes else {}
+
+    @classmethod
+    def from_points(cls, points: np.ndarray, colors: Optional[np.ndarray] = None,
+                    normals: Optional[np.ndarray] = None, attributes: Optional[Dict[str, np.ndarray]] = None,
+                    origin: Optional[np.ndarray] = None) -> 'PointCloudData':
+        """
+        Build a container from world-coordinate points
+
+        Args:
+            points: Points (N, 3) in world coordinates
+            colors: Optional colors in [0, 1] or uint8 (N, 3)
+            normals: Optional normals (N, 3)
+            attributes: Optional per-point columns
+            origin: Offset to store points against (floor of the finite minimum if None)
+
+        Returns:
+            New PointCloudData
+        """
+        points = np.asarray(points).reshape(-1, 3)
+        if origin is None:
+            origin = np.array([origin_of(points[:, i]) for i in range(3)])
+        xyz = np.empty((len(points), 3), dtype=np.float32)
+        for start in range(0, len(points), CONVERT_CHUNK_POINTS):
+            stop = start + CONVERT_CHUNK_POINTS
+            xyz[start:stop] = points[start:stop] - origin
+        return cls(xyz, origin, colors, normals, attributes)
+
+    @classmethod
+    def from_columns(cls, columns, colors: Optional[np.ndarray] = None) -> 'PointCloudData':
+        """
+        Build a container from x, y, z fields of a structured array or ColumnStore
+
+        Args:
+            columns: Anything indexable by field name with a dtype, like a
+                structured array or ColumnStore
+            colors: Optional uint8 colors (N, 3) decoded by the caller
+
+        Returns:
+            New PointCloudData with colors and normals when given
+        """
+        axes = [np.asarray(columns[axis]) for axis in ('x', 'y', 'z')]
+        if len(axes[0]) == 0:
+            return cls(np.empty((0, 3), dtype=np.float32), colors=colors)
+        origin = np.array([origin_of(axis) for axis in axes])
+        xyz = np.empty((len(axes[0]), 3), dtype=np.float32)
+        for i, axis in enumerate(axes):
+            xyz[:, i] = axis - origin[i]
+
+        names = columns.dtype.names
+        normals = None
+        if all(n in names for n in ('normal_x', 'normal_y', 'normal_z')):
+            normals = np.empty((len(xyz), 3), dtype=np.float32)
+            for i, axis in enumerate(('normal_x', 'normal_y', 'normal_z')):
+                normals[:, i] = columns[axis]
+        return cls(xyz, origin, colors, normals)
+
+    @classmethod
+    def from_open3d(cls, point_cloud: o3d.geometry.PointCloud) -> 'PointCloudData':
+        """Copy an Open3D point cloud into a container"""
+        return cls.from_points(
+            np.asarray(point_cloud.points),
+            np.asarray(point_cloud.colors) if point_cloud.has_colors() else None,
+            np.asarray(point_cloud.normals) if point_cloud.has_normals() else None)
+
+    def to_open3d(self) -> o3d.geometry.PointCloud:
+        """Build an Open3D point cloud (float64, world coordinates) for rendering or Open3D algorithms"""
+        pc = o3d.geometry.PointCloud()
+        pc.points = o3d.utility.Vector3dVector(self.points)
+        if self.colors is not None:
+            pc.colors = o3d.utility.Vector3dVector(self.colors_float())
+        if self.normals is not None:
+            pc.normals = o3d.utility.Vector3dVector(self.normals.astype(np.float64))
+        return pc
+
+    @classmethod
+    def from_tensor(cls, point_cloud: o3d.t.geometry.PointCloud,
+                    origin: Optional[np.ndarray] = None) -> 'PointCloudData':
+        """
+        Container over the buffers of an Open3D tensor point cloud
+
+        Float32 positions and normals and uint8 colors on the CPU are shared,
+        not copied; anything else is converted.
+
+        Args:
+            point_cloud: Tensor point cloud with positions relative to origin
+            origin: float64 offset of the positions
+        """
+        fields = point_cloud.point
+        return cls(tensor_to_numpy(fields.positions), origin,
+                   tensor_to_numpy(fields.colors) if 'colors' in fields else None,
+                   tensor_to_numpy(fields.normals) if 'normals' in fields else None)
+
+    def to_tensor(self, device: str = 'CPU:0') -> o3d.t.geometry.PointCloud:
+        """
+        Open3D tensor point cloud sharing this container's buffers
+
+        Positions stay relative to origin, so results in world coordinates
+        (plane equations, bounding boxes) have to be shifted by it. On the CPU
+        xyz, colors and normals are handed over through DLPack without a copy;
+        other devices get a copy.
+        """
+        pc = o3d.t.geometry.PointCloud(numpy_to_tensor(self.xyz))
+        if self.colors is not None:
+            pc.point.colors = numpy_to_tensor(self.colors)
+        if self.normals is not None:
+            pc.point.normals = numpy_to_tensor(self.normals)
+        return pc if device == 'CPU:0' else pc.to(o3d.core.Device(device))
+
+    def __len__(self) -> int:
+        return len(self.xyz)
+
+    @property
+    def points(self) -> np.ndarray:
+        """World-coordinate float64 points (N, 3); allocated on every access"""
+        return self.xyz.astype(np.float64) + self.origin
+
+    def colors_float(self) -> Optional[np.ndarray]:
+        """Colors as float64 in [0, 1], or None"""
+        return self.colors / 255.0 if self.colors is not None else None
+
+    def to_local(self, points: np.ndarray) -> np.ndarray:
+        """Express world-coordinate positions in the float32 frame of xyz"""
+        return (np.asarray(points, dtype=np.float64) - self.origin).astype(np.float32)
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """World-coordinate (min_bound, max_bound) of the points"""
+        return (self.xyz.min(axis=0).astype(np.float64) + self.origin,
+                self.xyz.max(axis=0).astype(np.float64) + self.origin)
+
+    def select(self, index: np.ndarray) -> 'PointCloudData':
+        """
+        Subset of the points, with their colors, normals and attributes
+
+        Args:
+            index: Point indices or a boolean mask
+
+        Returns:
+            New PointCloudData sharing this origin
+        """
+        return PointCloudData(
+            self.xyz[index], self.origin,
+            self.colors[index] if self.colors is not None else None,
+            self.normals[index] if self.normals is not None else None,
+            {name: values[index] for name, values in self.attributes.items()})
+
+    def append(self, other: 'PointCloudData') -> 'PointCloudData':
+        """
+        Concatenate two clouds into this one's frame
+
+        Colors, normals and attributes are kept only where both clouds have them.
+
+        Returns:
+            New PointCloudData
+        """
+        def both(a, b):
+            return np.concatenate([a, b]) if a is not None and b is not None else None
+
+        shift = (other.origin - self.origin).astype(np.float32)
+        return PointCloudData(
+            np.concatenate([self.xyz, other.xyz + shift]), self.origin,
+            both(self.colors, other.colors), both(self.normals, other.normals),
+            {name: np.concatenate([values, other.attributes[name]])
+             for name, values in self.attributes.items() if name in other.attributes})
+
+    def copy(self) -> 'PointCloudData':
+        """Deep copy"""
+        return PointCloudData(
+            self.xyz.copy(), self.origin.copy(),
+            self.colors.copy() if self.colors is not None else None,
+            self.normals.copy() if self.normals is not None else None,
+            {name: values.copy() for name, values in self.attributes.items()})
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the arrays"""
+        arrays = [self.xyz, self.colors, self.normals] + list(self.attributes.values())
+        return sum(a.nbytes for a in arrays if a is not None)
+
+
+def concatenate(clouds: List[PointCloudData], origin: Optional[np.ndarray] = None) -> PointCloudData:
+    """
+    Concatenate clouds into one container with a single allocation per array
+
+    Colors, normals and attributes are kept only where every non-empty cloud has them.
+
+    Args:
+        clouds: Clouds to join, in order
+        origin: Frame of the result (the smallest origin of the non-empty clouds if None)
+
+    Returns:
+        New PointCloudData
+    """
+    non_empty = [c for c in clouds if len(c) > 0]
+    if not non_empty:
+        return PointCloudData(np.empty((0, 3), dtype=np.float32), origin)
+    if origin is None:
+        origin = np.min([c.origin for c in non_empty], axis=0)
+    origin = np.asarray(origin, dtype=np.float64)
+    total = sum(len(c) for c in non_empty)
+
+    xyz = np.empty((total, 3), dtype=np.float32)
+    colors = np.empty((total, 3), dtype=np.uint8) if all(c.colors is not None for c in non_empty) else None
+    normals = np.empty((total, 3), dtype=np.float32) if all(c.normals is not None for c in non_empty) else None
+    attributes = {name: np.empty((total,) + values.shape[1:], dtype=values.dtype)
+                  for name, values in non_empty[0].attributes.items()
+                  if all(name in c.attributes for c in non_empty)}
+
+    start = 0
+    for cloud in non_empty:
+        stop = start + len(cloud)
+        xyz[start:stop] = cloud.xyz + (cloud.origin - origin).astype(np.float32)
+        if colors is not None:
+            colors[start:stop] = cloud.colors
+        if normals is not None:
+            normals[start:stop] = cloud.normals
+        for name, values in attributes.items():
+            values[start:stop] = cloud.attributes[name]
+        start = stop
+    return PointCloudData(xyz, origin, colors, normals, attributes)
+
+
+def as_point_data(cloud: Union[PointCloudData, o3d.geometry.PointCloud]) -> PointCloudData:
+    """Accept either a container or an Open3D cloud, converting only the latter"""
+    return cloud if isinstance(cloud, PointCloudData) else PointCloudData.from_open3d(cloud)
+
+
+def as_open3d(cloud: Union[PointCloudData, o3d.geometry.PointCloud]) -> o3d.geometry.PointCloud:
+    """Accept either a container or an Open3D cloud, converting only the former"""
+    return cloud.to_open3d() if isinstance(cloud, PointCloudData) else cloud
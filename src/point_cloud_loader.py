@@ -5,135 +5,2240 @@ Handles loading and saving of PCD files using Open3D
 
 import open3d as o3d
 import numpy as np
+import itertools
 import logging
+import multiprocessing
+import os
+import secrets
+import struct
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
 from pathlib import Path
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, List, Union, Callable
+
+from lod_cache import BLOCK_INDEX_SUFFIX, CACHE_DIR_NAME, LODCache, file_cache_key
+from point_cloud_data import (COUNT_ATTRIBUTE, ROW_ATTRIBUTE, PointCloudData, as_open3d, as_point_data,
+                              colors_to_uint8, concatenate)
+from utils import (downsample_point_cloud, morton_order, unique_point_rows, voxel_average,
+                   voxel_downsample_with_inverse, voxel_size_for_point_budget)
+
+try:
+    import lzf  # python-lzf: C implementation of the PCD compression codec (see requirements.txt)
+except ImportError:
+    lzf = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Accepted relative deviation of a "budget" preview from max_points_preview
+PREVIEW_BUDGET_TOLERANCE = 0.05
+
+# Headers are a dozen short lines; anything longer means the file is not a PCD
+MAX_PCD_HEADER_BYTES = 64 * 1024
+
+# ASCII bodies smaller than this are parsed in-process; pool start-up costs more than it saves
+ASCII_PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# Bytes per point assumed for tiles without a PCD header when no probed tile gives a rate (xyz + rgb)
+ESTIMATED_POINT_BYTES = 16
+
+# Binary bodies are written in blocks of this many points to report progress
+WRITE_CHUNK_POINTS = 1024 * 1024
+
+# PCD fields Open3D reads and writes; files with only these lose nothing through it
+OPEN3D_PCD_FIELDS = {'x', 'y', 'z', 'rgb', 'rgba', 'normal_x', 'normal_y', 'normal_z'}
+
+# Coordinate field types accepted by the native writer
+COORDINATE_DTYPES = {'float32': '<f4', 'float64': '<f8'}
+
+# Points per block of the bbox block index; smaller blocks skip more, but the index grows
+BLOCK_INDEX_POINTS = 64 * 1024
+
+# Loader attributes that together describe one loaded file (kept by CloudCache)
+LOADER_STATE_ATTRIBUTES = ('cloud', 'original_cloud', 'point_data', 'columns', 'header', 'metadata',
+                           'lod_manifest', 'preview_inverse', '_local_bounds', '_deferred_source',
+                           'tile_store', 'region')
+
+
+# PCD (TYPE, SIZE) pairs mapped to little-endian numpy type codes
+PCD_NUMPY_TYPES = {
+    ('F', 4): '<f4', ('F', 8): '<f8',
+    ('U', 1): 'u1', ('U', 2): '<u2', ('U', 4): '<u4', ('U', 8): '<u8',
+    ('I', 1): 'i1', ('I', 2): '<i2', ('I', 4): '<i4', ('I', 8): '<i8',
+}
+
+
+@dataclass
+class PCDHeader:
+    """Parsed header of a PCD file"""
+    fields: List[str]
+    sizes: List[int]
+    types: List[str]
+    counts: List[int]
+    width: int
+    height: int
+    points: int
+    data_format: str
+    data_offset: int             # Byte offset of the first data byte
+    version: str = "0.7"
+    viewpoint: List[float] = field(default_factory=lambda: [0, 0, 0, 1, 0, 0, 0])
+    
+    @property
+    def dtype(self) -> np.dtype:
+        """Structured numpy dtype describing one point record"""
+        descr = []
+        for i, (name, size, type_, count) in enumerate(zip(self.fields, self.sizes, self.types, self.counts)):
+            base = PCD_NUMPY_TYPES.get((type_, size))
+            if base is None:
+                raise ValueError(f"Unsupported PCD field type {type_}{size} for '{name}'")
+            # Padding fields are all called "_" in PCL output
+            name = f"_pad{i}" if name == '_' else name
+            descr.append((name, base) if count == 1 else (name, base, (count,)))
+        return np.dtype(descr)
+    
+    @property
+    def point_step(self) -> int:
+        """Size of one point record in bytes"""
+        return int(sum(s * c for s, c in zip(self.sizes, self.counts)))
+
+
+def read_pcd_header(file_path: str) -> PCDHeader:
+    """
+    Parse the header of a PCD file without touching the point data
+    
+    Args:
+        file_path: Path to PCD file
+        
+    Returns:
+        PCDHeader describing the file layout
+    """
+    values = {}
+    with open(file_path, 'rb') as f:
+        while True:
+            line = f.readline(MAX_PCD_HEADER_BYTES)
+            if not line or f.tell() > MAX_PCD_HEADER_BYTES:
+                raise ValueError(f"No DATA line found in PCD header: {file_path}")
+            
+            text = line.decode('ascii', errors='replace').strip()
+            if not text or text.startswith('#'):
+                continue
+            
+            parts = text.split()
+            key = parts[0].upper()
+            values[key] = parts[1:]
+            if key == 'DATA':
+                data_offset = f.tell()
+                break
+    
+    fields = values.get('FIELDS', [])
+    if not fields:
+        raise ValueError(f"PCD header has no FIELDS: {file_path}")
+    
+    counts = [int(c) for c in values.get('COUNT', ['1'] * len(fields))]
+    width = int(values.get('WIDTH', ['0'])[0])
+    height = int(values.get('HEIGHT', ['1'])[0])
+    points = int(values['POINTS'][0]) if 'POINTS' in values else width * height
+    
+    return PCDHeader(
+        fields=fields,
+        sizes=[int(s) for s in values.get('SIZE', [])],
+        types=[t.upper() for t in values.get('TYPE', [])],
+        counts=counts,
+        width=width,
+        height=height,
+        points=points,
+        data_format=values['DATA'][0].lower(),
+        data_offset=data_offset,
+        version=values.get('VERSION', ['0.7'])[0],
+        viewpoint=[float(v) for v in values.get('VIEWPOINT', [0, 0, 0, 1, 0, 0, 0])]
+    )
+
+
+def memmap_pcd(file_path: str, header: Optional[PCDHeader] = None) -> np.memmap:
+    """
+    Map the body of a binary PCD file as a read-only structured array
+    
+    No point data is read here; pages are pulled in by the OS when a
+    field or a slice of the returned array is touched.
+    
+    Args:
+        file_path: Path to PCD file
+        header: Already parsed header (read from file if None)
+        
+    Returns:
+        Structured numpy memmap with one record per point
+    """
+    header = header if header is not None else read_pcd_header(file_path)
+    if header.data_format != 'binary':
+        raise ValueError(f"Memory mapping requires DATA binary, got '{header.data_format}'")
+    
+    available = (Path(file_path).stat().st_size - header.data_offset) // header.point_step
+    if available < header.points:
+        raise ValueError(f"PCD body is truncated: header declares {header.points} points, file holds {available}")
+    
+    return np.memmap(file_path, dtype=header.dtype, mode='r',
+                     offset=header.data_offset, shape=(header.points,))
+
+
+def warn_pure_python_lzf(action: str, num_bytes: int):
+    """Log that a binary_compressed body goes through the slow pure Python LZF codec"""
+    logger.warning(f"{action} {num_bytes / (1024*1024):.1f} MB with the pure Python LZF codec "
+                   f"(about 1 MB/s): install python-lzf (pip install -r requirements.txt)")
+
+
+def lzf_decompress(data: bytes, expected_size: int) -> bytes:
+    """
+    Decompress an LZF block as written by PCL for DATA binary_compressed
+    
+    Uses python-lzf when installed and a pure Python decoder, with a
+    warning, otherwise.
+    
+    Args:
+        data: Compressed bytes
+        expected_size: Size of the uncompressed data in bytes
+        
+    Returns:
+        Uncompressed bytes
+    """
+    if lzf is not None:
+        out = lzf.decompress(data, expected_size)
+        if out is None or len(out) != expected_size:
+            raise ValueError("LZF decompression failed")
+        return out
+    
+    warn_pure_python_lzf("Decompressing", expected_size)
+    out = bytearray(expected_size)
+    ip = op = 0
+    end = len(data)
+    while ip < end:
+        ctrl = data[ip]
+        ip += 1
+        if ctrl < 32:
+            # Literal run of ctrl + 1 bytes
+            length = ctrl + 1
+            out[op:op + length] = data[ip:ip + length]
+            ip += length
+            op += length
+            continue
+        
+        # Back reference
+        length = ctrl >> 5
+        if length == 7:
+            length += data[ip]
+            ip += 1
+        distance = ((ctrl & 0x1f) << 8) + data[ip] + 1
+        ip += 1
+        length += 2
+        ref = op - distance
+        if ref < 0:
+            raise ValueError("Corrupt LZF stream: back reference before start of output")
+        
+        if distance >= length:
+            out[op:op + length] = out[ref:ref + length]
+        else:
+            # Overlapping copy repeats the last `distance` bytes
+            pattern = bytes(out[ref:op])
+            out[op:op + length] = (pattern * (length // distance + 1))[:length]
+        op += length
+    
+    if op != expected_size:
+        raise ValueError(f"LZF stream decoded to {op} bytes, expected {expected_size}")
+    return bytes(out)
+
+
+def lzf_compress(data: bytes) -> bytes:
+    """
+    Compress bytes with LZF in the format PCL expects for DATA binary_compressed
+    
+    Uses python-lzf when installed and a pure Python encoder, with a
+    warning, otherwise.
+    
+    Args:
+        data: Uncompressed bytes
+        
+    Returns:
+        Compressed bytes
+    """
+    if lzf is not None:
+        # python-lzf returns None when the output would exceed the size limit
+        out = lzf.compress(data, len(data) + len(data) // 16 + 64)
+        if out is not None:
+            return out
+    else:
+        warn_pure_python_lzf("Compressing", len(data))
+    
+    data = bytes(data)
+    end = len(data)
+    out = bytearray()
+    table = {}
+    ip = literal_start = 0
+    
+    def flush_literals(stop):
+        start = literal_start
+        while start < stop:
+            run = min(32, stop - start)
+            out.append(run - 1)
+            out.extend(data[start:start + run])
+            start += run
+    
+    while ip < end - 2:
+        key = data[ip:ip + 3]
+        ref = table.get(key)
+        table[key] = ip
+        
+        if ref is None or ip - ref > 8192:
+            ip += 1
+            continue
+        
+        # Extend the match; the source may overlap the output, as in the decoder
+        max_length = min(264, end - ip)
+        length = 3
+        while length + 8 <= max_length and data[ref + length:ref + length + 8] == data[ip + length:ip + length + 8]:
+            length += 8
+        while length < max_length and data[ref + length] == data[ip + length]:
+            length += 1
+        
+        flush_literals(ip)
+        offset = ip - ref - 1
+        encoded = length - 2
+        if encoded < 7:
+            out.append((encoded << 5) | (offset >> 8))
+        else:
+            out.append((7 << 5) | (offset >> 8))
+            out.append(encoded - 7)
+        out.append(offset & 0xff)
+        
+        ip += length
+        literal_start = ip
+    
+    flush_literals(end)
+    return bytes(out)
+
+
+def lzf_through_open3d(fields: List[str]) -> bool:
+    """
+    Whether binary_compressed data with these fields is better decoded or encoded by Open3D
+    
+    Without python-lzf the codec runs in pure Python, orders of magnitude
+    slower than Open3D's; Open3D is used then, unless it would drop some of
+    the fields (the pure Python codec warns when it has to run).
+    """
+    return lzf is None and set(fields) <= OPEN3D_PCD_FIELDS
+
+
+def read_compressed_body(file_path: str, header: PCDHeader) -> bytes:
+    """
+    Read and decompress the body of a binary_compressed PCD file
+    
+    The result is column-major: all values of the first field, then all
+    values of the second field, and so on.
+    
+    Args:
+        file_path: Path to PCD file
+        header: Parsed header of the file
+        
+    Returns:
+        Uncompressed body bytes
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(header.data_offset)
+        compressed_size, uncompressed_size = struct.unpack('<II', f.read(8))
+        compressed = f.read(compressed_size)
+    
+    if len(compressed) != compressed_size:
+        raise ValueError("PCD body is truncated")
+    if uncompressed_size != header.points * header.point_step:
+        raise ValueError(f"Compressed body holds {uncompressed_size} bytes, "
+                         f"expected {header.points * header.point_step}")
+    return lzf_decompress(compressed, uncompressed_size)
+
+
+def columns_to_structured(body: bytes, header: PCDHeader, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+    """
+    Gather points [start, stop) of a column-major PCD body into a structured array
+    
+    Args:
+        body: Uncompressed column-major body (see read_compressed_body)
+        header: Parsed header of the file
+        start: First point to gather
+        stop: End of the point range (header.points if None)
+        
+    Returns:
+        Structured array with one record per point
+    """
+    stop = header.points if stop is None else stop
+    dtype = header.dtype
+    out = np.empty(stop - start, dtype=dtype)
+    
+    column_offset = 0
+    for name in dtype.names:
+        field_dtype = dtype[name]
+        item = field_dtype.itemsize
+        column = np.frombuffer(body, dtype=field_dtype.base,
+                               count=(stop - start) * (item // field_dtype.base.itemsize),
+                               offset=column_offset + start * item)
+        out[name] = column.reshape(out[name].shape)
+        column_offset += header.points * item
+    
+    return out
+
+
+def read_compressed_pcd(file_path: str, header: Optional[PCDHeader] = None) -> np.ndarray:
+    """
+    Decode a binary_compressed PCD file into a structured array
+    
+    Args:
+        file_path: Path to PCD file
+        header: Already parsed header (read from file if None)
+        
+    Returns:
+        Structured array with one record per point, all fields preserved
+    """
+    header = header if header is not None else read_pcd_header(file_path)
+    if header.data_format != 'binary_compressed':
+        raise ValueError(f"Expected DATA binary_compressed, got '{header.data_format}'")
+    return columns_to_structured(read_compressed_body(file_path, header), header)
+
+
+def make_pcd_header(dtype: np.dtype, points: int, data_format: str,
+                    viewpoint: Optional[List[float]] = None) -> bytes:
+    """
+    Build the text header of a PCD file for a structured point dtype
+    
+    Args:
+        dtype: Structured dtype of one point record
+        points: Number of points
+        data_format: "ascii", "binary" or "binary_compressed"
+        viewpoint: Sensor viewpoint (identity if None)
+        
+    Returns:
+        Encoded header including the DATA line
+    """
+    kinds = {'f': 'F', 'u': 'U', 'i': 'I'}
+    names, sizes, types, counts = [], [], [], []
+    for name in dtype.names:
+        field_dtype = dtype[name]
+        names.append('_' if name.startswith('_pad') else name)
+        sizes.append(str(field_dtype.base.itemsize))
+        types.append(kinds[field_dtype.base.kind])
+        counts.append(str(int(np.prod(field_dtype.shape)) if field_dtype.shape else 1))
+    
+    viewpoint = viewpoint if viewpoint is not None else [0, 0, 0, 1, 0, 0, 0]
+    lines = [
+        "# .PCD v0.7 - Point Cloud Data file format",
+        "VERSION 0.7",
+        "FIELDS " + " ".join(names),
+        "SIZE " + " ".join(sizes),
+        "TYPE " + " ".join(types),
+        "COUNT " + " ".join(counts),
+        f"WIDTH {points}",
+        "HEIGHT 1",
+        "VIEWPOINT " + " ".join(f"{v:g}" for v in viewpoint),
+        f"POINTS {points}",
+        f"DATA {data_format}",
+    ]
+    return ("\n".join(lines) + "\n").encode('ascii')
+
+
+@contextmanager
+def atomic_write(file_path: Union[str, Path]):
+    """
+    Write a file under a temporary name and move it into place when complete
+    
+    An interrupted write (crash, exception, killed worker) never leaves a
+    truncated file at file_path; the previous version, if any, survives.
+    Every call gets its own temporary file, so concurrent writers of the
+    same path (the saver thread, a sidecar or index write) cannot mix their
+    partial output; the last one to finish wins.
+    
+    Args:
+        file_path: Final file path
+        
+    Yields:
+        Temporary path in the same directory to write to; it keeps the
+        extension of file_path for writers that pick the format from it
+    """
+    file_path = Path(file_path)
+    # Created with mode 0o666 so the process umask applies, as for a plain open()
+    for _ in range(100):
+        tmp_path = file_path.with_name(f"{file_path.name}.{secrets.token_hex(4)}.tmp{file_path.suffix}")
+        try:
+            os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            break
+        except FileExistsError:
+            continue
+    else:
+        raise FileExistsError(f"No free temporary name next to {file_path}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_compressed_pcd(file_path: str, data: np.ndarray, viewpoint: Optional[List[float]] = None):
+    """
+    Write a structured array as a binary_compressed PCD file
+    
+    Columns are laid out one field after another before LZF compression,
+    which is what PCL expects and what makes coordinates compress well.
+    
+    Args:
+        file_path: Output file path
+        data: Structured array with one record per point
+        viewpoint: Sensor viewpoint (identity if None)
+    """
+    names = data.dtype.names
+    if (lzf_through_open3d(names) and all(data.dtype[n] == np.float32 for n in names if n not in ('rgb', 'rgba'))
+            and (viewpoint is None or list(viewpoint) == [0, 0, 0, 1, 0, 0, 0])):
+        # Open3D writes float32 fields and packed colors exactly, with a C codec
+        if not o3d.io.write_point_cloud(str(file_path), structured_to_point_cloud(data), compressed=True):
+            raise OSError(f"Open3D could not write {file_path}")
+        return
+    
+    body = b"".join(np.ascontiguousarray(data[name]).tobytes() for name in names)
+    compressed = lzf_compress(body)
+    
+    with open(file_path, 'wb') as f:
+        f.write(make_pcd_header(data.dtype, len(data), 'binary_compressed', viewpoint))
+        f.write(struct.pack('<II', len(compressed), len(body)))
+        f.write(compressed)
+
+
+def write_pcd(file_path: str, data: np.ndarray, data_format: str = 'binary',
+              viewpoint: Optional[List[float]] = None,
+              progress: Optional[Callable[[float], None]] = None) -> None:
+    """
+    Write a structured array as a PCD file, keeping every field
+    
+    The binary body is the packed records written with tofile, in blocks of
+    WRITE_CHUNK_POINTS so progress can be reported. The file only appears
+    under its name once it is complete (see atomic_write).
+    
+    Args:
+        file_path: Output file path
+        data: Structured array with one record per point
+        data_format: "binary" or "binary_compressed"
+        viewpoint: Sensor viewpoint (identity if None)
+        progress: Optional callback receiving the written fraction in [0, 1]
+    """
+    if data_format not in ('binary', 'binary_compressed'):
+        raise ValueError(f"Unsupported PCD data format: {data_format}")
+    
+    with atomic_write(file_path) as tmp_path:
+        if data_format == 'binary_compressed':
+            write_compressed_pcd(str(tmp_path), data, viewpoint)
+        else:
+            data = np.ascontiguousarray(data)
+            with open(tmp_path, 'wb') as f:
+                f.write(make_pcd_header(data.dtype, len(data), 'binary', viewpoint))
+                for start in range(0, len(data), WRITE_CHUNK_POINTS):
+                    data[start:start + WRITE_CHUNK_POINTS].tofile(f)
+                    if progress is not None:
+                        progress(min(start + WRITE_CHUNK_POINTS, len(data)) / len(data))
+    if progress is not None and data_format == 'binary_compressed':
+        progress(1.0)
+
+
+def pack_rgb(colors: np.ndarray) -> np.ndarray:
+    """
+    Pack colors into the PCL uint32 rgb layout
+    
+    Args:
+        colors: Color array (N, 3), float in [0, 1] or uint8
+        
+    Returns:
+        Packed uint32 array (N,)
+    """
+    rgb = colors_to_uint8(colors).astype(np.uint32)
+    return (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+
+def point_cloud_to_structured(pc: Union[PointCloudData, o3d.geometry.PointCloud],
+                              precision: str = 'float32') -> np.ndarray:
+    """
+    Convert a point cloud into a structured PCD array
+    
+    Args:
+        pc: PointCloudData or Open3D point cloud
+        precision: "float32" or "float64" coordinate fields
+        
+    Returns:
+        Structured array with x, y, z and, if present, rgb, normals and
+        the attribute columns of a PointCloudData (except its source rows)
+    """
+    pc = as_point_data(pc)
+    if precision not in COORDINATE_DTYPES:
+        raise ValueError(f"Unknown coordinate precision: {precision}")
+    coordinate = COORDINATE_DTYPES[precision]
+    descr = [('x', coordinate), ('y', coordinate), ('z', coordinate)]
+    if pc.colors is not None:
+        descr.append(('rgb', '<u4'))
+    if pc.normals is not None:
+        descr += [('normal_x', '<f4'), ('normal_y', '<f4'), ('normal_z', '<f4')]
+    attributes = {name: values for name, values in pc.attributes.items() if name != ROW_ATTRIBUTE}
+    descr += [(name, values.dtype.str) for name, values in attributes.items()]
+    
+    data = np.empty(len(pc), dtype=descr)
+    for i, axis in enumerate(('x', 'y', 'z')):
+        data[axis] = pc.xyz[:, i] + pc.origin[i]
+    if pc.colors is not None:
+        data['rgb'] = pack_rgb(pc.colors)
+    if pc.normals is not None:
+        data['normal_x'], data['normal_y'], data['normal_z'] = pc.normals[:, 0], pc.normals[:, 1], pc.normals[:, 2]
+    for name, values in attributes.items():
+        data[name] = values
+    return data
+
+
+def rows_to_structured(values: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Convert a 2D array of parsed ASCII values into a structured array
+    
+    Args:
+        values: Parsed values (N, total field count)
+        dtype: Structured dtype of one point record
+        
+    Returns:
+        Structured array with one record per row
+    """
+    out = np.empty(len(values), dtype=dtype)
+    column = 0
+    for name in dtype.names:
+        count = int(np.prod(dtype[name].shape)) if dtype[name].shape else 1
+        out[name] = values[:, column] if count == 1 else values[:, column:column + count]
+        column += count
+    return out
+
+
+def unpack_rgb_uint8(rgb: np.ndarray) -> np.ndarray:
+    """
+    Split a packed PCL rgb/rgba column into uint8 channels
+    
+    Args:
+        rgb: Packed column (float32 bit pattern or uint32)
+        
+    Returns:
+        uint8 color array (N, 3)
+    """
+    packed = np.ascontiguousarray(rgb).view(np.uint32)
+    colors = np.empty((len(packed), 3), dtype=np.uint8)
+    colors[:, 0] = (packed >> 16) & 0xFF
+    colors[:, 1] = (packed >> 8) & 0xFF
+    colors[:, 2] = packed & 0xFF
+    return colors
+
+
+def unpack_rgb(rgb: np.ndarray) -> np.ndarray:
+    """
+    Convert a packed PCL rgb/rgba column into float colors in [0, 1]
+    
+    Args:
+        rgb: Packed column (float32 bit pattern or uint32)
+        
+    Returns:
+        Color array (N, 3)
+    """
+    return unpack_rgb_uint8(rgb) / 255.0
+
+
+def structured_to_point_data(data: np.ndarray) -> PointCloudData:
+    """
+    Build a PointCloudData from a structured PCD array
+    
+    Args:
+        data: Structured array (or ColumnStore) with at least x, y, z fields
+        
+    Returns:
+        PointCloudData with points and, if present, colors and normals
+    """
+    names = data.dtype.names
+    color_field = 'rgb' if 'rgb' in names else 'rgba' if 'rgba' in names else None
+    colors = unpack_rgb_uint8(data[color_field]) if color_field is not None else None
+    return PointCloudData.from_columns(data, colors)
+
+
+def structured_to_point_cloud(data: np.ndarray) -> o3d.geometry.PointCloud:
+    """
+    Build an Open3D point cloud from a structured PCD array
+    
+    Args:
+        data: Structured array (or ColumnStore) with at least x, y, z fields
+        
+    Returns:
+        Open3D point cloud with points and, if present, colors and normals
+    """
+    names = data.dtype.names
+    pc = o3d.geometry.PointCloud()
+    
+    points = np.empty((len(data), 3), dtype=np.float64)
+    for i, axis in enumerate(('x', 'y', 'z')):
+        points[:, i] = data[axis]
+    pc.points = o3d.utility.Vector3dVector(points)
+    
+    color_field = 'rgb' if 'rgb' in names else 'rgba' if 'rgba' in names else None
+    if color_field is not None:
+        pc.colors = o3d.utility.Vector3dVector(unpack_rgb(data[color_field]))
+    
+    if all(n in names for n in ('normal_x', 'normal_y', 'normal_z')):
+        normals = np.empty((len(data), 3), dtype=np.float64)
+        for i, axis in enumerate(('normal_x', 'normal_y', 'normal_z')):
+            normals[:, i] = data[axis]
+        pc.normals = o3d.utility.Vector3dVector(normals)
+    
+    return pc
+
+
+def split_ascii_ranges(file_path: str, header: PCDHeader, num_parts: int) -> List[Tuple[int, int]]:
+    """
+    Split the body of an ASCII PCD file into byte ranges that end on line boundaries
+    
+    Args:
+        file_path: Path to PCD file
+        header: Parsed header of the file
+        num_parts: Desired number of ranges
+        
+    Returns:
+        List of (start, end) byte offsets covering the whole body
+    """
+    file_size = Path(file_path).stat().st_size
+    body_size = file_size - header.data_offset
+    step = max(1, body_size // max(1, num_parts))
+    
+    bounds = [header.data_offset]
+    with open(file_path, 'rb') as f:
+        while bounds[-1] + step < file_size:
+            f.seek(bounds[-1] + step)
+            f.readline()  # Move to the start of the next line
+            position = f.tell()
+            if position >= file_size:
+                break
+            bounds.append(position)
+    bounds.append(file_size)
+    
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parse_ascii_range(file_path: str, start: int, end: int) -> np.ndarray:
+    """
+    Parse the ASCII point records stored in bytes [start, end) of a file
+    
+    Args:
+        file_path: Path to PCD file
+        start: Byte offset of the first line
+        end: Byte offset just past the last line
+        
+    Returns:
+        Parsed values (N, total field count) as float64
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+    return np.loadtxt(raw.splitlines(), dtype=np.float64, ndmin=2)
+
+
+def parse_ascii_pcd(file_path: str, header: Optional[PCDHeader] = None,
+                    max_workers: Optional[int] = None) -> np.ndarray:
+    """
+    Parse the body of an ASCII PCD file, in parallel for large files
+    
+    The body is split at newline boundaries into one byte range per worker;
+    each range is parsed in a separate process and copied into a single
+    preallocated structured array.
+    
+    Args:
+        file_path: Path to PCD file
+        header: Already parsed header (read from file if None)
+        max_workers: Number of worker processes (CPU count if None)
+        
+    Returns:
+        Structured array with one record per point
+    """
+    file_path = str(file_path)
+    header = header if header is not None else read_pcd_header(file_path)
+    if header.data_format != 'ascii':
+        raise ValueError(f"Expected DATA ascii, got '{header.data_format}'")
+    
+    dtype = header.dtype
+    out = np.empty(header.points, dtype=dtype)
+    workers = max_workers or os.cpu_count() or 1
+    body_size = Path(file_path).stat().st_size - header.data_offset
+    
+    if workers == 1 or body_size < ASCII_PARALLEL_MIN_BYTES:
+        blocks = iter([parse_ascii_range(file_path, header.data_offset, header.data_offset + body_size)])
+        executor = None
+    else:
+        # Several ranges per worker keeps the pool busy when line lengths vary
+        ranges = split_ascii_ranges(file_path, header, workers * 4)
+        # Spawned workers: forking a process that runs GUI and Open3D threads is not safe
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        blocks = executor.map(parse_ascii_range, itertools.repeat(file_path),
+                              [r[0] for r in ranges], [r[1] for r in ranges])
+    
+    try:
+        filled = 0
+        for values in blocks:
+            count = min(len(values), header.points - filled)
+            out[filled:filled + count] = rows_to_structured(values[:count], dtype)
+            filled += count
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    if filled < header.points:
+        raise ValueError(f"PCD body is truncated: header declares {header.points} points, file holds {filled}")
+    return out
+
+
+def block_index_path(file_path: str) -> Path:
+    """Sidecar path of the block index of a file"""
+    file_path = Path(file_path)
+    return file_path.parent / CACHE_DIR_NAME / (file_path.name + BLOCK_INDEX_SUFFIX)
+
+
+def build_block_index(file_path: str, header: PCDHeader, block_points: int = BLOCK_INDEX_POINTS) -> Dict[str, np.ndarray]:
+    """
+    Compute the bounds of every block of points of a PCD body in one pass
+    
+    Args:
+        file_path: Path to PCD file
+        header: Parsed header of the file
+        block_points: Number of points per block
+        
+    Returns:
+        Dictionary with per-block 'min' and 'max' (B, 3), and for ASCII
+        files the byte 'offsets' (B + 1) of the block boundaries
+    """
+    starts = np.arange(0, header.points, block_points)
+    mins = np.empty((len(starts), 3))
+    maxs = np.empty((len(starts), 3))
+    index = {'block_points': np.int64(block_points), 'min': mins, 'max': maxs}
+    
+    if header.data_format in ('binary', 'binary_compressed'):
+        if header.data_format == 'binary':
+            columns = memmap_pcd(file_path, header)
+        else:
+            columns = ColumnStore(header, body=read_compressed_body(file_path, header))
+        for i, axis in enumerate(('x', 'y', 'z')):
+            values = columns[axis]
+            # fmin/fmax skip NaN points; an all-NaN block stays NaN and never matches a box
+            mins[:, i] = np.fmin.reduceat(values, starts)
+            maxs[:, i] = np.fmax.reduceat(values, starts)
+        del columns
+    
+    elif header.data_format == 'ascii':
+        dtype = header.dtype
+        positions = np.cumsum([0] + [int(np.prod(dtype[n].shape)) if dtype[n].shape else 1 for n in dtype.names])
+        axes = [int(positions[dtype.names.index(axis)]) for axis in ('x', 'y', 'z')]
+        offsets = np.empty(len(starts) + 1, dtype=np.int64)
+        with open(file_path, 'rb') as f:
+            f.seek(header.data_offset)
+            offset = header.data_offset
+            for i in range(len(starts)):
+                lines = list(itertools.islice(f, block_points))
+                offsets[i] = offset
+                offset += sum(len(line) for line in lines)
+                values = np.loadtxt(lines, dtype=np.float64, ndmin=2, usecols=axes)
+                mins[i] = np.fmin.reduce(values, axis=0)
+                maxs[i] = np.fmax.reduce(values, axis=0)
+        offsets[-1] = offset
+        index['offsets'] = offsets
+    
+    else:
+        raise ValueError(f"Unsupported PCD data format: {header.data_format}")
+    return index
+
+
+def load_block_index(file_path: str, header: PCDHeader, block_points: int = BLOCK_INDEX_POINTS) -> Dict[str, np.ndarray]:
+    """
+    Get the block index of a file, building and storing it on first use
+    
+    The index is stored with the file's cache key and rebuilt when the
+    file changes. When it cannot be stored the index is still returned.
+    
+    Args:
+        file_path: Path to PCD file
+        header: Parsed header of the file
+        block_points: Number of points per block
+        
+    Returns:
+        Block index as returned by build_block_index()
+    """
+    path = block_index_path(file_path)
+    key = file_cache_key(file_path)
+    if path.exists():
+        try:
+            with np.load(path) as stored:
+                if str(stored['key']) == key and int(stored['block_points']) == block_points:
+                    return {name: stored[name] for name in stored.files if name != 'key'}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding unreadable block index {path}: {e}")
+    
+    t0 = time.perf_counter()
+    index = build_block_index(file_path, header, block_points)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, key=np.array(key), **index)
+    except OSError as e:
+        # Read-only map directories get no sidecar; the index is rebuilt on next use
+        logger.warning(f"Could not store block index {path}: {e}")
+    logger.info(f"Built block index of {Path(file_path).name} ({len(index['min'])} blocks) "
+                f"in {time.perf_counter()-t0:.3f}s")
+    return index
+
+
+def read_pcd_bbox(file_path: str, header: PCDHeader, bbox: Tuple[np.ndarray, np.ndarray],
+                  block_points: int = BLOCK_INDEX_POINTS) -> np.ndarray:
+    """
+    Read only the points of a PCD file that lie in a box
+    
+    Blocks whose bounds miss the box are never read: binary files are
+    memory-mapped and only the byte ranges of the matching blocks are
+    touched, ASCII files seek to them and parse nothing else. A
+    binary_compressed body is one LZF stream, so it is decompressed whole
+    and only the crop is done per point.
+    
+    Args:
+        file_path: Path to PCD file
+        header: Parsed header of the file
+        bbox: (min_bound, max_bound) in world coordinates
+        block_points: Number of points per index block
+        
+    Returns:
+        Structured array with the records inside the box
+    """
+    low, high = np.asarray(bbox[0], dtype=np.float64), np.asarray(bbox[1], dtype=np.float64)
+    
+    if header.data_format == 'binary_compressed':
+        columns = ColumnStore(header, body=read_compressed_body(file_path, header))
+        inside = np.ones(header.points, dtype=bool)
+        for i, axis in enumerate(('x', 'y', 'z')):
+            values = columns[axis]
+            inside &= (values >= low[i]) & (values <= high[i])
+        rows = np.flatnonzero(inside)
+        records = np.empty(len(rows), dtype=header.dtype)
+        for name in header.dtype.names:
+            records[name] = columns[name][rows]
+        return records
+    
+    index = load_block_index(file_path, header, block_points)
+    hits = np.flatnonzero(np.all((index['min'] <= high) & (index['max'] >= low), axis=1))
+    if len(hits) == 0:
+        return np.empty(0, dtype=header.dtype)
+    
+    # Neighbouring blocks are read as one range
+    breaks = np.flatnonzero(np.diff(hits) > 1) + 1
+    runs = [(run[0], run[-1] + 1) for run in np.split(hits, breaks)]
+    
+    parts = []
+    if header.data_format == 'binary':
+        data = memmap_pcd(file_path, header)
+        for first, last in runs:
+            parts.append(np.array(data[first * block_points:last * block_points]))
+        del data
+    else:
+        offsets = index['offsets']
+        for first, last in runs:
+            values = parse_ascii_range(file_path, int(offsets[first]), int(offsets[last]))
+            parts.append(rows_to_structured(values, header.dtype))
+    records = np.concatenate(parts)
+    
+    inside = np.ones(len(records), dtype=bool)
+    for i, axis in enumerate(('x', 'y', 'z')):
+        inside &= (records[axis] >= low[i]) & (records[axis] <= high[i])
+    logger.info(f"Read {len(records):,} points of {len(hits)}/{len(index['min'])} blocks, "
+                f"{np.count_nonzero(inside):,} inside the box")
+    return records[inside]
+
+
+def split_point_budget(budget: int, counts: List[float]) -> List[int]:
+    """
+    Share a point budget out in proportion to point counts
+    
+    Every share is rounded down and the points left over go to the largest
+    remainders, so the shares add up to exactly the budget.
+    
+    Args:
+        budget: Points to share out
+        counts: Point count (or estimate) of every recipient
+        
+    Returns:
+        Integer share of every recipient
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    if total <= 0:
+        return [0] * len(counts)
+    exact = budget * counts / total
+    shares = np.floor(exact).astype(np.int64)
+    leftover = budget - int(shares.sum())
+    shares[np.argsort(shares - exact, kind='stable')[:leftover]] += 1
+    return shares.tolist()
+
+
+def read_tile(file_path: str, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+              max_points: Optional[int] = None) -> Tuple[PointCloudData, int]:
+    """
+    Read one tile of a multi-file map
+    
+    Module-level so that it can run in a thread or process pool worker;
+    cropping and preview downsampling happen in the worker too.
+    
+    Args:
+        file_path: Tile file (PCD read natively, other formats through Open3D)
+        bbox: Optional (min_bound, max_bound) in world coordinates to crop to
+        max_points: Voxel-downsample the tile to about this many points if given (0 keeps none)
+        
+    Returns:
+        Tuple of (PointCloudData of the tile, point count before downsampling)
+    """
+    header = read_pcd_header(file_path) if file_path.lower().endswith('.pcd') else None
+    if header is not None and bbox is not None and header.data_format in ('binary', 'ascii'):
+        data = structured_to_point_data(read_pcd_bbox(file_path, header, bbox))
+        bbox = None
+    elif header is not None and header.data_format == 'binary':
+        data = structured_to_point_data(memmap_pcd(file_path, header))
+    elif header is not None and header.data_format == 'binary_compressed' and lzf is not None:
+        # Only geometry is kept, so without python-lzf Open3D decodes it faster below
+        data = structured_to_point_data(read_compressed_pcd(file_path, header))
+    elif header is not None and header.data_format == 'ascii':
+        # Tiles already run in parallel; one process per tile is enough
+        data = structured_to_point_data(parse_ascii_pcd(file_path, header, max_workers=1))
+    else:
+        data = PointCloudData.from_open3d(o3d.io.read_point_cloud(file_path))
+    
+    if bbox is not None and len(data) > 0:
+        local_min, local_max = data.to_local(bbox[0]), data.to_local(bbox[1])
+        data = data.select(np.all((data.xyz >= local_min) & (data.xyz <= local_max), axis=1))
+    
+    count = len(data)
+    if max_points == 0:
+        data = data.select(np.empty(0, dtype=np.int64))
+    elif max_points is not None and count > max_points:
+        voxel_size = voxel_size_for_point_budget(data.xyz, max_points, PREVIEW_BUDGET_TOLERANCE)
+        data = downsample_point_cloud(data, voxel_size)
+    return data, count
+
+
+class ColumnStore:
+    """
+    Columnar view of the fields of a PCD body
+    
+    Every field is held as its own contiguous array, read from the source
+    the first time it is requested, so callers only pay for the columns
+    they use. Deletions are tracked as a row selection over the source.
+    """
+    
+    def __init__(self, header: PCDHeader, records: Optional[np.ndarray] = None, body: Optional[bytes] = None):
+        """
+        Args:
+            header: Parsed header of the file
+            records: Row-major structured source (memmap or parsed array)
+            body: Column-major uncompressed body (binary_compressed files)
+        """
+        if records is None and body is None:
+            raise ValueError("ColumnStore needs either records or a column-major body")
+        self.header = header
+        self.dtype = header.dtype
+        self._records = records
+        self._body = body
+        self._columns = {}
+        self._assigned = set()  # Columns given with set(), which the source does not hold
+        self._rows = None  # Surviving source rows after deletions (None = all rows)
+    
+    @property
+    def names(self) -> List[str]:
+        """Field names, without padding fields"""
+        return [n for n in self.dtype.names if not n.startswith('_pad')]
+    
+    def __len__(self) -> int:
+        return self.header.points if self._rows is None else len(self._rows)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.dtype.names
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.get(name)
+    
+    def is_loaded(self, name: str) -> bool:
+        """Check whether a column is already held in memory"""
+        return name in self._columns
+    
+    def get(self, name: str) -> np.ndarray:
+        """Get one column, reading it from the source on first access"""
+        if name not in self._columns:
+            if name not in self.dtype.names:
+                raise KeyError(f"No field '{name}' in point data")
+            self._columns[name] = self._read_column(name)
+        return self._columns[name]
+    
+    def get_many(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """Get several columns, skipping names that are not present"""
+        return {name: self.get(name) for name in names if name in self}
+    
+    def set(self, name: str, values: np.ndarray):
+        """Add or replace a column (e.g. labels computed for every point)"""
+        values = np.ascontiguousarray(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column '{name}' has {len(values)} rows, expected {len(self)}")
+        if name not in self.dtype.names:
+            self.dtype = np.dtype(self.dtype.descr + [(name, values.dtype.str, values.shape[1:])])
+        self._columns[name] = values
+        self._assigned.add(name)
+    
+    def select(self, keep: np.ndarray):
+        """Keep only the given rows (boolean mask or indices over the current rows)"""
+        for name in list(self._columns):
+            self._columns[name] = self._columns[name][keep]
+        if self._rows is None:
+            self._rows = np.flatnonzero(keep) if keep.dtype == bool else np.asarray(keep)
+        else:
+            self._rows = self._rows[keep]
+    
+    def gather(self, name: str, source_rows: np.ndarray) -> np.ndarray:
+        """
+        Values of a column at rows of the source, whatever was selected since
+        
+        Fields of the file are read from the source itself. Columns given with
+        set() only exist for the selected rows, so other rows raise KeyError.
+        """
+        if name not in self._assigned:
+            if name not in self.header.dtype.names:
+                raise KeyError(f"No field '{name}' in point data")
+            return self._source_column(name)[source_rows]
+        if self._rows is None:
+            return self._columns[name][source_rows]
+        position = np.full(self.header.points, -1, dtype=np.int64)
+        position[self._rows] = np.arange(len(self._rows))
+        position = position[source_rows]
+        if np.any(position < 0):
+            raise KeyError(f"Column '{name}' has no values for deleted rows")
+        return self._columns[name][position]
+    
+    def to_structured(self, names: Optional[List[str]] = None) -> np.ndarray:
+        """Gather columns into a row-major structured array for writing"""
+        names = self.names if names is None else names
+        out = np.empty(len(self), dtype=[(n, self.dtype[n]) for n in names])
+        for name in names:
+            out[name] = self.get(name)
+        return out
+    
+    @property
+    def loaded_bytes(self) -> int:
+        """Memory held by columns read so far"""
+        return sum(c.nbytes for c in self._columns.values())
+    
+    @property
+    def resident_bytes(self) -> int:
+        """Memory held by loaded columns and a decompressed body"""
+        return self.loaded_bytes + (len(self._body) if self._body is not None else 0)
+    
+    def copy(self) -> 'ColumnStore':
+        """Independent store sharing the column arrays, which are never modified in place"""
+        other = ColumnStore(self.header, records=self._records, body=self._body)
+        other.dtype = self.dtype
+        other._columns = dict(self._columns)
+        other._assigned = set(self._assigned)
+        other._rows = self._rows
+        return other
+    
+    def _source_column(self, name: str) -> np.ndarray:
+        """Read-only view of a field over every row of the source"""
+        if self._records is not None:
+            return self._records[name]
+        
+        # Column-major body: the field is one contiguous run of bytes
+        field_dtype = self.header.dtype[name]
+        offset = 0
+        for other in self.header.dtype.names:
+            if other == name:
+                break
+            offset += self.header.points * self.header.dtype[other].itemsize
+        count = field_dtype.itemsize // field_dtype.base.itemsize
+        column = np.frombuffer(self._body, dtype=field_dtype.base,
+                               count=self.header.points * count, offset=offset)
+        return column.reshape((self.header.points,) + field_dtype.shape)
+    
+    def _read_column(self, name: str) -> np.ndarray:
+        column = self._source_column(name)
+        if self._rows is not None:
+            return column[self._rows]
+        return np.array(column) if self._records is not None else column
+
+
+class CloudCache:
+    """
+    Memory-bounded LRU of loaded clouds
+    
+    Entries hold the loader state of one file, edits included, keyed by
+    (path, mtime, load mode, variant), where the variant holds the crop,
+    order and deduplication of the cloud. Reopening a file, toggling
+    between preview and full resolution or going back to a recently
+    edited file is then served from memory. The least recently used entries are dropped once
+    their total size exceeds max_bytes.
+    """
+    
+    def __init__(self, max_bytes: int = 4 * 1024 ** 3):
+        """
+        Args:
+            max_bytes: Size bound of all cached clouds together
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (state, nbytes), least recently used first
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @property
+    def total_bytes(self) -> int:
+        """Memory held by the cached clouds"""
+        return sum(nbytes for _, nbytes in self._entries.values())
+    
+    def put(self, key: Tuple, state: Dict[str, Any], nbytes: int):
+        """Store a state as the most recently used entry, evicting old ones to fit"""
+        # Older versions of the same file can never be hit again
+        for stale in [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]:
+            del self._entries[stale]
+        self._entries.pop(key, None)
+        if nbytes > self.max_bytes:
+            logger.info(f"Not caching {key[0]}: {nbytes / (1024*1024):.1f} MB exceeds the cache size")
+            return
+        self._entries[key] = (state, nbytes)
+        while self.total_bytes > self.max_bytes:
+            old_key, (_, old_bytes) = self._entries.popitem(last=False)
+            logger.info(f"Evicted cached cloud {old_key[0]} ({old_bytes / (1024*1024):.1f} MB)")
+    
+    def take(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Remove and return an entry; the loader owns it until it is put back"""
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else None
+    
+    def find(self, path: str, mtime_ns: int) -> List[Tuple[Tuple, Dict[str, Any]]]:
+        """Entries of one version of a file in any load mode, most recent first"""
+        return [(key, state) for key, (state, _) in reversed(self._entries.items())
+                if key[0] == path and key[1] == mtime_ns]
+    
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+
 
 class PointCloudLoader:
     """Class for loading and saving point cloud data"""
     
-    def __init__(self):
-        self.point_cloud = None
-        # self.original_points = None
-        self.metadata = {}
+    def __init__(self):
+        self.cloud = None           # PointCloudData on display (the preview when downsampled)
+        self.original_cloud = None  # Full-resolution PointCloudData behind a preview
+        self.point_cloud = None     # Open3D copy of self.cloud, built by get_point_cloud()
+        self.point_data = None    # Structured view of the file body (memmap for binary PCD)
+        self.columns = None       # Per-field columns of the full-resolution data
+        self.header = None
+        self.metadata = {}
+        self.lod_cache = LODCache()
+        self.memory_cache = CloudCache()
+        self._cache_key = None    # CloudCache key of the loaded file
+        self.lod_manifest = None  # Pyramid of the current file when a preview came from the LOD cache
+        self.preview_inverse = None  # int32 preview point of every full-resolution point
+        self.deleted = None       # Tombstones over self.cloud rows, dropped on the next compact()
+        self._live_cloud = None   # Live points of self.cloud while deletions are pending
+        self._local_bounds = None  # (min, max) of the live points in the float32 frame of self.cloud
+        self._preview_request = (False, 0, 'budget')
+        self._use_lod_cache = False
+        self._deferred_source = None  # (path, header) opened only when full-resolution data is needed
+        self.tile_store = None    # TileStore the current region was read from
+        self.region = None        # StoreRegion of the loaded tiles
+        self._reorder = False
+        self._dedup = (None, False)  # (tolerance, keep counts) of duplicate removal at ingest
+    
+    def load_pcd(self, file_path: str, downsample_for_preview: bool = True, max_points_preview: int = 1000000,
+                 use_lod_cache: bool = False, preview_method: str = 'budget',
+                 use_memory_cache: bool = True, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                 reorder: bool = False, dedup_tolerance: Optional[float] = None,
+                 dedup_counts: bool = False) -> bool:
+        """
+        Load PCD file with optional downsampling for large files
+        
+        Binary PCD files are memory-mapped, ASCII files are parsed in parallel
+        and binary_compressed files are LZF-decoded column by column into a
+        structured array; the PointCloudData is built on the first call to
+        get_point_data() and an Open3D cloud only if get_point_cloud() asks.
+        
+        Args:
+            file_path: Path to PCD file
+            downsample_for_preview: Whether to downsample large files for faster loading
+            max_points_preview: Maximum points to keep for preview (if downsampling)
+            use_lod_cache: Show the preview from the sidecar LOD pyramid when one exists,
+                and build the pyramid after the first full read otherwise
+            preview_method: "budget" searches the voxel size that keeps max_points_preview
+                points within PREVIEW_BUDGET_TOLERANCE; "volume" derives it from the
+                bounding-box volume, which is cheaper but far off on sparse maps
+            use_memory_cache: Serve the file from the in-process CloudCache when it
+                holds it (edits included); False always reads the file again
+            bbox: Optional (min_bound, max_bound) in world coordinates; only the
+                points inside are loaded, and for PCD files a block index built
+                on first use lets blocks outside the box be skipped unread
+            reorder: Sort the points along a 3D Morton curve so that neighbour
+                searches touch memory sequentially; every point keeps its file
+                row (ROW_ATTRIBUTE) and save_pcd() writes file order back
+            dedup_tolerance: Merge points that fall in the same cell of this size
+                (e.g. 0.001 for sub-millimetre duplicates of merged scans), keeping
+                the first point of each cell; None keeps every point
+            dedup_counts: Give the kept points a dup_count attribute with the
+                number of points each one stands for, for weighted density
+        """
+        try:
+            file_path = Path(file_path)
+            if not file_path.exists():
+                logger.error(f"File not found: {file_path}")
+                return False
+
+            logger.info(f"Loading PCD file: {file_path}")
+            t0 = time.perf_counter()
+            
+            self._reset_state()
+            self._preview_request = (downsample_for_preview, max_points_preview, preview_method)
+            # A pyramid is only built from, and only describes, the whole file
+            self._use_lod_cache = use_lod_cache and downsample_for_preview and bbox is None
+            self._reorder = reorder
+            self._dedup = (dedup_tolerance, dedup_counts)
+            
+            mode = ('preview', max_points_preview, preview_method) if downsample_for_preview else ('full',)
+            # Everything that changes the full-resolution cloud itself
+            region = tuple(np.concatenate([bbox[0], bbox[1]]).tolist()) if bbox is not None else None
+            variant = (region, reorder, dedup_tolerance, dedup_counts and dedup_tolerance is not None)
+            key = (str(file_path.resolve()), file_path.stat().st_mtime_ns, mode, variant)
+            if use_memory_cache and self._restore_state(key):
+                logger.info(f"Served from memory in {time.perf_counter()-t0:.3f}s - "
+                            f"showing {self.metadata['num_points']:,} points")
+                return True
+            
+            success = self._load_from_disk(file_path, t0, bbox)
+            self._cache_key = key if success and use_memory_cache else None
+            return success
+
+        except Exception as e:
+            logger.error(f"Error loading PCD file: {e}")
+            return False
+    
+    def _load_from_disk(self, file_path: Path, t0: float,
+                        bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> bool:
+        """Read a file (or the part of it inside bbox) with the native PCD readers or Open3D"""
+        max_points_preview = self._preview_request[1]
+        header = read_pcd_header(str(file_path)) if file_path.suffix.lower() == '.pcd' else None
+        if header is not None and header.data_format in ('binary', 'ascii', 'binary_compressed'):
+            if self._use_lod_cache and header.points > max_points_preview:
+                manifest = self.lod_cache.lookup(str(file_path))
+                if manifest is not None:
+                    return self._open_from_lod(file_path, header, manifest, t0)
+            if not (header.data_format == 'binary_compressed' and lzf_through_open3d(header.fields)):
+                return self._open_native(file_path, header, t0, bbox)
+            # Without python-lzf, Open3D decodes the body faster than the pure Python codec
+        
+        # Load the point cloud
+        pc = o3d.io.read_point_cloud(str(file_path))
+        t1 = time.perf_counter()
+        logger.info(f"Initial load: {t1-t0:.3f}s")
+
+        if len(pc.points) == 0:
+            logger.error("No points found in the file")
+            return False
+
+        self.metadata = {'file_path': str(file_path)}
+        data = PointCloudData.from_open3d(pc)
+        del pc
+        if bbox is not None:
+            self.metadata['bbox'] = [list(map(float, bbox[0])), list(map(float, bbox[1]))]
+            local_min, local_max = data.to_local(bbox[0]), data.to_local(bbox[1])
+            data = data.select(np.all((data.xyz >= local_min) & (data.xyz <= local_max), axis=1))
+            if len(data) == 0:
+                logger.error("No points inside the bounding box")
+                return False
+        self._set_loaded_cloud(data)
+
+        total_time = time.perf_counter() - t0
+        logger.info(f"Successfully loaded in {total_time:.3f}s - showing {self.metadata['num_points']:,} points")
+        return True
+    
+    def _reset_state(self):
+        """Forget the loaded file, keeping it in the memory cache in case it is opened again"""
+        self._stash_state()
+        for name in LOADER_STATE_ATTRIBUTES:
+            setattr(self, name, None)
+        self.metadata = {}
+        self.point_cloud = None
+        self.deleted = None
+    
+    def _stash_state(self):
+        """Put the loaded file, with its edits, into the memory cache"""
+        if self._cache_key is None or (self.cloud is None and self.columns is None):
+            return
+        if self.deleted is not None:
+            self.compact()
+        state = {name: getattr(self, name) for name in LOADER_STATE_ATTRIBUTES}
+        self.memory_cache.put(self._cache_key, state, self._state_bytes())
+        self._cache_key = None
+    
+    def _restore_state(self, key: Tuple) -> bool:
+        """
+        Install a file from the memory cache
+        
+        An entry in the requested mode is used as is. Otherwise the
+        full-resolution cloud of an entry in the other mode is reused, and
+        only the preview (if one is wanted) is computed again.
+        """
+        state = self.memory_cache.take(key)
+        if state is not None:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self._cache_key = key
+            return True
+        
+        for other_key, other in self.memory_cache.find(key[0], key[1]):
+            if other_key[3] != key[3]:
+                continue  # Cropped, reordered or deduplicated differently: a different cloud
+            metadata = other['metadata']
+            full = other['original_cloud'] if metadata.get('is_downsampled') else other['cloud']
+            if full is None:
+                continue
+            
+            # The entry stays cached, so nothing it holds may be modified from here on
+            self.columns = other['columns'].copy() if other['columns'] is not None else None
+            self.header = other['header']
+            self.point_data = other['point_data']
+            self.metadata = {k: metadata[k] for k in ('file_path', 'fields', 'data_format', 'dedup_tolerance',
+                                                      'points_before_dedup', 'duplicates_removed') if k in metadata}
+            self.metadata['is_materialized'] = True
+            self._use_lod_cache = False  # The cached cloud may hold edits the sidecar must not see
+            self._set_loaded_cloud(full, ingest=False)
+            self._cache_key = key
+            return True
+        return False
+    
+    def _state_bytes(self) -> int:
+        """Memory held by the loaded file (memory-mapped data is not counted)"""
+        total = sum(c.nbytes for c in (self.cloud, self.original_cloud) if c is not None)
+        if self.preview_inverse is not None:
+            total += self.preview_inverse.nbytes
+        if self.point_data is not None and not isinstance(self.point_data, np.memmap):
+            total += self.point_data.nbytes
+        if self.columns is not None:
+            total += self.columns.resident_bytes
+        return total
     
-    def load_pcd(self, file_path: str, downsample_for_preview: bool = True, max_points_preview: int = 1000000) -> bool:
+    def load_directory(self, directory: str, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                       pattern: str = "*.pcd", **kwargs) -> bool:
         """
-        Load PCD file with optional downsampling for large files
+        Load a map stored as a directory of tiles into one cloud
         
         Args:
-            file_path: Path to PCD file
-            downsample_for_preview: Whether to downsample large files for faster loading
-            max_points_preview: Maximum points to keep for preview (if downsampling)
+            directory: Directory holding the tiles
+            bbox: Optional (min_bound, max_bound) in world coordinates to load
+            pattern: Glob pattern of tile file names
+            **kwargs: Passed on to load_tiles()
+            
+        Returns:
+            bool: True if at least one point was loaded
+        """
+        paths = sorted(str(p) for p in Path(directory).glob(pattern) if p.is_file())
+        if not paths:
+            logger.error(f"No tiles matching {pattern} in {directory}")
+            return False
+        return self.load_tiles(paths, bbox, source=str(directory), **kwargs)
+    
+    def load_tiles(self, paths: List[str], bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                   downsample_for_preview: bool = True, max_points_preview: int = 1000000,
+                   max_workers: Optional[int] = None, use_processes: bool = False,
+                   source: Optional[str] = None) -> bool:
+        """
+        Load several map files (e.g. tiles found by a MapCatalog query) into one cloud
+        
+        Tiles are read concurrently, cropped and (for a preview) downsampled
+        in the workers, then merged into one PointCloudData with a tile_id
+        attribute giving the index of each point's tile in metadata['tiles'].
+        The preview budget is shared out by the point counts in the headers;
+        tiles without a readable PCD header are counted by their file size.
+        
+        Args:
+            paths: Tile files
+            bbox: Optional (min_bound, max_bound) in world coordinates to load
+            downsample_for_preview: Whether to downsample each tile for the preview
+            max_points_preview: Maximum points of the merged preview
+            max_workers: Number of concurrent tile reads (CPU count if None)
+            use_processes: Read in worker processes instead of threads, for ASCII
+                tiles or when per-tile downsampling dominates
+            source: What the tiles were taken from, recorded as metadata['file_path']
+            
+        Returns:
+            bool: True if at least one point was loaded
         """
         try:
-            file_path = Path(file_path)
-            if not file_path.exists():
-                logger.error(f"File not found: {file_path}")
-                return False
-
-            logger.info(f"Loading PCD file: {file_path}")
             t0 = time.perf_counter()
+            paths = [str(p) for p in paths]
+            if not paths:
+                logger.error("No tiles to load")
+                return False
+            
+            self._reset_state()
+            self._preview_request = (False, 0, 'budget')
+            self._use_lod_cache = False
             
-            # Load the point cloud
-            pc = o3d.io.read_point_cloud(str(file_path))
+            budgets = [None] * len(paths)
+            if downsample_for_preview:
+                probes = self.probe_many([p for p in paths if p.lower().endswith('.pcd')])
+                sizes = [os.path.getsize(p) for p in paths]
+                probed = [i for i, p in enumerate(paths) if probes.get(p)]
+                probed_points = sum(probes[paths[i]]['points'] for i in probed)
+                point_bytes = (sum(sizes[i] for i in probed) / probed_points if probed_points
+                               else ESTIMATED_POINT_BYTES)
+                counts = [probes[p]['points'] if probes.get(p) else size / point_bytes
+                          for p, size in zip(paths, sizes)]
+                if sum(counts) > max_points_preview:
+                    budgets = split_point_budget(max_points_preview, counts)
+            
+            max_workers = max_workers or os.cpu_count() or 1
+            if use_processes:
+                executor = ProcessPoolExecutor(max_workers=max_workers,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            else:
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+            with executor:
+                results = list(executor.map(read_tile, paths, [bbox] * len(paths), budgets))
             t1 = time.perf_counter()
-            logger.info(f"Initial load: {t1-t0:.3f}s")
-
-            if len(pc.points) == 0:
-                logger.error("No points found in the file")
+            
+            merged = self._merge_tiles([tile for tile, _ in results])
+            if merged is None:
+                logger.error("No points found in the tiles")
                 return False
-
-            original_count = len(pc.points)
-            logger.info(f"Original point count: {original_count:,}")
             
-            # Downsample if file is too large
-            if downsample_for_preview and original_count > max_points_preview:
-                logger.info(f"Downsampling from {original_count:,} to ~{max_points_preview:,} points for faster visualization")
-                
-                # Calculate voxel size for downsampling
+            original_count = sum(count for _, count in results)
+            is_downsampled = len(merged) < original_count
+            self.cloud = merged
+            self.metadata = {
+                'file_path': source if source is not None else os.path.commonpath(paths),
+                'tiles': paths,
+                'num_points': len(merged),
+                'original_num_points': original_count,
+                'is_downsampled': is_downsampled,
+                'downsample_ratio': len(merged) / original_count,
+                'has_colors': merged.colors is not None,
+                'has_normals': merged.normals is not None,
+                'resident_bytes': merged.nbytes,
+                'bounds': None  # compute on demand
+            }
+            logger.info(f"Read {len(paths)} tiles in {t1-t0:.3f}s, merged {len(merged):,} points "
+                        f"in {time.perf_counter()-t1:.3f}s")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error loading tiles: {e}")
+            return False
+    
+    def load_region(self, store, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> bool:
+        """
+        Load the tiles of a TileStore that touch a box for editing
+        
+        Whole tiles are loaded at full resolution; edits made through
+        remove_points(), set_points() and friends go back to the store with
+        save_region().
+        
+        Args:
+            store: TileStore to read from
+            bbox: Optional (min_bound, max_bound) in world coordinates (the whole store if None)
+            
+        Returns:
+            bool: True if the region holds points
+        """
+        try:
+            t0 = time.perf_counter()
+            self._reset_state()
+            self._preview_request = (False, 0, 'budget')
+            self._use_lod_cache = False
+            
+            data, region = store.read_region(bbox)
+            if len(data) == 0:
+                logger.error("No points in the requested region")
+                return False
+            
+            self.cloud = data
+            self.tile_store = store
+            self.region = region
+            self.metadata = {
+                'file_path': str(store.root),
+                'region_tiles': list(region.keys),
+                'num_points': len(data),
+                'original_num_points': len(data),
+                'is_downsampled': False,
+                'downsample_ratio': 1.0,
+                'has_colors': data.colors is not None,
+                'has_normals': data.normals is not None,
+                'resident_bytes': data.nbytes,
+                'bounds': None  # compute on demand
+            }
+            logger.info(f"Loaded {len(data):,} points from {len(region.keys)} tiles "
+                        f"in {time.perf_counter()-t0:.3f}s")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error loading tile store region: {e}")
+            return False
+    
+    def save_region(self, point_cloud: Optional[PointCloudData] = None) -> bool:
+        """
+        Write the edited region back into its TileStore
+        
+        Only the tiles the region touches (and tiles that moved points now
+        fall in) are rewritten.
+        
+        Args:
+            point_cloud: Edited points of the region (the loaded cloud if None)
+            
+        Returns:
+            bool: True if successful
+        """
+        if self.tile_store is None or self.region is None:
+            logger.error("No tile store region loaded")
+            return False
+        
+        try:
+            if point_cloud is None:
+                self.compact()
+            data = self.get_point_data() if point_cloud is None else as_point_data(point_cloud)
+            spilled = self.tile_store.write_region(self.region, data)
+            written = self.tile_store.flush()
+            
+            if spilled:
+                # Those tiles now also hold points the region never loaded; take them in
+                # so the next save does not drop them
+                self.cloud, self.region = self.tile_store.read_tiles(self.region.keys + spilled, self.region.bbox)
+                self.point_cloud = None
+                self._local_bounds = None
+                self.metadata.update({'region_tiles': list(self.region.keys), 'num_points': len(self.cloud),
+                                      'original_num_points': len(self.cloud), 'bounds': None})
+                logger.info(f"Region grew by {len(spilled)} tiles that edited points moved into")
+            logger.info(f"Saved region: {written} tiles written")
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error saving tile store region: {e}")
+            return False
+    
+    def _merge_tiles(self, tiles: List[PointCloudData]) -> Optional[PointCloudData]:
+        """Concatenate tiles into one container with a tile_id attribute"""
+        if sum(len(t) for t in tiles) == 0:
+            return None
+        dtype = np.uint16 if len(tiles) <= np.iinfo(np.uint16).max else np.uint32
+        for i, tile in enumerate(tiles):
+            tile.attributes = {'tile_id': np.full(len(tile), i, dtype=dtype)}
+        return concatenate(tiles)
+    
+    def _open_native(self, file_path: Path, header: PCDHeader, t0: float,
+                     bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> bool:
+        """Read a PCD body with the native readers and defer building the Open3D cloud"""
+        file_points = header.points
+        if bbox is not None:
+            self.point_data = read_pcd_bbox(str(file_path), header, bbox)
+            # The loaded records behave like a file holding just the crop
+            header = replace(header, points=len(self.point_data), width=len(self.point_data), height=1)
+            self.columns = ColumnStore(header, records=self.point_data)
+        elif header.data_format == 'binary':
+            self.point_data = memmap_pcd(str(file_path), header)
+            self.columns = ColumnStore(header, records=self.point_data)
+        elif header.data_format == 'binary_compressed':
+            # Columns are sliced straight out of the decompressed body
+            self.columns = ColumnStore(header, body=read_compressed_body(str(file_path), header))
+        else:
+            self.point_data = parse_ascii_pcd(str(file_path), header)
+            self.columns = ColumnStore(header, records=self.point_data)
+        self.header = header
+        
+        if header.points == 0:
+            logger.error("No points found inside the bounding box" if bbox is not None else "No points found in the file")
+            self.point_data = None
+            self.columns = None
+            return False
+        
+        names = self.columns.names
+        self.metadata = {
+            'num_points': header.points,
+            'original_num_points': header.points,
+            'is_downsampled': False,
+            'downsample_ratio': 1.0,
+            'has_colors': 'rgb' in names or 'rgba' in names,
+            'has_normals': 'normal_x' in names,
+            'file_path': str(file_path),
+            'bounds': None,  # compute on demand
+            'fields': list(header.fields),
+            'data_format': header.data_format,
+            'is_materialized': False
+        }
+        if bbox is not None:
+            self.metadata['bbox'] = [list(map(float, bbox[0])), list(map(float, bbox[1]))]
+            self.metadata['file_num_points'] = file_points
+        
+        logger.info(f"Opened {header.points:,} {header.data_format} points ({', '.join(header.fields)}) "
+                    f"in {time.perf_counter() - t0:.3f}s")
+        return True
+    
+    def _open_from_lod(self, file_path: Path, header: PCDHeader, manifest: Dict[str, Any], t0: float) -> bool:
+        """Show a cached pyramid level as the preview; the file itself is opened on demand"""
+        self.header = header
+        self.lod_manifest = manifest
+        self._deferred_source = (file_path, header)
+        self.metadata = {
+            'file_path': str(file_path),
+            'fields': list(header.fields),
+            'data_format': header.data_format,
+            'is_materialized': True,
+            'lod_levels': len(manifest['levels'])
+        }
+        self.set_lod_level(self.lod_cache.pick_level(manifest, self._preview_request[1]))
+        
+        logger.info(f"Preview served from LOD cache in {time.perf_counter() - t0:.3f}s")
+        return True
+    
+    def set_lod_level(self, level: int, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> bool:
+        """
+        Replace the displayed preview with another level of the cached pyramid
+        
+        Args:
+            level: Pyramid level (0 is the finest)
+            bbox: Optional (min_bound, max_bound) to stream only a region of a fine level
+            
+        Returns:
+            bool: True if the level was loaded
+        """
+        if self.lod_manifest is None:
+            logger.error("No LOD pyramid for the current file")
+            return False
+        
+        data = self.lod_cache.load_level(self.lod_manifest, level, bbox)
+        
+        original_count = self.lod_manifest['original_num_points']
+        self.cloud = data
+        self.point_cloud = None
+        self.preview_inverse = None
+        self.deleted = None
+        self._local_bounds = None
+        self.metadata.update({
+            'num_points': len(data),
+            'original_num_points': original_count,
+            'is_downsampled': True,
+            'downsample_ratio': len(data) / original_count,
+            'has_colors': data.colors is not None,
+            'has_normals': False,
+            'bounds': None,  # compute on demand
+            'lod_level': level,
+            'lod_voxel_size': self.lod_manifest['levels'][level]['voxel_size']
+        })
+        logger.info(f"Showing LOD level {level}: {len(data):,} points")
+        return True
+    
+    def _ensure_full_source(self):
+        """Open the file natively if the preview came from the LOD cache"""
+        if self.columns is None and self._deferred_source is not None:
+            file_path, header = self._deferred_source
+            self._deferred_source = None
+            metadata = self.metadata
+            cloud = self.cloud
+            self._open_native(file_path, header, time.perf_counter())
+            # Keep describing the cached preview that is on display
+            self.metadata, self.cloud = metadata, cloud
+    
+    def _materialize(self):
+        """Build the point container from the natively read PCD columns"""
+        t0 = time.perf_counter()
+        data = structured_to_point_data(self.columns)
+        logger.info(f"Built float32 point container from mapped data: {time.perf_counter()-t0:.3f}s")
+        self._set_loaded_cloud(data)
+        self.metadata['is_materialized'] = True
+    
+    def _set_loaded_cloud(self, data: PointCloudData, ingest: bool = True):
+        """Install a freshly read cloud, downsampling it for preview if requested"""
+        if ingest:
+            data = self._ingest(data)
+        downsample_for_preview, max_points_preview, preview_method = self._preview_request
+        original_count = len(data)
+        self.point_cloud = None
+        self.deleted = None
+        self._local_bounds = None
+        logger.info(f"Original point count: {original_count:,}")
+        
+        # Downsample if file is too large
+        if downsample_for_preview and original_count > max_points_preview:
+            logger.info(f"Downsampling from {original_count:,} to ~{max_points_preview:,} points for faster visualization")
+            
+            # Calculate voxel size for downsampling; voxel counts do not depend on the origin
+            points = data.xyz
+            t2 = time.perf_counter()
+            if preview_method == 'budget':
+                voxel_size = voxel_size_for_point_budget(points, max_points_preview, PREVIEW_BUDGET_TOLERANCE)
+            elif preview_method == 'volume':
                 # Use approximate voxel size to get desired number of points
-                points = np.asarray(pc.points)
                 bbox_size = points.max(axis=0) - points.min(axis=0)
                 total_volume = np.prod(bbox_size)
                 target_density = max_points_preview / total_volume
                 voxel_size = (1.0 / target_density) ** (1/3)
-                
-                # Apply voxel downsampling
-                t2 = time.perf_counter()
-                pc_downsampled = pc.voxel_down_sample(voxel_size)
-                t3 = time.perf_counter()
-                
-                logger.info(f"Downsampling: {t3-t2:.3f}s, reduced to {len(pc_downsampled.points):,} points")
-                self.point_cloud = pc_downsampled
-                self.original_points = pc  # Store original for later use
-                
-                # Mark as downsampled in metadata
-                self.metadata = {
-                    'num_points': len(self.point_cloud.points),
-                    'original_num_points': original_count,
-                    'is_downsampled': True,
-                    'downsample_ratio': len(self.point_cloud.points) / original_count,
-                    'has_colors': len(self.point_cloud.colors) > 0,
-                    'has_normals': len(self.point_cloud.normals) > 0,
-                    'file_path': str(file_path),
-                    'bounds': None  # compute on demand
-                }
             else:
-                self.point_cloud = pc
-                self.original_points = None
-                
-                self.metadata = {
-                    'num_points': len(self.point_cloud.points),
-                    'original_num_points': original_count,
-                    'is_downsampled': False,
-                    'downsample_ratio': 1.0,
-                    'has_colors': len(self.point_cloud.colors) > 0,
-                    'has_normals': len(self.point_cloud.normals) > 0,
-                    'file_path': str(file_path),
-                    'bounds': None  # compute on demand
-                }
-
-            total_time = time.perf_counter() - t0
-            logger.info(f"Successfully loaded in {total_time:.3f}s - showing {self.metadata['num_points']:,} points")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error loading PCD file: {e}")
-            return False
+                raise ValueError(f"Unknown preview method: {preview_method}")
+            
+            # Apply voxel downsampling, remembering the voxel of every original point
+            preview = self._voxel_preview(data, voxel_size)
+            t3 = time.perf_counter()
+            
+            logger.info(f"Downsampling ({preview_method}): {t3-t2:.3f}s, voxel {voxel_size:.3f}, "
+                        f"reduced to {len(preview):,} points")
+            self.metadata['preview_voxel_size'] = voxel_size
+            self.cloud = preview
+            self.original_cloud = data  # Store original for later use
+            
+            if self._use_lod_cache and self.metadata.get('file_path'):
+                try:
+                    self.lod_manifest = self.lod_cache.build(
+                        self.metadata['file_path'], data.xyz, data.colors, origin=data.origin)
+                except OSError as e:
+                    logger.warning(f"Could not write LOD cache: {e}")
+        else:
+            self.cloud = data
+            self.original_cloud = None
+        
+        # Mark as downsampled in metadata
+        is_downsampled = self.original_cloud is not None
+        self.metadata.update({
+            'num_points': len(self.cloud),
+            'original_num_points': original_count,
+            'is_downsampled': is_downsampled,
+            'downsample_ratio': len(self.cloud) / original_count if is_downsampled else 1.0,
+            'has_colors': self.cloud.colors is not None,
+            'has_normals': self.cloud.normals is not None,
+            'resident_bytes': data.nbytes + (self.cloud.nbytes if is_downsampled else 0),
+            'bounds': None  # compute on demand
+        })
 
     
-    def save_pcd(self, file_path: str, point_cloud: Optional[o3d.geometry.PointCloud] = None) -> bool:
+    def _ingest(self, data: PointCloudData) -> PointCloudData:
+        """
+        Apply the requested duplicate removal and Morton reorder to a freshly read cloud
+        
+        The column store follows every step, and the ROW_ATTRIBUTE of every
+        remaining point keeps its file row when anything was moved or when
+        the file has fields the container does not hold.
+        """
+        rows = None
+        tolerance, keep_counts = self._dedup
+        if tolerance is not None:
+            t0 = time.perf_counter()
+            rows, counts = unique_point_rows(data.xyz, tolerance)
+            removed = len(data) - len(rows)
+            if removed > 0:
+                if self.columns is not None and len(self.columns) == len(data):
+                    self.columns.select(rows)
+                data = data.select(rows)
+            else:
+                rows = None
+            if keep_counts:
+                data.attributes[COUNT_ATTRIBUTE] = counts.astype(np.uint32)
+            self.metadata.update({
+                'dedup_tolerance': tolerance,
+                'points_before_dedup': len(data) + removed,
+                'duplicates_removed': removed
+            })
+            logger.info(f"Removed {removed:,} duplicate points ({removed / max(len(data) + removed, 1):.1%}) "
+                        f"at {tolerance} m in {time.perf_counter()-t0:.3f}s")
+        
+        if self._reorder:
+            t0 = time.perf_counter()
+            order = morton_order(data.xyz)
+            if self.columns is not None and len(self.columns) == len(data):
+                self.columns.select(order)
+            data = data.select(order)
+            rows = order if rows is None else rows[order]
+            logger.info(f"Morton reorder of {len(data):,} points: {time.perf_counter()-t0:.3f}s")
+        
+        # Copies and subsets of the cloud (the viewer's, the editor's) find the file order
+        # and the fields left on disk through the file row of every point when they are saved
+        if rows is not None or self._disk_only_fields():
+            rows = np.arange(len(data)) if rows is None else rows
+            data.attributes[ROW_ATTRIBUTE] = rows.astype(np.uint32 if len(rows) == 0 or rows.max() < 2**32
+                                                         else np.int64)
+        return data
+    
+    def probe(self, file_path: str) -> Dict[str, Any]:
+        """
+        Describe a PCD file from its header alone, without reading any points
+        
+        Args:
+            file_path: Path to PCD file
+            
+        Returns:
+            Dictionary with fields, types, point count, data format, viewpoint
+            and the byte layout of the file
+        """
+        file_path = Path(file_path)
+        header = read_pcd_header(str(file_path))
+        file_size = file_path.stat().st_size
+        
+        info = asdict(header)
+        info.update({
+            'file_path': str(file_path),
+            'file_size': file_size,
+            'mtime': file_path.stat().st_mtime,
+            'point_step': header.point_step,
+            'data_size': file_size - header.data_offset,
+            'uncompressed_size': header.points * header.point_step,
+        })
+        
+        if header.data_format == 'binary_compressed':
+            with open(file_path, 'rb') as f:
+                f.seek(header.data_offset)
+                compressed_size, uncompressed_size = struct.unpack('<II', f.read(8))
+            info['compressed_size'] = compressed_size
+            info['uncompressed_size'] = uncompressed_size
+        
+        return info
+    
+    def probe_many(self, file_paths: List[str], max_workers: int = 16) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Probe many PCD files concurrently
+        
+        Header reads are small and I/O bound, so a thread pool is enough to
+        catalogue thousands of files quickly.
+        
+        Args:
+            file_paths: Paths to PCD files
+            max_workers: Number of concurrent header reads
+            
+        Returns:
+            Dictionary mapping each path to its probe info, or None if it could not be read
+        """
+        def safe_probe(path):
+            try:
+                return self.probe(path)
+            except Exception as e:
+                logger.warning(f"Could not probe {path}: {e}")
+                return None
+        
+        file_paths = [str(p) for p in file_paths]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = dict(zip(file_paths, executor.map(safe_probe, file_paths)))
+        
+        total_points = sum(r['points'] for r in results.values() if r is not None)
+        logger.info(f"Probed {len(file_paths)} files ({total_points:,} points) in {time.perf_counter()-t0:.3f}s")
+        return results
+    
+    def probe_directory(self, directory: str, pattern: str = "*.pcd", recursive: bool = False,
+                        max_workers: int = 16) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Probe every PCD file in a directory
+        
+        Args:
+            directory: Directory to scan
+            pattern: Glob pattern for file names
+            recursive: Whether to descend into subdirectories
+            max_workers: Number of concurrent header reads
+            
+        Returns:
+            Dictionary mapping each path to its probe info, or None if it could not be read
+        """
+        directory = Path(directory)
+        paths = sorted(directory.rglob(pattern) if recursive else directory.glob(pattern))
+        return self.probe_many([p for p in paths if p.is_file()], max_workers)
+    
+    def _voxel_preview(self, data: PointCloudData, voxel_size: float) -> PointCloudData:
+        """Voxel-downsample a cloud for preview and store the inverse index map"""
+        centroids, self.preview_inverse, counts = voxel_downsample_with_inverse(data.xyz, voxel_size)
+        
+        colors = normals = None
+        if data.colors is not None:
+            colors = np.round(voxel_average(data.colors, self.preview_inverse, counts)).astype(np.uint8)
+        if data.normals is not None:
+            normals = voxel_average(data.normals, self.preview_inverse, counts)
+            normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-12)
+        return PointCloudData(centroids, data.origin, colors, normals)
+    
+    def _ensure_preview_inverse(self) -> Optional[np.ndarray]:
+        """Get the preview inverse map, deriving it for LOD-cache previews"""
+        # Preview selections are rows of get_point_data(), which are the rows after compaction
+        self.compact()
+        if self.preview_inverse is None and self.is_downsampled():
+            original = self.get_original_point_data()
+            if original is None:
+                return None
+            # Cached pyramid levels are built level on level, so the voxel of a full
+            # point is not recorded; its nearest preview point is the equivalent
+            from scipy.spatial import cKDTree
+            tree = cKDTree(self.cloud.xyz)
+            shift = (original.origin - self.cloud.origin).astype(np.float32)
+            _, nearest = tree.query(original.xyz + shift, workers=-1)
+            self.preview_inverse = nearest.astype(np.int32)
+        return self.preview_inverse
+    
+    def preview_to_full_mask(self, preview_selection: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Expand a selection on the preview to the full-resolution cloud
+        
+        Args:
+            preview_selection: Preview point indices or a boolean mask over the preview
+            
+        Returns:
+            Boolean mask over the full-resolution points, or None if not downsampled
+        """
+        inverse = self._ensure_preview_inverse()
+        if inverse is None:
+            return None
+        preview_selection = np.asarray(preview_selection)
+        if preview_selection.dtype != bool:
+            mask = np.zeros(len(self.cloud), dtype=bool)
+            mask[preview_selection] = True
+            preview_selection = mask
+        return preview_selection[inverse]
+    
+    def map_preview_labels(self, preview_labels: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Transfer per-point labels computed on the preview to every full-resolution point
+        
+        Args:
+            preview_labels: One label per preview point
+            
+        Returns:
+            One label per full-resolution point, or None if not downsampled
+        """
+        inverse = self._ensure_preview_inverse()
+        return None if inverse is None else np.asarray(preview_labels)[inverse]
+    
+    def get_full_resolution_cloud(self, exclude_preview_indices: Optional[np.ndarray] = None) -> Optional[PointCloudData]:
+        """
+        Get the full-resolution cloud with deletions made on the preview applied
+        
+        Args:
+            exclude_preview_indices: Preview points (rows of get_point_data()) whose voxels
+                should be left out
+            
+        Returns:
+            Full-resolution PointCloudData (the current cloud if not downsampled)
+        """
+        if not self.is_downsampled():
+            return self.get_point_data()
+        original = self.get_original_point_data()
+        if exclude_preview_indices is None or len(exclude_preview_indices) == 0:
+            return original
+        
+        removed = self.preview_to_full_mask(exclude_preview_indices)
+        logger.info(f"Removing {np.count_nonzero(removed):,} full-resolution points "
+                    f"behind {len(exclude_preview_indices):,} preview points")
+        return original.select(~removed)
+    
+    def iter_chunks(self, file_path: str, chunk_points: int = 1000000):
+        """
+        Stream a PCD file as fixed-size blocks of points
+        
+        Only one block is held at a time for ASCII and binary files, so
+        height filters, voxel downsampling or statistics can run over files
+        larger than RAM. binary_compressed bodies are a single LZF block and
+        have to be decompressed as a whole before blocks can be cut from it.
+        
+        Args:
+            file_path: Path to PCD file
+            chunk_points: Number of points per block (the last one may be shorter)
+            
+        Yields:
+            Structured numpy arrays with one record per point
+        """
+        file_path = str(file_path)
+        header = read_pcd_header(file_path)
+        
+        if header.data_format == 'binary':
+            data = memmap_pcd(file_path, header)
+            for start in range(0, header.points, chunk_points):
+                yield np.array(data[start:start + chunk_points])
+            del data
+        
+        elif header.data_format == 'binary_compressed':
+            body = read_compressed_body(file_path, header)
+            for start in range(0, header.points, chunk_points):
+                yield columns_to_structured(body, header, start, min(start + chunk_points, header.points))
+        
+        elif header.data_format == 'ascii':
+            dtype = header.dtype
+            with open(file_path, 'rb') as f:
+                f.seek(header.data_offset)
+                remaining = header.points
+                while remaining > 0:
+                    lines = list(itertools.islice(f, min(chunk_points, remaining)))
+                    if not lines:
+                        break
+                    values = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+                    remaining -= len(values)
+                    yield rows_to_structured(values, dtype)
+        
+        else:
+            raise ValueError(f"Unsupported PCD data format: {header.data_format}")
+    
+    def scan_statistics(self, file_path: str, chunk_points: int = 1000000) -> Dict[str, Any]:
+        """
+        Compute point count, bounds and centroid of a PCD file in one streaming pass
+        
+        Args:
+            file_path: Path to PCD file
+            chunk_points: Number of points per streamed block
+            
+        Returns:
+            Dictionary with num_points, min, max and mean
+        """
+        count = 0
+        total = np.zeros(3)
+        min_bound = np.full(3, np.inf)
+        max_bound = np.full(3, -np.inf)
+        
+        for chunk in self.iter_chunks(file_path, chunk_points):
+            xyz = np.column_stack([chunk['x'], chunk['y'], chunk['z']]).astype(np.float64)
+            finite = np.isfinite(xyz).all(axis=1)
+            xyz = xyz[finite]
+            if len(xyz) == 0:
+                continue
+            count += len(xyz)
+            total += xyz.sum(axis=0)
+            min_bound = np.minimum(min_bound, xyz.min(axis=0))
+            max_bound = np.maximum(max_bound, xyz.max(axis=0))
+        
+        return {
+            'num_points': count,
+            'min': tuple(min_bound),
+            'max': tuple(max_bound),
+            'mean': tuple(total / max(count, 1))
+        }
+    
+    def save_filtered(self, source_path: str, output_path: str,
+                      keep_mask: Optional[Union[np.ndarray, str]] = None,
+                      labels: Optional[Union[np.ndarray, str]] = None,
+                      drop_labels: Optional[List[int]] = None,
+                      chunk_points: int = 1000000) -> int:
+        """
+        Rewrite a PCD file without filtered-out points, streaming it block by block
+        
+        Neither the source nor the result is held in memory, so a cleaned copy
+        of a map larger than RAM is written in constant memory at disk speed.
+        The mask and labels may be memory-mapped (or given as .npy paths,
+        which are opened with mmap_mode='r').
+        
+        Args:
+            source_path: PCD file to filter
+            output_path: Output binary PCD file; every source field is kept
+            keep_mask: Boolean array with one entry per source point
+            labels: Per-point label array, used together with drop_labels
+            drop_labels: Label values whose points are left out
+            chunk_points: Number of points per streamed block
+            
+        Returns:
+            Number of points written
+        """
+        source_path, output_path = str(source_path), Path(output_path)
+        header = read_pcd_header(source_path)
+        if isinstance(keep_mask, (str, Path)):
+            keep_mask = np.load(keep_mask, mmap_mode='r')
+        if isinstance(labels, (str, Path)):
+            labels = np.load(labels, mmap_mode='r')
+        for name, array in (('keep_mask', keep_mask), ('labels', labels)):
+            if array is not None and len(array) != header.points:
+                raise ValueError(f"{name} has {len(array)} entries for {header.points} points")
+        drop_labels = np.asarray(drop_labels if drop_labels is not None else [])
+        
+        def block_keep(start, stop):
+            keep = np.ones(stop - start, dtype=bool)
+            if keep_mask is not None:
+                keep &= np.asarray(keep_mask[start:stop], dtype=bool)
+            if labels is not None and len(drop_labels) > 0:
+                keep &= ~np.isin(labels[start:stop], drop_labels)
+            return keep
+        
+        # The header needs the final count, which the mask alone gives
+        t0 = time.perf_counter()
+        total = sum(int(np.count_nonzero(block_keep(start, min(start + chunk_points, header.points))))
+                    for start in range(0, header.points, chunk_points))
+        
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with atomic_write(output_path) as tmp_path, open(tmp_path, 'wb') as f:
+            f.write(make_pcd_header(header.dtype, total, 'binary', header.viewpoint))
+            start = 0
+            for chunk in self.iter_chunks(source_path, chunk_points):
+                keep = block_keep(start, start + len(chunk))
+                np.ascontiguousarray(chunk[keep]).tofile(f)
+                start += len(chunk)
+        
+        logger.info(f"Streamed {total:,} of {header.points:,} points to {output_path} "
+                    f"in {time.perf_counter()-t0:.3f}s")
+        return total
+    
+    def save_pcd(self, file_path: str, point_cloud: Optional[Union[PointCloudData, o3d.geometry.PointCloud]] = None,
+                 data_format: Optional[str] = None, precision: str = 'float32',
+                 progress: Optional[Callable[[float], None]] = None, restore_order: bool = True) -> bool:
         """
         Save point cloud to PCD file
         
+        .pcd files are written by the native numpy writer: the records are
+        packed into one structured array and written with tofile under a
+        temporary name that is renamed at the end. When the loaded cloud
+        or any copy or subset of it is saved at full resolution, fields that
+        are not held in memory (intensity, ring, time, ...) are written back
+        from the column store. Other extensions are handed to Open3D.
+        
         Args:
             file_path: Output file path
-            point_cloud: Point cloud to save (uses self.point_cloud if None)
+            point_cloud: PointCloudData or Open3D cloud to save (the current cloud if None)
+            data_format: "binary" or "binary_compressed"; None means "binary" for .pcd
+                files and lets Open3D pick the format from any other extension
+            precision: "float32" or "float64" coordinate fields
+            progress: Optional callback receiving the written fraction in [0, 1]
+            restore_order: Write a Morton-reordered cloud in the order of its file
             
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            pc_to_save = point_cloud if point_cloud is not None else self.point_cloud
+            if point_cloud is None or (point_cloud is self.point_cloud and self.point_cloud is not None):
+                # The Open3D view of the loaded cloud is saved from the container it was built from
+                self.compact()
+                point_cloud = self.get_point_data()
+            pc_to_save = point_cloud
             
             if pc_to_save is None:
                 logger.error("No point cloud to save")
                 return False
+            num_points = len(pc_to_save) if isinstance(pc_to_save, PointCloudData) else len(pc_to_save.points)
             
             file_path = Path(file_path)
             file_path.parent.mkdir(parents=True, exist_ok=True)
             
             logger.info(f"Saving PCD file: {file_path}")
-            success = o3d.io.write_point_cloud(str(file_path), pc_to_save)
+            extra_fields = self._extra_fields_for(pc_to_save)
+            if data_format is None and file_path.suffix.lower() == '.pcd':
+                data_format = 'binary'
+            
+            if data_format is not None:
+                t0 = time.perf_counter()
+                data = point_cloud_to_structured(pc_to_save, precision)
+                if extra_fields:
+                    data = self._append_columns(data, extra_fields, pc_to_save.attributes[ROW_ATTRIBUTE])
+                rows = self._moved_rows(pc_to_save) if restore_order else None
+                if rows is not None:
+                    data = data[np.argsort(rows, kind='stable')]
+                write_pcd(str(file_path), data, data_format,
+                          self.header.viewpoint if self.header is not None else None, progress)
+                logger.info(f"Native {data_format} write: {time.perf_counter()-t0:.3f}s, "
+                            f"{file_path.stat().st_size / (1024*1024):.1f} MB")
+                success = True
+            else:
+                # Open3D picks the format from the file extension
+                success = o3d.io.write_point_cloud(str(file_path), as_open3d(pc_to_save))
             
             if success:
-                logger.info(f"Successfully saved {len(pc_to_save.points)} points")
+                logger.info(f"Successfully saved {num_points} points")
             else:
                 logger.error("Failed to save PCD file")
             
@@ -143,17 +2248,56 @@ class PointCloudLoader:
             logger.error(f"Error saving PCD file: {e}")
             return False
     
+    def _moved_rows(self, pc: Union[PointCloudData, o3d.geometry.PointCloud]) -> Optional[np.ndarray]:
+        """File rows of the points of pc when they are out of file order (Morton reorder, dedup), else None"""
+        if not isinstance(pc, PointCloudData) or ROW_ATTRIBUTE not in pc.attributes:
+            return None
+        rows = pc.attributes[ROW_ATTRIBUTE]
+        return rows if np.any(rows[1:] < rows[:-1]) else None
+    
+    def _disk_only_fields(self) -> List[str]:
+        """Column store fields that are not held in the point container"""
+        if self.columns is None:
+            return []
+        return [n for n in self.columns.names if n not in OPEN3D_PCD_FIELDS]
+    
+    def _extra_fields_for(self, pc: Union[PointCloudData, o3d.geometry.PointCloud]) -> List[str]:
+        """
+        Column store fields to write with a cloud whose points came from the loaded file
+        
+        Any copy or subset of the loaded cloud qualifies: its points carry their
+        file rows (ROW_ATTRIBUTE). Previews and Open3D clouds do not.
+        """
+        if not isinstance(pc, PointCloudData) or ROW_ATTRIBUTE not in pc.attributes:
+            return []
+        rows = pc.attributes[ROW_ATTRIBUTE]
+        if self.columns is None or (len(rows) > 0 and rows.max() >= self.columns.header.points):
+            return []
+        return [n for n in self._disk_only_fields() if n not in pc.attributes]
+    
+    def _append_columns(self, data: np.ndarray, names: List[str], rows: np.ndarray) -> np.ndarray:
+        """Extend a structured array with columns of the column store, taken at file rows"""
+        names = [n for n in names if n not in data.dtype.names]
+        out = np.empty(len(data), dtype=data.dtype.descr + [(n, self.columns.dtype[n]) for n in names])
+        for name in data.dtype.names:
+            out[name] = data[name]
+        for name in names:
+            out[name] = self.columns.gather(name, rows)
+        return out
+    
     def get_bounds(self) -> Dict[str, Tuple[float, float, float]]:
-        """Get bounding box of the point cloud"""
-        if self.point_cloud is None:
+        """Get bounding box of the point cloud, ignoring deleted points"""
+        if self.cloud is None and self.get_point_data() is None:
             return {}
         
-        points = np.asarray(self.point_cloud.points)
-        if len(points) == 0:
-            return {}
+        if self._local_bounds is None:
+            xyz = self.cloud.xyz if self.deleted is None else self.cloud.xyz[~self.deleted]
+            if len(xyz) == 0:
+                return {}
+            self._local_bounds = (xyz.min(axis=0), xyz.max(axis=0))
         
-        min_bound = points.min(axis=0)
-        max_bound = points.max(axis=0)
+        min_bound = self._local_bounds[0].astype(np.float64) + self.cloud.origin
+        max_bound = self._local_bounds[1].astype(np.float64) + self.cloud.origin
         center = (min_bound + max_bound) / 2
         
         return {
@@ -163,28 +2307,94 @@ class PointCloudLoader:
             'size': tuple(max_bound - min_bound)
         }
     
+    def get_point_data(self) -> Optional[PointCloudData]:
+        """
+        Get the current point container, building it from mapped data on first use
+        
+        Points deleted with remove_points() are left out, but the cloud is
+        not compacted: the live points are selected once per batch of
+        deletions and reused until the next one.
+        """
+        if self.cloud is None and self.columns is not None:
+            self._materialize()
+        if self.deleted is None:
+            return self.cloud
+        if self._live_cloud is None:
+            self._live_cloud = self.cloud.select(~self.deleted)
+        return self._live_cloud
+    
     def get_point_cloud(self) -> Optional[o3d.geometry.PointCloud]:
-        """Get the current point cloud"""
+        """
+        Get the current point cloud as an Open3D cloud
+        
+        The float64 copy is built on first use and kept until the cloud is
+        edited; code that does not hand the cloud to Open3D should use
+        get_point_data() instead.
+        """
+        current = self.get_point_data()
+        if current is not None and self.point_cloud is None:
+            self.point_cloud = current.to_open3d()
         return self.point_cloud
     
     def get_points_array(self) -> Optional[np.ndarray]:
-        """Get points as numpy array"""
-        if self.point_cloud is None:
+        """Get points as a float64 world-coordinate numpy array (a new copy)"""
+        current = self.get_point_data()
+        if current is None:
             return None
-        return np.asarray(self.point_cloud.points)
+        return current.points
     
     def get_colors_array(self) -> Optional[np.ndarray]:
-        """Get colors as numpy array"""
-        if self.point_cloud is None or len(self.point_cloud.colors) == 0:
+        """Get colors as numpy array in [0, 1]"""
+        current = self.get_point_data()
+        if current is None:
+            return None
+        return current.colors_float()
+    
+    def get_field_names(self) -> List[str]:
+        """Get the names of all per-point fields of the loaded file"""
+        self._ensure_full_source()
+        return self.columns.names if self.columns is not None else []
+    
+    def get_column(self, name: str) -> Optional[np.ndarray]:
+        """
+        Get one per-point field at full resolution, reading it on first use
+        
+        Rows follow the full-resolution cloud (with deletions applied), not
+        the preview when the cloud is downsampled.
+        """
+        self._ensure_full_source()
+        if self.columns is None or name not in self.columns:
             return None
-        return np.asarray(self.point_cloud.colors)
+        return self.columns.get(name)
+    
+    def get_columns(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """Get several per-point fields, skipping the ones the file does not have"""
+        self._ensure_full_source()
+        fields = self.columns.get_many(names) if self.columns is not None else {}
+        
+        # Attributes computed at ingest (e.g. dup_count) live on the full-resolution container
+        full = self.original_cloud if self.is_downsampled() else self.cloud
+        if full is not None and (self.columns is None or len(self.columns) == len(full)):
+            fields.update({name: full.attributes[name] for name in names
+                           if name not in fields and name in full.attributes})
+        return fields
     
     def set_points(self, points: np.ndarray):
         """Set new points for the point cloud"""
-        if self.point_cloud is None:
-            self.point_cloud = o3d.geometry.PointCloud()
+        self.compact()
+        current = self.get_point_data()
+        keep = current is not None and len(current) == len(points)
+        self.cloud = PointCloudData.from_points(
+            points,
+            current.colors if keep else None,
+            current.normals if keep else None,
+            current.attributes if keep else None)
+        self.point_cloud = None
+        self._local_bounds = None
         
-        self.point_cloud.points = o3d.utility.Vector3dVector(points)
+        # Per-point fields no longer describe the new points
+        if self.columns is not None and len(self.columns) != len(points):
+            self.columns = None
         
         # Update metadata
         self.metadata['num_points'] = len(points)
@@ -192,51 +2402,122 @@ class PointCloudLoader:
     
     def add_colors(self, colors: np.ndarray):
         """Add colors to the point cloud"""
-        if self.point_cloud is None:
+        self.compact()
+        if self.get_point_data() is None:
             logger.error("No point cloud loaded")
             return
         
-        if len(colors) != len(self.point_cloud.points):
+        if len(colors) != len(self.cloud):
             logger.error("Color array size doesn't match points array size")
             return
         
-        self.point_cloud.colors = o3d.utility.Vector3dVector(colors)
+        # A new container, since the old one may also be held by the memory cache
+        self.cloud = PointCloudData(self.cloud.xyz, self.cloud.origin, colors,
+                                    self.cloud.normals, self.cloud.attributes)
+        self.point_cloud = None
         self.metadata['has_colors'] = True
     
     def remove_points(self, indices: np.ndarray):
-        """Remove points at specified indices"""
-        if self.point_cloud is None:
+        """
+        Remove points at specified indices
+        
+        Points are only marked deleted, so a call costs O(k) in the number of
+        indices. Indices always refer to the cloud as it was after the last
+        compaction, whatever was read in between; the cloud is compacted
+        when it is saved or compact() is called.
+        
+        Raises:
+            ValueError: If an index is negative or not below the point count
+        """
+        # get_point_data() would return the live points, not the rows the indices refer to
+        if self.cloud is None and self.get_point_data() is None:
             logger.error("No point cloud loaded")
             return
         
-        # Create mask for points to keep
-        all_indices = np.arange(len(self.point_cloud.points))
-        keep_mask = ~np.isin(all_indices, indices)
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        # Negative indices would silently wrap around to the end of the cloud
+        if len(indices) > 0 and (indices[0] < 0 or indices[-1] >= len(self.cloud)):
+            raise ValueError(f"Point indices must be in [0, {len(self.cloud)}), "
+                             f"got [{indices[0]}, {indices[-1]}]")
+        if self.deleted is None:
+            self.deleted = np.zeros(len(self.cloud), dtype=bool)
+        newly_deleted = indices[~self.deleted[indices]]
+        self.deleted[newly_deleted] = True
+        self._live_cloud = None
+        self.point_cloud = None
         
-        # Get points and colors to keep
-        points = np.asarray(self.point_cloud.points)[keep_mask]
+        # Bounds only move if a deleted point lay on them
+        if self._local_bounds is not None and len(newly_deleted) > 0:
+            removed = self.cloud.xyz[newly_deleted]
+            if np.any(removed <= self._local_bounds[0]) or np.any(removed >= self._local_bounds[1]):
+                self._local_bounds = None
         
-        # Update point cloud
-        self.point_cloud.points = o3d.utility.Vector3dVector(points)
+        # Update metadata
+        self.metadata['num_points'] -= len(newly_deleted)
+        self.metadata['bounds'] = self.get_bounds() if self._local_bounds is not None else None
         
-        # Update colors if they exist
-        if len(self.point_cloud.colors) > 0:
-            colors = np.asarray(self.point_cloud.colors)[keep_mask]
-            self.point_cloud.colors = o3d.utility.Vector3dVector(colors)
+        logger.info(f"Removed {len(newly_deleted)} points, {self.metadata['num_points']} points remaining")
+    
+    def compact(self) -> Optional[np.ndarray]:
+        """
+        Drop the points marked by remove_points()
         
-        # Update metadata
-        self.metadata['num_points'] = len(points)
-        self.metadata['bounds'] = self.get_bounds()
+        Per-point fields follow the full-resolution cloud. When the cloud is a
+        preview, the full-resolution points behind deleted preview points are
+        dropped too, so the inverse index map stays valid.
         
-        logger.info(f"Removed {len(indices)} points, {len(points)} points remaining")
+        Returns:
+            Keep mask over the indices before compaction, or None if nothing was pending
+        """
+        if self.deleted is None:
+            return None
+        keep = ~self.deleted
+        self.deleted = None
+        self._live_cloud = None
+        
+        if self.is_downsampled():
+            inverse = self.preview_inverse if self.original_cloud is not None else None
+            if inverse is not None:
+                full_keep = keep[inverse]
+                remap = (np.cumsum(keep) - 1).astype(np.int32)
+                self.original_cloud = self.original_cloud.select(full_keep)
+                self.preview_inverse = remap[inverse[full_keep]]
+                if self.columns is not None and len(self.columns) == len(full_keep):
+                    self.columns.select(full_keep)
+                self.metadata['original_num_points'] = len(self.original_cloud)
+            else:
+                # LOD previews derive the map on demand from whatever is left
+                self.preview_inverse = None
+        else:
+            if self.columns is not None and len(self.columns) == len(keep):
+                self.columns.select(keep)
+        
+        self.cloud = self.cloud.select(keep)
+        self.point_cloud = None
+        if self.is_downsampled():
+            self.metadata['downsample_ratio'] = len(self.cloud) / max(self.metadata['original_num_points'], 1)
+        logger.info(f"Compacted {np.count_nonzero(~keep):,} deleted points, {len(self.cloud):,} remaining")
+        return keep
     
     def get_info(self) -> Dict[str, Any]:
         """Get information about the loaded point cloud"""
         return self.metadata.copy()
     
+    def get_original_point_data(self) -> Optional[PointCloudData]:
+        """Get the original (non-downsampled) point container if available"""
+        # Deleted preview points take the full-resolution points behind them along
+        self.compact()
+        self.get_point_data()
+        if self.original_cloud is None and self.lod_manifest is not None:
+            # Preview came from the LOD cache; read the full-resolution points now
+            self._ensure_full_source()
+            self.original_cloud = self._ingest(structured_to_point_data(self.columns))
+        return self.original_cloud
+    
     def get_original_point_cloud(self) -> Optional[o3d.geometry.PointCloud]:
-        """Get the original (non-downsampled) point cloud if available"""
-        return self.original_points
+        """Get the original (non-downsampled) point cloud as an Open3D cloud if available"""
+        original = self.get_original_point_data()
+        return original.to_open3d() if original is not None else None
     
     def is_downsampled(self) -> bool:
         """Check if current point cloud is downsampled"""
@@ -0,0 +1,435 @@
+"""
+Tile Store Module
+Out-of-core storage of large maps as an XY grid of tiles with one .npy file per column
+"""
+
+import json
+import logging
+import shutil
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from point_cloud_data import ROW_ATTRIBUTE, PointCloudData, concatenate
+from point_cloud_loader import PointCloudLoader, atomic_write, structured_to_point_data
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+INDEX_NAME = "index.json"
+TILES_DIR_NAME = "tiles"
+
+# Column files every tile may have; attribute columns are stored under their own names
+CORE_COLUMNS = ('xyz', 'colors', 'normals')
+
+
+@dataclass
+class StoreRegion:
+    """Tiles of a TileStore loaded together for editing"""
+    bbox: Optional[Tuple[np.ndarray, np.ndarray]]  # Requested box in world coordinates
+    keys: List[str]                                # Tiles whose points make up the region
+    origin: np.ndarray                             # Frame of the region's PointCloudData
+
+
+def tile_key(i: int, j: int) -> str:
+    """Name of the tile in grid column i, row j"""
+    return f"{i}_{j}"
+
+
+def parse_tile_key(key: str) -> Tuple[int, int]:
+    """Grid column and row of a tile name"""
+    i, j = key.split('_')
+    return int(i), int(j)
+
+
+class TileStore:
+    """
+    Map stored on disk as a fixed XY grid of tiles
+
+    Each tile is a directory of .npy columns (float32 xyz relative to the
+    tile corner, uint8 colors, float32 normals and any attribute columns)
+    and index.json records the grid and the point count and bounds of every
+    tile. Tiles are read on demand into an LRU of resident tiles bounded by
+    max_resident_bytes; edited tiles are marked dirty and only those are
+    written back, on flush() or when they are evicted.
+    """
+
+    def __init__(self, root: str, max_resident_bytes: int = 2 * 1024 ** 3):
+        """
+        Open an existing store
+
+        Args:
+            root: Store directory holding index.json
+            max_resident_bytes: Size bound of the resident tiles
+        """
+        self.root = Path(root)
+        self.max_resident_bytes = max_resident_bytes
+        self.index = json.loads((self.root / INDEX_NAME).read_text())
+        self.tile_size = float(self.index['tile_size'])
+        self.origin = np.asarray(self.index['origin'], dtype=np.float64)
+        self._resident = OrderedDict()  # key -> PointCloudData, least recently used first
+        self._resident_bytes = 0
+        self._dirty = set()
+
+    @classmethod
+    def create(cls, root: str, origin: np.ndarray, tile_size: float = 50.0,
+               columns: Optional[Dict[str, Any]] = None, **kwargs) -> 'TileStore':
+        """
+        Create an empty store
+
+        Args:
+            root: Store directory (must not hold a store yet)
+            origin: World position of the corner of tile 0_0
+            tile_size: Edge length of the square tiles in metres
+            columns: Optional columns besides xyz as {name: [dtype, width]}
+            **kwargs: Passed on to the constructor
+
+        Returns:
+            The new TileStore
+        """
+        root = Path(root)
+        if (root / INDEX_NAME).exists():
+            raise FileExistsError(f"{root} already holds a tile store")
+        (root / TILES_DIR_NAME).mkdir(parents=True, exist_ok=True)
+        index = {
+            'tile_size': float(tile_size),
+            'origin': np.asarray(origin, dtype=np.float64).tolist(),
+            'columns': columns or {},
+            'tiles': {},
+            'created': time.time()
+        }
+        (root / INDEX_NAME).write_text(json.dumps(index, indent=2))
+        return cls(str(root), **kwargs)
+
+    @classmethod
+    def from_point_data(cls, root: str, data: PointCloudData, tile_size: float = 50.0,
+                        **kwargs) -> 'TileStore':
+        """
+        Create a store from a cloud in memory
+
+        Args:
+            root: Store directory
+            data: Cloud to split into tiles
+            tile_size: Edge length of the tiles in metres
+            **kwargs: Passed on to the constructor
+
+        Returns:
+            The new TileStore, already flushed
+        """
+        store = cls.create(root, np.floor(data.bounds()[0]) if len(data) else np.zeros(3),
+                           tile_size, columns_of(data), **kwargs)
+        store.add_points(data)
+        store.flush()
+        return store
+
+    @classmethod
+    def from_pcd(cls, root: str, file_path: str, tile_size: float = 50.0,
+                 chunk_points: int = 1000000, **kwargs) -> 'TileStore':
+        """
+        Create a store from a PCD file without reading the whole file into memory
+
+        The file is streamed block by block; the tiles each block touches
+        stay resident until the LRU bound writes them out, so memory stays
+        bounded by max_resident_bytes plus one block.
+
+        Args:
+            root: Store directory
+            file_path: PCD file to split into tiles
+            tile_size: Edge length of the tiles in metres
+            chunk_points: Number of points read per block
+            **kwargs: Passed on to the constructor
+
+        Returns:
+            The new TileStore, already flushed
+        """
+        t0 = time.perf_counter()
+        store = None
+        count = 0
+        for block in PointCloudLoader().iter_chunks(file_path, chunk_points):
+            data = structured_to_point_data(block)
+            extra = [name for name in block.dtype.names
+                     if name not in ('x', 'y', 'z', 'rgb', 'rgba', 'normal_x', 'normal_y', 'normal_z')]
+            data.attributes = {name: np.asarray(block[name]) for name in extra}
+            if store is None:
+                # The grid is anchored at the first block; tiles may have negative indices
+                store = cls.create(root, np.floor(data.bounds()[0]) if len(data) else np.zeros(3),
+                                   tile_size, columns_of(data), **kwargs)
+            store.add_points(data)
+            count += len(data)
+
+        if store is None:
+            raise ValueError(f"No points in {file_path}")
+        store.flush()
+        logger.info(f"Split {count:,} points of {Path(file_path).name} into {len(store.index['tiles'])} tiles "
+                    f"in {time.perf_counter()-t0:.3f}s")
+        return store
+
+    def tile_origin(self, key: str) -> np.ndarray:
+        """World position of the corner of a tile, the frame of its xyz column"""
+        i, j = parse_tile_key(key)
+        return self.origin + np.array([i * self.tile_size, j * self.tile_size, 0.0])
+
+    def tile_dir(self, key: str) -> Path:
+        """Directory holding the columns of a tile"""
+        return self.root / TILES_DIR_NAME / key
+
+    def keys(self) -> List[str]:
+        """Names of all tiles with points"""
+        return sorted(set(self.index['tiles']) | set(self._resident))
+
+    def num_points(self) -> int:
+        """Point count of the whole store, including unsaved edits"""
+        on_disk = {key: entry['num_points'] for key, entry in self.index['tiles'].items()}
+        on_disk.update({key: len(tile) for key, tile in self._resident.items()})
+        return sum(on_disk.values())
+
+    def tiles_in_bbox(self, bbox: Tuple[np.ndarray, np.ndarray]) -> List[str]:
+        """
+        Tiles whose points can lie in a box
+
+        Args:
+            bbox: (min_bound, max_bound) in world coordinates
+
+        Returns:
+            Tile names, from the stored tile bounds
+        """
+        low, high = np.asarray(bbox[0], dtype=np.float64), np.asarray(bbox[1], dtype=np.float64)
+        keys = []
+        for key in self.keys():
+            tile_min, tile_max = self._tile_bounds(key)
+            if tile_min is not None and np.all(tile_min <= high) and np.all(tile_max >= low):
+                keys.append(key)
+        return keys
+
+    def get_tile(self, key: str) -> PointCloudData:
+        """
+        Get a tile, reading it into the resident set if needed
+
+        The returned container is the resident copy; callers that modify it
+        must hand it back with put_tile() so it is marked dirty.
+        """
+        tile = self._resident.get(key)
+        if tile is not None:
+            self._resident.move_to_end(key)
+            return tile
+
+        tile = self._read_tile(key)
+        self._resident[key] = tile
+        self._resident_bytes += tile.nbytes
+        self._evict()
+        return tile
+
+    def put_tile(self, key: str, data: PointCloudData):
+        """
+        Replace the points of a tile
+
+        Args:
+            key: Tile name
+            data: New points of the tile, in any frame
+        """
+        if not np.allclose(data.origin, self.tile_origin(key)):
+            data = concatenate([data], self.tile_origin(key))
+        old = self._resident.pop(key, None)
+        if old is not None:
+            self._resident_bytes -= old.nbytes
+        self._resident[key] = data
+        self._resident_bytes += data.nbytes
+        self._dirty.add(key)
+        self._evict()
+
+    def add_points(self, data: PointCloudData):
+        """
+        Insert points into the tiles they fall in
+
+        Args:
+            data: Points to add; columns the store does not have are dropped
+        """
+        for key, part in self._split_by_tile(data).items():
+            if key in self._resident or key in self.index['tiles']:
+                part = concatenate([self.get_tile(key), part], self.tile_origin(key))
+            self.put_tile(key, part)
+
+    def read_region(self, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[PointCloudData, StoreRegion]:
+        """
+        Read the tiles touching a box as one cloud
+
+        Whole tiles are returned rather than the exact box, so write_region()
+        can replace them without reading the rest of each tile back.
+
+        Args:
+            bbox: (min_bound, max_bound) in world coordinates (every tile if None)
+
+        Returns:
+            Tuple of (merged points, region to pass to write_region())
+        """
+        return self.read_tiles(self.tiles_in_bbox(bbox) if bbox is not None else self.keys(), bbox)
+
+    def read_tiles(self, keys: List[str], bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None
+                   ) -> Tuple[PointCloudData, StoreRegion]:
+        """Read the given tiles as one cloud, like read_region()"""
+        keys = sorted(keys)
+        origin = np.min([self.tile_origin(key) for key in keys], axis=0) if keys else self.origin
+        data = concatenate([self.get_tile(key) for key in keys], origin)
+        return data, StoreRegion(bbox, keys, origin)
+
+    def write_region(self, region: StoreRegion, data: PointCloudData) -> List[str]:
+        """
+        Put an edited region back
+
+        The tiles of the region are replaced by the points of data, binned by
+        their current position, so deleted points disappear and moved or
+        pasted points land in the tile they now lie in.
+
+        Args:
+            region: Region returned by read_region()
+            data: Edited points of the region
+
+        Returns:
+            Tiles outside the region that received moved or pasted points
+        """
+        parts = self._split_by_tile(data)
+        spilled = sorted(key for key in parts if key not in region.keys)
+        for key in region.keys:
+            if key not in parts:
+                self.put_tile(key, PointCloudData(np.empty((0, 3), dtype=np.float32), self.tile_origin(key)))
+        for key, part in parts.items():
+            if key not in region.keys and (key in self._resident or key in self.index['tiles']):
+                # Points moved out of the region join the points already there
+                part = concatenate([self.get_tile(key), part], self.tile_origin(key))
+            self.put_tile(key, part)
+        logger.info(f"Wrote region of {len(region.keys)} tiles back, {len(self._dirty)} tiles dirty")
+        return spilled
+
+    def flush(self) -> int:
+        """
+        Write every dirty tile and the index to disk
+
+        Returns:
+            Number of tiles written
+        """
+        dirty = sorted(self._dirty)
+        for key in dirty:
+            self._write_tile(key, self._resident[key])
+        self._write_index()
+        return len(dirty)
+
+    def _split_by_tile(self, data: PointCloudData) -> Dict[str, PointCloudData]:
+        """Group points by the tile they fall in, converted to the store's columns"""
+        if len(data) == 0:
+            return {}
+        data = self._conform(data)
+
+        # Grid cells are computed in float64 so points on a tile edge are not split by rounding
+        cells = np.floor((data.points[:, :2] - self.origin[:2]) / self.tile_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        cells = cells[order]
+        starts = np.flatnonzero(np.any(np.diff(cells, axis=0) != 0, axis=1)) + 1
+        starts = np.concatenate([[0], starts, [len(cells)]])
+
+        parts = {}
+        for start, stop in zip(starts[:-1], starts[1:]):
+            key = tile_key(*cells[start])
+            parts[key] = concatenate([data.select(order[start:stop])], self.tile_origin(key))
+        return parts
+
+    def _conform(self, data: PointCloudData) -> PointCloudData:
+        """Give data exactly the store's columns, filling missing ones with zeros"""
+        columns = self.index['columns']
+        n = len(data)
+
+        def column(values, name):
+            dtype, width = columns[name]
+            if values is not None:
+                return values
+            logger.warning(f"Points without '{name}' are stored with zeros")
+            return np.zeros((n, width) if width > 1 else n, dtype=dtype)
+
+        attributes = {name: column(data.attributes.get(name), name)
+                      for name in columns if name not in CORE_COLUMNS}
+        return PointCloudData(
+            data.xyz, data.origin,
+            column(data.colors, 'colors') if 'colors' in columns else None,
+            column(data.normals, 'normals') if 'normals' in columns else None,
+            attributes)
+
+    def _tile_bounds(self, key: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """World bounds of a tile (resident copy first), or (None, None) if it is empty"""
+        tile = self._resident.get(key)
+        if tile is not None:
+            return tile.bounds() if len(tile) else (None, None)
+        entry = self.index['tiles'][key]
+        return np.asarray(entry['min']), np.asarray(entry['max'])
+
+    def _read_tile(self, key: str) -> PointCloudData:
+        """Load a tile's columns from disk"""
+        origin = self.tile_origin(key)
+        if key not in self.index['tiles']:
+            return self._conform(PointCloudData(np.empty((0, 3), dtype=np.float32), origin))
+
+        directory = self.tile_dir(key)
+        columns = {name: np.load(directory / f"{name}.npy") for name in ['xyz'] + list(self.index['columns'])}
+        return PointCloudData(
+            columns.pop('xyz'), origin, columns.pop('colors', None), columns.pop('normals', None), columns)
+
+    def _write_tile(self, key: str, tile: PointCloudData):
+        """Write one tile's columns (or remove an emptied tile) and update its index entry"""
+        directory = self.tile_dir(key)
+        if len(tile) == 0:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.index['tiles'].pop(key, None)
+        else:
+            directory.mkdir(parents=True, exist_ok=True)
+            columns = {'xyz': tile.xyz, 'colors': tile.colors, 'normals': tile.normals}
+            columns.update(tile.attributes)
+            for name, values in columns.items():
+                if values is None:
+                    continue
+                # Each column is replaced atomically; a crash leaves old and new columns, never half a file
+                with atomic_write(str(directory / f"{name}.npy")) as tmp_path:
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, values)
+            min_bound, max_bound = tile.bounds()
+            self.index['tiles'][key] = {
+                'num_points': len(tile),
+                'min': min_bound.tolist(),
+                'max': max_bound.tolist()
+            }
+        self._dirty.discard(key)
+
+    def _write_index(self):
+        """Replace index.json"""
+        self.index['modified'] = time.time()
+        with atomic_write(str(self.root / INDEX_NAME)) as tmp_path:
+            Path(tmp_path).write_text(json.dumps(self.index, indent=2))
+
+    def _evict(self):
+        """Drop least recently used tiles until the resident set fits, writing back dirty ones"""
+        written = False
+        while self._resident_bytes > self.max_resident_bytes and len(self._resident) > 1:
+            key, tile = self._resident.popitem(last=False)
+            if key in self._dirty:
+                self._write_tile(key, tile)
+                written = True
+            self._resident_bytes -= tile.nbytes
+        if written:
+            # Evicted tiles are now only on disk; keep the index in step with them
+            self._write_index()
+
+
+def columns_of(data: PointCloudData) -> Dict[str, Any]:
+    """Store column layout ({name: [dtype, width]}) of a cloud's optional columns"""
+    columns = {}
+    if data.colors is not None:
+        columns['colors'] = ['uint8', 3]
+    if data.normals is not None:
+        columns['normals'] = ['float32', 3]
+    for name, values in data.attributes.items():
+        if name == ROW_ATTRIBUTE:
+            continue
+        columns[name] = [values.dtype.str, int(np.prod(values.shape[1:], dtype=int)) if values.ndim > 1 else 1]
+    return columns
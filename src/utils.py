@@ -4,13 +4,41 @@ Utility functions for point cloud processing
 
 import numpy as np
 import open3d as o3d
-from typing import Tuple, List, Optional, Dict
+from typing import Tuple, List, Optional, Dict, Union
 import logging
+from dataclasses import dataclass, field
+
+from point_cloud_data import PointCloudData, as_open3d, numpy_to_tensor, tensor_to_numpy
 
 logger = logging.getLogger(__name__)
 
+# Either point cloud representation is accepted by the helpers below
+AnyPointCloud = Union[PointCloudData, o3d.geometry.PointCloud]
+
+
+def points_of(point_cloud: AnyPointCloud) -> np.ndarray:
+    """
+    Get the world-coordinate points of a point cloud
+    
+    Args:
+        point_cloud: PointCloudData or Open3D point cloud
+        
+    Returns:
+        float64 point array (N, 3); a view for Open3D clouds, a new array otherwise
+    """
+    if isinstance(point_cloud, PointCloudData):
+        return point_cloud.points
+    return np.asarray(point_cloud.points)
+
+
+def select_points(point_cloud: AnyPointCloud, indices: np.ndarray) -> AnyPointCloud:
+    """Subset of a point cloud, of the same type as the input"""
+    if isinstance(point_cloud, PointCloudData):
+        return point_cloud.select(indices)
+    return point_cloud.select_by_index(np.asarray(indices))
+
 
-def downsample_point_cloud(point_cloud: o3d.geometry.PointCloud, voxel_size: float = 0.1) -> o3d.geometry.PointCloud:
+def downsample_point_cloud(point_cloud: AnyPointCloud, voxel_size: float = 0.1) -> AnyPointCloud:
     """
     Downsample point cloud using voxel grid
     
@@ -19,14 +47,374 @@ def downsample_point_cloud(point_cloud: o3d.geometry.PointCloud, voxel_size: flo
         voxel_size: Size of voxel grid
         
     Returns:
-        Downsampled point cloud
+        Downsampled point cloud, of the same type as the input
+    """
+    if not isinstance(point_cloud, PointCloudData):
+        return point_cloud.voxel_down_sample(voxel_size)
+    
+    centroids, inverse, counts = voxel_downsample_with_inverse(point_cloud.xyz, voxel_size)
+    colors = None
+    if point_cloud.colors is not None:
+        colors = np.round(voxel_average(point_cloud.colors, inverse, counts)).astype(np.uint8)
+    return PointCloudData(centroids, point_cloud.origin, colors)
+
+
+def voxel_keys(points: np.ndarray, voxel_size: float, origin: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compute a packed integer voxel key for every point
+    
+    Args:
+        points: Point array (N, 3)
+        voxel_size: Edge length of the voxel grid
+        origin: Grid origin (if None, half a voxel below the minimum of the
+            points, which is the grid Open3D's voxel_down_sample uses)
+        
+    Returns:
+        int64 key per point; equal keys mean the same voxel
+    """
+    origin = points.min(axis=0) - voxel_size / 2 if origin is None else np.asarray(origin)
+    coords = np.floor((points - origin) / voxel_size).astype(np.int64)
+    extent = coords.max(axis=0) + 1
+    if np.prod(extent.astype(np.float64)) >= 2.0 ** 63:
+        raise ValueError(f"Voxel size {voxel_size} is too small to index this extent")
+    return (coords[:, 0] * extent[1] + coords[:, 1]) * extent[2] + coords[:, 2]
+
+
+def voxel_downsample_with_inverse(points: np.ndarray, voxel_size: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Voxel-grid downsample points and keep the mapping back to the input
+    
+    Args:
+        points: Point array (N, 3)
+        voxel_size: Edge length of the voxel grid
+        
+    Returns:
+        Tuple of (voxel centroids (M, 3), inverse (N,) int32 giving the voxel of
+        every input point, counts (M,) points per voxel)
+    """
+    _, inverse, counts = np.unique(voxel_keys(points, voxel_size), return_inverse=True, return_counts=True)
+    inverse = inverse.astype(np.int32).ravel()
+    return voxel_average(points, inverse, counts), inverse, counts
+
+
+def voxel_average(values: np.ndarray, inverse: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Average per-point values over the voxels of a downsample
+    
+    Args:
+        values: Per-point values (N, K)
+        inverse: Voxel of every point, from voxel_downsample_with_inverse
+        counts: Points per voxel
+        
+    Returns:
+        Per-voxel means (M, K)
+    """
+    out = np.empty((len(counts), values.shape[1]))
+    for axis in range(values.shape[1]):
+        out[:, axis] = np.bincount(inverse, weights=values[:, axis], minlength=len(counts)) / counts
+    return out
+
+
+def voxel_downsample_arrays(points: np.ndarray, voxel_size: float,
+                            colors: Optional[np.ndarray] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Voxel-grid downsample plain arrays, averaging the points of each voxel
+    
+    Same result as Open3D's voxel_down_sample, without building a point cloud.
+    
+    Args:
+        points: Point array (N, 3)
+        voxel_size: Edge length of the voxel grid
+        colors: Optional color array (N, 3)
+        
+    Returns:
+        Tuple of (voxel centroids, averaged colors or None)
+    """
+    centroids, inverse, counts = voxel_downsample_with_inverse(points, voxel_size)
+    return centroids, (voxel_average(colors, inverse, counts) if colors is not None else None)
+
+
+def count_occupied_voxels(points: np.ndarray, voxel_size: float) -> int:
+    """
+    Count the voxels that contain at least one point
+    
+    Args:
+        points: Point array (N, 3)
+        voxel_size: Edge length of the voxel grid
+        
+    Returns:
+        Number of occupied voxels, i.e. the size of a voxel downsample
+    """
+    return len(np.unique(voxel_keys(points, voxel_size)))
+
+
+def connected_components(num_nodes: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Connected components of a graph given as an edge list, by vectorised union-find
+    
+    Every round hooks the larger root of each edge under the smaller one and
+    then compresses paths by pointer jumping; edges whose ends already share
+    a root are dropped, so rounds get cheaper as components merge.
+    
+    Args:
+        num_nodes: Number of nodes
+        a: First node of every edge
+        b: Second node of every edge
+        
+    Returns:
+        Component of every node, as the smallest node index in it
+    """
+    parent = np.arange(num_nodes)
+    a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+    while len(a):
+        root_a, root_b = parent[a], parent[b]
+        differ = root_a != root_b
+        a, b, root_a, root_b = a[differ], b[differ], root_a[differ], root_b[differ]
+        if not len(a):
+            break
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+
+def voxel_connected_components(points: np.ndarray, voxel_size: float, min_points: float = 1,
+                               weights: Optional[np.ndarray] = None,
+                               origin: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Cluster points as connected components of occupied voxels
+    
+    Points are hashed to voxels of voxel_size; voxels holding fewer than
+    min_points points are dropped as noise, and the rest are joined to their
+    26 neighbours, found by binary search in the sorted voxel keys. Linear in
+    the number of points apart from the sorts, so it scales where DBSCAN's
+    neighbour lists do not; it is coarser, as points up to two voxel
+    diagonals apart can end up connected.
+    
+    Args:
+        points: Point array (N, 3)
+        voxel_size: Edge length of the voxel grid, e.g. the DBSCAN eps
+        min_points: Points a voxel needs to take part in a cluster
+        weights: Optional number of input points each point stands for
+        origin: Grid origin (if None, one voxel below the minimum of the
+            points); subsets clustered on a shared origin see the same voxels
+        
+    Returns:
+        Cluster label per point, consecutive from 0, with -1 for noise
     """
-    return point_cloud.voxel_down_sample(voxel_size)
+    labels = np.full(len(points), -1, dtype=np.int64)
+    if len(points) == 0:
+        return labels
+    
+    origin = points.min(axis=0) - voxel_size if origin is None else np.asarray(origin)
+    coords = np.floor((points - origin) / voxel_size).astype(np.int64)
+    # A voxel of padding on every side keeps neighbour keys from wrapping around an axis
+    coords -= coords.min(axis=0) - 1
+    extent = coords.max(axis=0) + 2
+    if np.prod(extent.astype(np.float64)) >= 2.0 ** 63:
+        raise ValueError(f"Voxel size {voxel_size} is too small to index this extent")
+    strides = np.array([extent[1] * extent[2], extent[2], 1])
+    voxels, inverse = np.unique(coords @ strides, return_inverse=True)
+    del coords
+    inverse = inverse.ravel()
+    
+    dense = np.bincount(inverse, weights=weights, minlength=len(voxels)) >= min_points
+    occupied = voxels[dense]
+    if len(occupied) == 0:
+        return labels
+    
+    # Half of the 26-neighbourhood is enough, every edge is undirected
+    offsets = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                        if (dx, dy, dz) > (0, 0, 0)])
+    edges_a, edges_b = [], []
+    for shift in offsets @ strides:
+        target = occupied + shift
+        found = np.minimum(np.searchsorted(occupied, target), len(occupied) - 1)
+        hit = occupied[found] == target
+        edges_a.append(np.flatnonzero(hit))
+        edges_b.append(found[hit])
+    
+    roots = connected_components(len(occupied), np.concatenate(edges_a), np.concatenate(edges_b))
+    voxel_labels = np.full(len(voxels), -1, dtype=np.int64)
+    voxel_labels[dense] = np.unique(roots, return_inverse=True)[1].ravel()
+    return voxel_labels[inverse]
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """Insert two zero bits after each of the low 21 bits of uint64 values"""
+    values = values & np.uint64(0x1FFFFF)
+    values = (values | (values << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return values
 
 
-def remove_outliers(point_cloud: o3d.geometry.PointCloud, 
+def morton_codes(points: np.ndarray, cell_size: Optional[float] = None) -> np.ndarray:
+    """
+    3D Morton (Z-order) codes of points
+    
+    Points are quantised to a 2^21 grid per axis over their bounding box
+    (or to cells of cell_size, clipped to that grid) and the bits of the
+    three cell indices are interleaved, so points close in space get close
+    codes.
+    
+    Args:
+        points: Point array (N, 3)
+        cell_size: Edge length of the quantisation cells (finest that fits the grid if None)
+        
+    Returns:
+        uint64 codes (N,)
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return np.empty(0, dtype=np.uint64)
+    low = np.nanmin(points, axis=0)
+    if cell_size is None:
+        cell_size = max(float((np.nanmax(points, axis=0) - low).max()) / (2 ** 21 - 1), 1e-9)
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for axis in range(3):
+        # NaN coordinates end up in cell 0
+        cells = np.nan_to_num((points[:, axis] - low[axis]) / cell_size)
+        cells = np.clip(cells, 0, 2 ** 21 - 1).astype(np.uint64)
+        codes |= _spread_bits(cells) << np.uint64(axis)
+    return codes
+
+
+def morton_order(points: np.ndarray, cell_size: Optional[float] = None) -> np.ndarray:
+    """
+    Permutation sorting points along the Z-order curve
+    
+    Neighbour searches (KD-tree queries, DBSCAN, voxel grouping) over the
+    reordered points touch memory in mostly sequential runs.
+    
+    Args:
+        points: Point array (N, 3)
+        cell_size: Quantisation cell size passed to morton_codes()
+        
+    Returns:
+        int64 indices (N,): reordered = points[order]
+    """
+    return np.argsort(morton_codes(points, cell_size), kind='stable')
+
+
+def unique_point_rows(points: np.ndarray, tolerance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find duplicate and near-duplicate points
+    
+    Coordinates are quantised to cells of the tolerance and the three cell
+    indices packed into one int64 key when their ranges fit in 63 bits (a
+    lexicographic sort of the index triples is used otherwise); one
+    np.unique over the keys then finds the groups.
+    
+    Args:
+        points: Point array (N, 3)
+        tolerance: Cell size; points in the same cell count as duplicates
+        
+    Returns:
+        Tuple of (rows (M,) of the first point of every cell in input order,
+        counts (M,) points in each of those cells)
+    """
+    points = np.asarray(points)
+    if len(points) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    cells = np.floor((points - np.nanmin(points, axis=0)) / tolerance).astype(np.int64)
+    bits = [int(np.ceil(np.log2(max(int(cells[:, axis].max()) + 1, 2)))) for axis in range(3)]
+    
+    if sum(bits) <= 63:
+        keys = (cells[:, 0] << (bits[1] + bits[2])) | (cells[:, 1] << bits[2]) | cells[:, 2]
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    else:
+        # Stable sort: the first row of every group is its earliest point
+        order = np.lexsort((cells[:, 2], cells[:, 1], cells[:, 0]))
+        starts = np.flatnonzero(np.any(np.diff(cells[order], axis=0) != 0, axis=1)) + 1
+        starts = np.concatenate([[0], starts])
+        first = order[starts]
+        counts = np.diff(np.append(starts, len(order)))
+    
+    by_row = np.argsort(first)
+    return first[by_row], counts[by_row]
+
+
+def voxel_size_for_point_budget(points: np.ndarray, target_points: int, tolerance: float = 0.05,
+                                max_iterations: int = 12, sample_size: int = 2000000) -> float:
+    """
+    Find the voxel size whose downsample keeps target_points points within a tolerance
+    
+    The bounding-box volume says nothing about how sparse or elongated a
+    cloud is, so the voxel size is searched on actual occupied-voxel counts.
+    A random sample narrows the search cheaply, then a log-log secant
+    search on the full cloud, safeguarded by bisection, finishes it.
+    
+    Args:
+        points: Point array (N, 3)
+        target_points: Desired number of points after downsampling
+        tolerance: Accepted relative deviation from target_points
+        max_iterations: Maximum number of full-cloud counts
+        sample_size: Size of the sample used for the first estimate
+        
+    Returns:
+        Voxel size (best found if the tolerance was not reached)
+    """
+    if len(points) <= target_points:
+        return 0.0
+    
+    # Initial guess from the extent over the non-degenerate axes
+    extent = points.max(axis=0) - points.min(axis=0)
+    extent = extent[extent > 0]
+    if len(extent) == 0:
+        return 1.0
+    voxel_size = float((np.prod(extent) / target_points) ** (1.0 / len(extent)))
+    
+    def search(pts, guess, iterations):
+        # Occupied count falls monotonically with voxel size; keep a bracket in log space
+        lo, hi = None, None  # (log size, log count) with count above / below the target
+        log_target = np.log(target_points)
+        best = (np.inf, guess)
+        size = guess
+        for _ in range(iterations):
+            count = count_occupied_voxels(pts, size)
+            error = abs(count - target_points) / target_points
+            best = min(best, (error, size))
+            if error <= tolerance:
+                break
+            sample = (np.log(size), np.log(max(count, 1)))
+            if count > target_points:
+                lo = sample
+            else:
+                hi = sample
+            
+            if lo is not None and hi is not None:
+                # Secant step in log-log space, falling back to bisection near the ends
+                t = (lo[1] - log_target) / max(lo[1] - hi[1], 1e-12)
+                t = min(max(t, 0.1), 0.9)
+                size = float(np.exp(lo[0] + t * (hi[0] - lo[0])))
+            else:
+                # Expand until the target is bracketed, assuming count ~ size^-2
+                size = float(size * np.clip((count / target_points) ** 0.5, 0.25, 4.0))
+        return best
+    
+    if len(points) > sample_size and target_points < sample_size // 4:
+        # A sample sees fewer occupied voxels than the full cloud, so its answer is
+        # a slight underestimate of the voxel size: a good start for the full search
+        rng = np.random.default_rng(0)
+        sample = points[rng.choice(len(points), sample_size, replace=False)]
+        _, voxel_size = search(sample, voxel_size, max_iterations)
+        del sample
+    
+    error, voxel_size = search(points, voxel_size, max_iterations)
+    if error > tolerance:
+        logger.warning(f"Point budget search stopped {error:.1%} away from {target_points:,} points")
+    return voxel_size
+
+
+def remove_outliers(point_cloud: AnyPointCloud, 
                    nb_neighbors: int = 20, 
-                   std_ratio: float = 2.0) -> Tuple[o3d.geometry.PointCloud, np.ndarray]:
+                   std_ratio: float = 2.0) -> Tuple[AnyPointCloud, np.ndarray]:
     """
     Remove statistical outliers from point cloud
     
@@ -38,31 +426,49 @@ def remove_outliers(point_cloud: o3d.geometry.PointCloud,
     Returns:
         Tuple of (cleaned point cloud, inlier indices)
     """
-    cleaned_pc, inlier_indices = point_cloud.remove_statistical_outlier(nb_neighbors, std_ratio)
-    return cleaned_pc, np.array(inlier_indices)
+    # The tensor remove_statistical_outliers avoids the copy but is slower than
+    # the legacy one (see benchmark.py tensor), so this stays on a legacy cloud
+    cleaned_pc, inlier_indices = as_open3d(point_cloud).remove_statistical_outlier(nb_neighbors, std_ratio)
+    inlier_indices = np.array(inlier_indices)
+    if isinstance(point_cloud, PointCloudData):
+        cleaned_pc = point_cloud.select(inlier_indices)
+    return cleaned_pc, inlier_indices
 
 
-def estimate_normals(point_cloud: o3d.geometry.PointCloud, 
+def estimate_normals(point_cloud: AnyPointCloud, 
                     radius: float = 0.5, 
-                    max_nn: int = 30) -> o3d.geometry.PointCloud:
+                    max_nn: int = 30) -> AnyPointCloud:
     """
     Estimate normals for point cloud
     
+    The input is left untouched, since it may be a cloud shared through
+    CloudCache or TileStore; the normals are set on a copy.
+    
     Args:
         point_cloud: Input point cloud
         radius: Search radius for normal estimation
         max_nn: Maximum number of neighbors
         
     Returns:
-        Point cloud with estimated normals
+        New point cloud with estimated normals
     """
-    point_cloud.estimate_normals(
+    if isinstance(point_cloud, PointCloudData):
+        # The tensor shares the buffers of its container and overwrites existing
+        # normals in place, so it is built from the copy
+        result = point_cloud.copy()
+        pc = result.to_tensor()
+        pc.estimate_normals(max_nn=max_nn, radius=radius)
+        result.normals = tensor_to_numpy(pc.point.normals)
+        return result
+    
+    result = o3d.geometry.PointCloud(point_cloud)
+    result.estimate_normals(
         search_param=o3d.geometry.KDTreeSearchParamHybrid(radius=radius, max_nn=max_nn)
     )
-    return point_cloud
+    return result
 
 
-def segment_plane_ransac(point_cloud: o3d.geometry.PointCloud,
+def segment_plane_ransac(point_cloud: AnyPointCloud,
                         distance_threshold: float = 0.1,
                         ransac_n: int = 3,
                         num_iterations: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
@@ -76,8 +482,19 @@ def segment_plane_ransac(point_cloud: o3d.geometry.PointCloud,
         num_iterations: Number of RANSAC iterations
         
     Returns:
-        Tuple of (plane coefficients, inlier indices)
+        Tuple of (plane coefficients in world coordinates, inlier indices)
     """
+    if isinstance(point_cloud, PointCloudData):
+        plane_model, inliers = point_cloud.to_tensor().segment_plane(
+            distance_threshold=distance_threshold,
+            ransac_n=ransac_n,
+            num_iterations=num_iterations
+        )
+        # The plane was fitted to points relative to origin: n.(p - o) + d = 0
+        plane_model = tensor_to_numpy(plane_model).astype(np.float64)
+        plane_model[3] -= plane_model[:3] @ point_cloud.origin
+        return plane_model, tensor_to_numpy(inliers)
+    
     plane_model, inliers = point_cloud.segment_plane(
         distance_threshold=distance_threshold,
         ransac_n=ransac_n,
@@ -86,13 +503,179 @@ def segment_plane_ransac(point_cloud: o3d.geometry.PointCloud,
     return np.array(plane_model), np.array(inliers)
 
 
-def compute_point_density(points: np.ndarray, radius: float = 1.0) -> np.ndarray:
+@dataclass
+class GroundGrid:
+    """Local ground surface: one plane z = c + a*(x - cx) + b*(y - cy) per XY cell"""
+    origin: np.ndarray      # XY corner of cell (0, 0)
+    cell_size: float        # Cell edge length
+    rows: int               # Cell key stride: key = i * rows + j
+    keys: np.ndarray        # Sorted keys of the cells that have a ground plane
+    planes: np.ndarray      # (a, b, c) per cell, c being the ground height at the cell centre
+    
+    _centre_tree: Optional[object] = field(default=None, init=False, repr=False, compare=False)
+    
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        return np.floor((points[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+    
+    def _centres(self, keys: np.ndarray) -> np.ndarray:
+        return self.origin + (np.stack([keys // self.rows, keys % self.rows], axis=1) + 0.5) * self.cell_size
+    
+    def ground_z(self, points: np.ndarray) -> np.ndarray:
+        """
+        Height of the ground surface under each point
+        
+        Points in a fitted cell use its plane. Any other point uses the plane
+        of the fitted cell with the nearest centre, evaluated at the point
+        clamped into that cell, so the ground is held level beyond the fitted
+        cells instead of extrapolating their slope.
+        """
+        cells = self._cells(points)
+        keys = cells[:, 0] * self.rows + cells[:, 1]
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        # A row outside the grid would alias a cell of the neighbouring column
+        inside = (self.keys[found] == keys) & (cells[:, 1] >= 0) & (cells[:, 1] < self.rows)
+        if not inside.all():
+            if self._centre_tree is None:
+                from scipy.spatial import cKDTree
+                self._centre_tree = cKDTree(self._centres(self.keys))
+            _, found[~inside] = self._centre_tree.query(points[~inside, :2], workers=-1)
+        
+        centres = self._centres(self.keys[found])
+        half = self.cell_size / 2
+        dx = np.clip(points[:, 0] - centres[:, 0], -half, half)
+        dy = np.clip(points[:, 1] - centres[:, 1], -half, half)
+        a, b, c = self.planes[found].T
+        return c + a * dx + b * dy
+    
+    def height(self, points: np.ndarray) -> np.ndarray:
+        """Signed height of each point above the local ground surface"""
+        return points[:, 2] - self.ground_z(points)
+
+
+def fit_ground_grid(points: np.ndarray, cell_size: float = 3.0, seed_band: float = 0.3,
+                    max_step: float = 0.5, seed_rank: int = 3, refine_iterations: int = 2,
+                    fill_iterations: int = 8) -> GroundGrid:
+    """
+    Fit the local ground as a plane per XY cell in one vectorised pass
+    
+    Every cell is seeded with its seed_rank-th lowest point, so a stray point
+    below the road does not pull the ground down, and a least-squares plane
+    is fitted to the points within seed_band above the seed, then refitted
+    to the points within half that band of the plane. A cell whose ground
+    lies more than max_step off the median of its neighbours' planes
+    extended to it is wrong (a canopy with no ground in view, a patch of
+    multipath points) and takes the lowest plane of a sound neighbour
+    instead, repeated so that the fill reaches the middle of larger areas.
+    
+    Args:
+        points: Point array (N, 3)
+        cell_size: Edge length of the XY cells
+        seed_band: Height above the cell seed of the points the plane is fitted to
+        max_step: Largest ground step allowed between neighbouring cells
+        seed_rank: Rank of the point that seeds the ground of a cell
+        refine_iterations: Refits of every plane to the points close to it
+        fill_iterations: Passes that spread ground into cells without any
+        
+    Returns:
+        GroundGrid over the cells that contain points
+    """
+    xy_origin = points[:, :2].min(axis=0)
+    cells = np.floor((points[:, :2] - xy_origin) / cell_size).astype(np.int64)
+    rows = int(cells[:, 1].max()) + 1
+    keys, inverse = np.unique(cells[:, 0] * rows + cells[:, 1], return_inverse=True)
+    inverse = inverse.ravel()
+    del cells
+    
+    # Seed: the seed_rank-th lowest z of every cell, from one sort by (cell, z)
+    order = np.lexsort((points[:, 2], inverse))
+    counts = np.bincount(inverse, minlength=len(keys))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    seeds = points[order[starts + np.minimum(seed_rank, counts) - 1], 2]
+    del order
+    
+    # Least-squares planes relative to the cell centres and seeds, first of the
+    # points just above the seed, then of the points close to the previous plane
+    # so that the band follows slopes instead of cutting a strip out of them
+    dx = points[:, 0] - (xy_origin[0] + (keys // rows + 0.5) * cell_size)[inverse]
+    dy = points[:, 1] - (xy_origin[1] + (keys % rows + 0.5) * cell_size)[inverse]
+    dz = points[:, 2] - seeds[inverse]
+    near = dz <= seed_band
+    # A small ridge on the slopes makes cells with collinear or single seeds flat,
+    # the one on the height keeps a cell left without points at its seed
+    ridge = 1e-2 * cell_size ** 2
+    
+    def sums(values, fitted):
+        # Per-cell sums over the fitted points
+        return np.bincount(inverse, weights=np.where(fitted, values, 0.0), minlength=len(keys))
+    
+    for _ in range(1 + refine_iterations):
+        sx, sy, sxy = sums(dx, near), sums(dy, near), sums(dx * dy, near)
+        normal = np.stack([
+            np.stack([sums(dx * dx, near) + ridge, sxy, sx], axis=-1),
+            np.stack([sxy, sums(dy * dy, near) + ridge, sy], axis=-1),
+            np.stack([sx, sy, np.bincount(inverse, weights=near, minlength=len(keys)) + 1e-9], axis=-1),
+        ], axis=1)
+        rhs = np.stack([sums(dx * dz, near), sums(dy * dz, near), sums(dz, near)], axis=-1)
+        planes = np.linalg.solve(normal, rhs[..., None])[..., 0]
+        a, b, c = planes[inverse].T
+        near = np.abs(dz - (c + a * dx + b * dy)) <= seed_band / 2
+    planes[:, 2] += seeds
+    
+    # Neighbour of every cell in each of the 8 directions, -1 where there is none
+    offsets = [(di, dj) for di in (-1, 0, 1) for dj in (-1, 0, 1) if (di, dj) != (0, 0)]
+    neighbours = np.empty((len(offsets), len(keys)), dtype=np.int64)
+    for k, (di, dj) in enumerate(offsets):
+        target = keys + di * rows + dj
+        found = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+        match = (keys[found] == target) & (keys % rows + dj >= 0) & (keys % rows + dj < rows)
+        neighbours[k] = np.where(match, found, -1)
+    
+    def extended(k, source):
+        # Ground height at every cell centre from the plane of its neighbour in direction k
+        di, dj = offsets[k]
+        j = np.maximum(neighbours[k], 0)
+        a, b, c = source[j].T
+        return c - a * di * cell_size - b * dj * cell_size
+    
+    exists = neighbours >= 0
+    steps = np.stack([planes[:, 2] - extended(k, planes) for k in range(len(offsets))])
+    steps[~exists] = np.nan
+    # A cell far below its typical neighbour is seeded by points under the ground
+    # (multipath, noise), one far above it has no ground in view
+    judged = exists.sum(axis=0) >= 3
+    valid = np.ones(len(keys), dtype=bool)
+    valid[judged] = np.abs(np.nanmedian(steps[:, judged], axis=0)) <= max_step
+    del steps
+    
+    for _ in range(fill_iterations):
+        if valid.all():
+            break
+        best = np.full(len(keys), np.inf)
+        best_plane = np.zeros_like(planes)
+        for k in range(len(offsets)):
+            candidate = np.where(exists[k] & valid[np.maximum(neighbours[k], 0)],
+                                 extended(k, planes), np.inf)
+            lower = ~valid & (candidate < best)
+            best[lower] = candidate[lower]
+            best_plane[lower] = planes[neighbours[k][lower]]
+            best_plane[lower, 2] = candidate[lower]
+        filled = np.isfinite(best)
+        planes[filled] = best_plane[filled]
+        valid |= filled
+    
+    return GroundGrid(xy_origin, cell_size, rows, keys, planes)
+
+
+def compute_point_density(points: np.ndarray, radius: float = 1.0,
+                          weights: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Compute local point density for each point
     
     Args:
         points: Point array (N, 3)
         radius: Search radius for density computation
+        weights: Optional number of input points each point stands for,
+            e.g. the dup_count attribute left by duplicate removal
         
     Returns:
         Density values for each point
@@ -102,14 +685,16 @@ def compute_point_density(points: np.ndarray, radius: float = 1.0) -> np.ndarray
     nbrs = NearestNeighbors(radius=radius).fit(points)
     distances, indices = nbrs.radius_neighbors(points)
     
+    if weights is not None:
+        return np.array([weights[idx].sum() for idx in indices])
     densities = np.array([len(idx) for idx in indices])
     return densities
 
 
-def filter_by_height_range(point_cloud: o3d.geometry.PointCloud,
+def filter_by_height_range(point_cloud: AnyPointCloud,
                           min_height: float,
                           max_height: float,
-                          ground_plane: Optional[np.ndarray] = None) -> Tuple[o3d.geometry.PointCloud, np.ndarray]:
+                          ground_plane: Optional[np.ndarray] = None) -> Tuple[AnyPointCloud, np.ndarray]:
     """
     Filter points by height range
     
@@ -122,7 +707,7 @@ def filter_by_height_range(point_cloud: o3d.geometry.PointCloud,
     Returns:
         Tuple of (filtered point cloud, kept indices)
     """
-    points = np.asarray(point_cloud.points)
+    points = points_of(point_cloud)
     
     if ground_plane is not None:
         # Calculate height relative to ground plane
@@ -137,12 +722,12 @@ def filter_by_height_range(point_cloud: o3d.geometry.PointCloud,
     kept_indices = np.where(height_mask)[0]
     
     # Create filtered point cloud
-    filtered_pc = point_cloud.select_by_index(kept_indices)
+    filtered_pc = select_points(point_cloud, kept_indices)
     
     return filtered_pc, kept_indices
 
 
-def compute_bounding_boxes(point_cloud: o3d.geometry.PointCloud, 
+def compute_bounding_boxes(point_cloud: AnyPointCloud, 
                           cluster_indices: List[np.ndarray]) -> List[Dict]:
     """
     Compute bounding boxes for point clusters
@@ -154,14 +739,18 @@ def compute_bounding_boxes(point_cloud: o3d.geometry.PointCloud,
     Returns:
         List of bounding box information dictionaries
     """
-    points = np.asarray(point_cloud.points)
+    if isinstance(point_cloud, PointCloudData):
+        points, origin = point_cloud.xyz, point_cloud.origin
+    else:
+        points, origin = np.asarray(point_cloud.points), np.zeros(3)
     bounding_boxes = []
     
     for cluster_idx in cluster_indices:
         if len(cluster_idx) == 0:
             continue
             
-        cluster_points = points[cluster_idx]
+        local_points = points[cluster_idx]
+        cluster_points = local_points + origin
         
         # Compute axis-aligned bounding box
         min_bound = cluster_points.min(axis=0)
@@ -170,10 +759,9 @@ def compute_bounding_boxes(point_cloud: o3d.geometry.PointCloud,
         size = max_bound - min_bound
         volume = np.prod(size)
         
-        # Compute oriented bounding box
-        cluster_pc = o3d.geometry.PointCloud()
-        cluster_pc.points = o3d.utility.Vector3dVector(cluster_points)
-        obb = cluster_pc.get_oriented_bounding_box()
+        # Compute oriented bounding box on the local points; only the box is converted
+        cluster_pc = o3d.t.geometry.PointCloud(numpy_to_tensor(local_points))
+        obb = cluster_pc.get_oriented_bounding_box().to_legacy().translate(origin)
         
         bbox_info = {
             'cluster_indices': cluster_idx,
@@ -247,7 +835,7 @@ def merge_close_clusters(clusters: List[np.ndarray],
     return merged_clusters
 
 
-def create_mesh_from_points(point_cloud: o3d.geometry.PointCloud, 
+def create_mesh_from_points(point_cloud: AnyPointCloud, 
                            method: str = "poisson") -> o3d.geometry.TriangleMesh:
     """
     Create mesh from point cloud
@@ -259,6 +847,7 @@ def create_mesh_from_points(point_cloud: o3d.geometry.PointCloud,
     Returns:
         Generated triangle mesh
     """
+    point_cloud = as_open3d(point_cloud)
     if method == "poisson":
         # Poisson surface reconstruction
         mesh, _ = o3d.geometry.TriangleMesh.create_from_point_cloud_poisson(
@@ -6,11 +6,13 @@ Provides interactive 3D visualization of point clouds with editing capabilities
 import open3d as o3d
 import numpy as np
 import logging
-from typing import List, Dict, Optional, Callable, Tuple
+from typing import List, Dict, Optional, Callable, Tuple, Union
 from dataclasses import dataclass
 import threading
 import time
 
+from point_cloud_data import PointCloudData, as_point_data, colors_to_uint8
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -30,8 +32,12 @@ class InteractiveVisualizer:
     
     def __init__(self):
         self.vis = None
-        self.point_cloud = None
-        self.original_colors = None
+        self.point_data = None       # PointCloudData being edited
+        self.point_cloud = None      # Open3D geometry handed to the renderer
+        self.original_colors = None  # uint8 (N, 3)
+        self.deleted = None          # Tombstones over point_data rows, left out by get_current_point_data()
+        self.tile_store = None       # TileStore the edited region came from, if any
+        self.region = None           # StoreRegion of the edited points
         self.selected_indices = set()
         self.selection_regions = []
         self.callbacks = {}
@@ -45,6 +51,7 @@ class InteractiveVisualizer:
             'static': [0.0, 1.0, 0.0],        # Green
             'ground': [0.5, 0.3, 0.1],        # Brown
             'uncertain': [1.0, 1.0, 0.0],     # Yellow
+            'background': [0.1, 0.1, 0.1],    # Dark gray, also hides deleted points
         }
         
         # Selection tools
@@ -68,7 +75,7 @@ class InteractiveVisualizer:
             
             # Set up rendering options
             render_option = self.vis.get_render_option()
-            render_option.background_color = np.array([0.1, 0.1, 0.1])
+            render_option.background_color = np.array(self.colors['background'])
             render_option.point_size = 2.0
             render_option.show_coordinate_frame = True
             render_option.light_on = True
@@ -85,26 +92,32 @@ class InteractiveVisualizer:
             logger.error("This might be due to missing OpenGL support or X11 forwarding issues")
             return False
     
-    def set_point_cloud(self, point_cloud: o3d.geometry.PointCloud):
+    def set_point_cloud(self, point_cloud: Union[PointCloudData, o3d.geometry.PointCloud]):
         """Set the point cloud to visualize"""
-        if len(point_cloud.points) == 0:
+        point_data = as_point_data(point_cloud)
+        if len(point_data) == 0:
             logger.warning("Empty point cloud provided")
             return
         
-        # Create a copy of the point cloud
-        self.point_cloud = o3d.geometry.PointCloud()
-        self.point_cloud.points = point_cloud.points
-        if hasattr(point_cloud, 'colors') and len(point_cloud.colors) > 0:
-            self.point_cloud.colors = point_cloud.colors
-        if hasattr(point_cloud, 'normals') and len(point_cloud.normals) > 0:
-            self.point_cloud.normals = point_cloud.normals
+        # Edits go to a copy of the container
+        self.point_data = point_data.copy()
+        self.deleted = None
+        self.tile_store = None
+        self.region = None
         
         # Store original colors or create default ones
-        if len(point_cloud.colors) > 0:
-            self.original_colors = np.asarray(point_cloud.colors).copy()
+        if self.point_data.colors is not None:
+            self.original_colors = self.point_data.colors.copy()
         else:
-            self.original_colors = np.tile(self.colors['original'], (len(point_cloud.points), 1))
-            self.point_cloud.colors = o3d.utility.Vector3dVector(self.original_colors)
+            self.original_colors = np.tile(colors_to_uint8(np.array([self.colors['original']])),
+                                           (len(self.point_data), 1))
+        
+        # The renderer gets its own float64 geometry
+        self.point_cloud = o3d.geometry.PointCloud()
+        self.point_cloud.points = o3d.utility.Vector3dVector(self.point_data.points)
+        self.point_cloud.colors = o3d.utility.Vector3dVector(self.original_colors / 255.0)
+        if self.point_data.normals is not None:
+            self.point_cloud.normals = o3d.utility.Vector3dVector(self.point_data.normals.astype(np.float64))
         
         # Clear previous selections
         self.selected_indices.clear()
@@ -137,13 +150,44 @@ class InteractiveVisualizer:
             logger.info(f"Point cloud loaded: {len(self.point_cloud.points)} points")
             logger.info(f"Bounds: center={center}, extent={extent}")
     
+    def set_region(self, store, bbox: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """
+        Show and edit the tiles of a TileStore that touch a box
+        
+        Selection and editing then work on the region only; commit_region()
+        writes the edits back to the store.
+        
+        Args:
+            store: TileStore to read from
+            bbox: Optional (min_bound, max_bound) in world coordinates
+        """
+        data, region = store.read_region(bbox)
+        self.set_point_cloud(data)
+        self.tile_store = store
+        self.region = region
+    
+    def commit_region(self) -> bool:
+        """Write the edited region back into its TileStore"""
+        if self.tile_store is None or self.point_data is None:
+            logger.warning("No tile store region to commit")
+            return False
+        spilled = self.tile_store.write_region(self.region, self.get_current_point_data())
+        self.tile_store.flush()
+        if spilled:
+            # Pasted or moved points joined tiles outside the region; show those tiles too
+            data, region = self.tile_store.read_tiles(self.region.keys + spilled, self.region.bbox)
+            store = self.tile_store
+            self.set_point_cloud(data)
+            self.tile_store, self.region = store, region
+        return True
+    
     def color_points_by_classification(self, dynamic_indices: np.ndarray, static_indices: np.ndarray, 
                                      ground_indices: Optional[np.ndarray] = None):
         """Color points based on classification results"""
         if self.point_cloud is None:
             return
         
-        colors = self.original_colors.copy()
+        colors = self.original_colors / 255.0
         
         # Color dynamic objects
         if len(dynamic_indices) > 0:
@@ -157,6 +201,7 @@ class InteractiveVisualizer:
         if ground_indices is not None and len(ground_indices) > 0:
             colors[ground_indices] = self.colors['ground']
         
+        self._hide_deleted(colors)
         self.point_cloud.colors = o3d.utility.Vector3dVector(colors)
         
         if self.vis is not None:
@@ -172,7 +217,7 @@ class InteractiveVisualizer:
         # Reset previous selection colors
         for idx in self.selected_indices:
             if idx < len(colors):
-                colors[idx] = self.original_colors[idx]
+                colors[idx] = self.original_colors[idx] / 255.0
         
         # Highlight new selection
         self.selected_indices = set(indices)
@@ -185,19 +230,20 @@ class InteractiveVisualizer:
     
     def select_box_region(self, center: np.ndarray, size: np.ndarray) -> np.ndarray:
         """Select points within a box region"""
-        if self.point_cloud is None:
+        if self.point_data is None:
             return np.array([])
         
-        points = np.asarray(self.point_cloud.points)
-        
-        # Create box bounds
-        min_bound = center - size / 2
-        max_bound = center + size / 2
+        # Compare in the float32 frame of the container instead of expanding every point
+        points = self.point_data.xyz
+        min_bound = self.point_data.to_local(center - size / 2)
+        max_bound = self.point_data.to_local(center + size / 2)
         
         # Find points within bounds
         within_bounds = np.all(
             (points >= min_bound) & (points <= max_bound), axis=1
         )
+        if self.deleted is not None:
+            within_bounds &= ~self.deleted
         
         indices = np.where(within_bounds)[0]
         
@@ -215,16 +261,18 @@ class InteractiveVisualizer:
     
     def select_sphere_region(self, center: np.ndarray, radius: float) -> np.ndarray:
         """Select points within a spherical region"""
-        if self.point_cloud is None:
+        if self.point_data is None:
             return np.array([])
         
-        points = np.asarray(self.point_cloud.points)
+        points = self.point_data.xyz
         
         # Calculate distances from center
-        distances = np.linalg.norm(points - center, axis=1)
+        distances = np.linalg.norm(points - self.point_data.to_local(center), axis=1)
         
         # Find points within radius
         within_radius = distances <= radius
+        if self.deleted is not None:
+            within_radius &= ~self.deleted
         indices = np.where(within_radius)[0]
         
         # Create selection region
@@ -240,68 +288,75 @@ class InteractiveVisualizer:
         return indices
     
     def delete_selected_points(self) -> int:
-        """Delete currently selected points"""
-        if self.point_cloud is None or len(self.selected_indices) == 0:
+        """
+        Delete currently selected points
+        
+        Points are only marked deleted and painted in the background color,
+        so a delete costs O(k) in the selection and point indices (and
+        detection results over them) stay valid. get_current_point_data()
+        leaves the deleted points out when the cloud is saved.
+        """
+        if self.point_data is None or len(self.selected_indices) == 0:
             return 0
         
-        # Get points and colors to keep
-        all_indices = np.arange(len(self.point_cloud.points))
-        keep_mask = ~np.isin(all_indices, list(self.selected_indices))
-        
-        points = np.asarray(self.point_cloud.points)[keep_mask]
-        colors = np.asarray(self.point_cloud.colors)[keep_mask]
+        indices = np.fromiter(self.selected_indices, dtype=np.int64, count=len(self.selected_indices))
+        if self.deleted is None:
+            self.deleted = np.zeros(len(self.point_data), dtype=bool)
+        self.deleted[indices] = True
         
-        # Update point cloud
-        self.point_cloud.points = o3d.utility.Vector3dVector(points)
-        self.point_cloud.colors = o3d.utility.Vector3dVector(colors)
-        
-        # Update original colors
-        self.original_colors = self.original_colors[keep_mask]
+        # Recolor the rendered points in place instead of rebuilding the geometry
+        np.asarray(self.point_cloud.colors)[indices] = self.colors['background']
         
         # Clear selection
-        deleted_count = len(self.selected_indices)
         self.selected_indices.clear()
         
         if self.vis is not None:
             self.vis.update_geometry(self.point_cloud)
         
-        logger.info(f"Deleted {deleted_count} points")
-        return deleted_count
+        logger.info(f"Deleted {len(indices)} points")
+        return len(indices)
+    
+    def get_deleted_indices(self) -> np.ndarray:
+        """Get the indices of the points deleted since the cloud was set"""
+        if self.deleted is None:
+            return np.array([], dtype=np.int64)
+        return np.flatnonzero(self.deleted)
     
     def copy_selected_points(self) -> Optional[np.ndarray]:
         """Copy selected points to clipboard (return as array)"""
-        if self.point_cloud is None or len(self.selected_indices) == 0:
+        if self.point_data is None or len(self.selected_indices) == 0:
             return None
         
-        points = np.asarray(self.point_cloud.points)
-        selected_points = points[list(self.selected_indices)]
+        selected_points = self.point_data.select(list(self.selected_indices)).points
         
         logger.info(f"Copied {len(selected_points)} points")
         return selected_points
     
     def paste_points(self, points: np.ndarray, offset: np.ndarray = np.array([0, 0, 0])):
         """Paste points at specified offset"""
-        if self.point_cloud is None or len(points) == 0:
+        if self.point_data is None or len(points) == 0:
             return
         
         # Apply offset
         new_points = points + offset
         
-        # Combine with existing points
-        existing_points = np.asarray(self.point_cloud.points)
-        combined_points = np.vstack([existing_points, new_points])
-        
         # Create colors for new points
+        new_colors = np.tile(colors_to_uint8(np.array([self.colors['original']])), (len(new_points), 1))
+        
+        # Combine with existing points
+        pasted = PointCloudData.from_points(new_points, new_colors, origin=self.point_data.origin)
+        self.point_data = self.point_data.append(pasted)
         existing_colors = np.asarray(self.point_cloud.colors)
-        new_colors = np.tile(self.colors['original'], (len(new_points), 1))
-        combined_colors = np.vstack([existing_colors, new_colors])
+        combined_colors = np.vstack([existing_colors, new_colors / 255.0])
         
         # Update point cloud
-        self.point_cloud.points = o3d.utility.Vector3dVector(combined_points)
+        self.point_cloud.points = o3d.utility.Vector3dVector(self.point_data.points)
         self.point_cloud.colors = o3d.utility.Vector3dVector(combined_colors)
         
         # Update original colors
         self.original_colors = np.vstack([self.original_colors, new_colors])
+        if self.deleted is not None:
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(new_points), dtype=bool)])
         
         if self.vis is not None:
             self.vis.update_geometry(self.point_cloud)
@@ -350,8 +405,9 @@ class InteractiveVisualizer:
     def _on_delete_key(self, vis):
         """Handle delete key press"""
         if len(self.selected_indices) > 0:
+            deleted = list(self.selected_indices)
             self.delete_selected_points()
-            self.trigger_callback('points_deleted', list(self.selected_indices))
+            self.trigger_callback('points_deleted', deleted)
         return False
     
     def _on_copy_key(self, vis):
@@ -378,23 +434,40 @@ class InteractiveVisualizer:
             self.vis.close()
     
     def get_current_point_cloud(self) -> Optional[o3d.geometry.PointCloud]:
-        """Get the current point cloud"""
+        """Get the current point cloud as rendered (classification colors and hidden deleted points included)"""
         return self.point_cloud
     
+    def get_current_point_data(self) -> Optional[PointCloudData]:
+        """
+        Get the edited point container with its original colors
+        
+        Deleted points are left out here, so the container is only rebuilt
+        when it is saved, not on every delete.
+        """
+        if self.point_data is None or self.deleted is None or not self.deleted.any():
+            return self.point_data
+        return self.point_data.select(~self.deleted)
+    
     def reset_colors(self):
         """Reset all points to original colors"""
         if self.point_cloud is not None:
-            self.point_cloud.colors = o3d.utility.Vector3dVector(self.original_colors)
+            colors = self.original_colors / 255.0
+            self._hide_deleted(colors)
+            self.point_cloud.colors = o3d.utility.Vector3dVector(colors)
             if self.vis is not None:
                 self.vis.update_geometry(self.point_cloud)
     
+    def _hide_deleted(self, colors: np.ndarray):
+        """Paint deleted points in the background color"""
+        if self.deleted is not None:
+            colors[self.deleted] = self.colors['background']
+    
     def get_selection_stats(self) -> Dict:
         """Get statistics about current selection"""
         if len(self.selected_indices) == 0:
             return {}
         
-        points = np.asarray(self.point_cloud.points)
-        selected_points = points[list(self.selected_indices)]
+        selected_points = self.point_data.select(list(self.selected_indices)).points
         
         return {
             'count': len(self.selected_indices),
@@ -414,7 +487,7 @@ def test_visualizer():
     if loader.load_pcd("data/points.pcd"):
         vis = InteractiveVisualizer()
         if vis.initialize():
-            vis.set_point_cloud(loader.get_point_cloud())
+            vis.set_point_cloud(loader.get_point_data())
             
             # Add some test callbacks
             def on_save():
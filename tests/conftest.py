@@ -0,0 +1,110 @@
+"""
+Shared fixtures of the test suites: builders of point clouds and of PCD files
+"""
+
+import sys
+from pathlib import Path
+from typing import Union
+import numpy as np
+import pytest
+
+# Add src directory to Python path
+src_dir = Path(__file__).parent.parent / "src"
+sys.path.insert(0, str(src_dir))
+
+from point_cloud_data import PointCloudData
+from point_cloud_loader import PointCloudLoader, write_pcd
+
+# Real maps lie far from the coordinate origin, where float32 world coordinates lose centimetres
+WORLD_OFFSET = np.array([350000.0, 5800000.0, 40.0])
+
+
+@pytest.fixture
+def world_offset() -> np.ndarray:
+    """World position of the local origin of the generated clouds"""
+    return WORLD_OFFSET.copy()
+
+
+@pytest.fixture
+def make_cloud():
+    """Factory of colored clouds spread over a 100 m cube"""
+    def make(num_points: int = 5000, seed: int = 0) -> PointCloudData:
+        rng = np.random.default_rng(seed)
+        points = rng.uniform(0, 100, (num_points, 3)) + WORLD_OFFSET
+        colors = rng.integers(0, 256, (num_points, 3), dtype=np.uint8)
+        return PointCloudData.from_points(points, colors)
+    return make
+
+
+@pytest.fixture
+def make_records():
+    """Factory of structured PCD records with an intensity field Open3D does not keep"""
+    def make(num_points: int = 5000, seed: int = 0) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        data = np.empty(num_points, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4')])
+        for name in data.dtype.names:
+            data[name] = rng.uniform(-50, 50, num_points)
+        return data
+    return make
+
+
+@pytest.fixture
+def make_blobs():
+    """Factory of dense blobs on a grid, further apart than the default DBSCAN eps"""
+    def make(num_blobs: int = 12, points_per_blob: int = 300, seed: int = 0, columns: int = 4) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        rows = -(-num_blobs // columns)
+        centers = np.stack(np.meshgrid(np.arange(columns) * 3.1, np.arange(rows) * 3.1), axis=-1)
+        blobs = [np.column_stack([center + rng.uniform(-0.6, 0.6, (points_per_blob, 2)),
+                                  rng.uniform(0.5, 1.5, points_per_blob)])
+                 for center in centers.reshape(-1, 2)[:num_blobs]]
+        return np.concatenate(blobs)
+    return make
+
+
+@pytest.fixture
+def make_terrain():
+    """Factory of rolling, sloped terrain over 60 x 60 m with a little sensor noise"""
+    def make(num_points: int = 100000, seed: int = 1) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        x, y = rng.uniform(0, 60, num_points), rng.uniform(0, 60, num_points)
+        z = 2.0 * np.sin(x / 8) + 0.05 * y + rng.normal(0, 0.02, num_points)
+        return np.column_stack([x, y, z]) + WORLD_OFFSET
+    return make
+
+
+def write_ascii_pcd(path: str, data: np.ndarray):
+    """Write float32 records as an ASCII PCD file, which the native writer does not produce"""
+    fields = data.dtype.names
+    lines = ["VERSION 0.7", f"FIELDS {' '.join(fields)}", "SIZE" + " 4" * len(fields),
+             "TYPE" + " F" * len(fields), "COUNT" + " 1" * len(fields), f"WIDTH {len(data)}", "HEIGHT 1",
+             "VIEWPOINT 0 0 0 1 0 0 0", f"POINTS {len(data)}", "DATA ascii"]
+    lines += [" ".join(repr(float(value)) for value in record) for record in data.tolist()]
+    Path(path).write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def write_pcd_file(tmp_path):
+    """Factory writing structured records or a PointCloudData as a PCD file in tmp_path"""
+    def write(data: Union[np.ndarray, PointCloudData], name: str = "cloud.pcd",
+              data_format: str = 'binary') -> str:
+        path = str(tmp_path / name)
+        if isinstance(data, PointCloudData):
+            assert PointCloudLoader().save_pcd(path, data, data_format=data_format)
+        elif data_format == 'ascii':
+            write_ascii_pcd(path, data)
+        else:
+            write_pcd(path, data, data_format)
+        return path
+    return write
+
+
+@pytest.fixture
+def load_pcd_file(write_pcd_file):
+    """Factory writing data as a PCD file and loading it back, at full resolution unless told otherwise"""
+    def load(data: Union[np.ndarray, PointCloudData], name: str = "cloud.pcd", **load_args) -> PointCloudLoader:
+        path = write_pcd_file(data, name)
+        loader = PointCloudLoader()
+        assert loader.load_pcd(path, **{'downsample_for_preview': False, **load_args})
+        return loader
+    return load
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the in-process cloud cache: byte-bounded LRU and preview/full toggling
+"""
+
+import numpy as np
+
+from point_cloud_loader import CloudCache, PointCloudLoader
+
+
+def count_disk_loads(loader: PointCloudLoader, monkeypatch) -> list:
+    """Record every load the memory cache could not serve"""
+    loads = []
+    load_from_disk = loader._load_from_disk
+    monkeypatch.setattr(loader, '_load_from_disk',
+                        lambda *args, **kwargs: loads.append(args[0]) or load_from_disk(*args, **kwargs))
+    return loads
+
+
+def test_cache_is_bounded_by_bytes():
+    """Least recently used entries go first; oversized entries and old file versions are dropped"""
+    cache = CloudCache(max_bytes=250)
+    for name in ('a', 'b'):
+        cache.put((name, 1, ('full',), None), {'name': name}, 100)
+
+    # Taking and putting back makes 'a' the most recently used entry
+    cache.put(('a', 1, ('full',), None), cache.take(('a', 1, ('full',), None)), 100)
+    cache.put(('c', 1, ('full',), None), {'name': 'c'}, 100)
+    assert [state['name'] for _, state in cache.find('b', 1)] == []
+    assert len(cache) == 2 and cache.total_bytes == 200
+
+    cache.put(('d', 1, ('full',), None), {'name': 'd'}, 300)
+    assert cache.find('d', 1) == [] and cache.total_bytes == 200
+
+    # A new mtime of the same path replaces every entry of the old version
+    cache.put(('a', 1, ('preview', 10, 'budget'), None), {'name': 'a-preview'}, 10)
+    cache.put(('a', 2, ('full',), None), {'name': 'a2'}, 100)
+    assert cache.find('a', 1) == []
+    assert [state['name'] for _, state in cache.find('a', 2)] == ['a2']
+    assert cache.total_bytes == 200
+
+
+def test_full_resolution_is_restored_from_a_cached_preview(make_cloud, write_pcd_file, monkeypatch):
+    """Toggling preview and full resolution reads the file once and keeps edits"""
+    path = write_pcd_file(make_cloud(20000))
+    loader = PointCloudLoader()
+    loads = count_disk_loads(loader, monkeypatch)
+
+    assert loader.load_pcd(path, max_points_preview=2000)
+    preview = loader.get_point_data().points
+    assert loader.is_downsampled()
+    original = loader.get_original_point_data()
+    assert len(original) == 20000
+
+    # Full resolution comes from the preview entry's original_cloud, which stays cached unmodified
+    assert loader.load_pcd(path, downsample_for_preview=False)
+    assert not loader.is_downsampled()
+    assert loader.get_point_data() is original
+    loader.remove_points(np.arange(100))
+    assert len(loader.get_point_data()) == 19900
+
+    # Back to the preview entry as it was, then to the edited full-resolution entry
+    assert loader.load_pcd(path, max_points_preview=2000)
+    np.testing.assert_array_equal(loader.get_point_data().points, preview)
+    assert loader.get_original_point_data() is original
+    assert loader.load_pcd(path, downsample_for_preview=False)
+    np.testing.assert_array_equal(loader.get_point_data().points, original.points[100:])
+    assert len(original) == 20000
+    assert len(loads) == 1
+
+    # A cache too small for the cloud falls back to reading the file
+    loader.memory_cache = CloudCache(max_bytes=1024)
+    assert loader.load_pcd(path, max_points_preview=2000)
+    assert loader.load_pcd(path, downsample_for_preview=False)
+    assert len(loads) == 3
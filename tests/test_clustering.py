@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Regression tests for point clustering: voxel connected components and tiled clustering
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components as csgraph_components
+from sklearn.cluster import DBSCAN
+
+from dynamic_object_detector import DynamicObjectDetector, TILE_MARGIN_CELLS
+from point_cloud_data import PointCloudData
+from utils import connected_components, voxel_connected_components
+
+
+def as_partition(clusters):
+    """Clusters as a set of index tuples, independent of label numbering"""
+    return {tuple(np.sort(cluster)) for cluster in clusters}
+
+
+def make_detector(points: np.ndarray, **params) -> DynamicObjectDetector:
+    """Detector over points, clustering tiles in-process"""
+    detector = DynamicObjectDetector()
+    detector.set_point_cloud(PointCloudData.from_points(points.astype(np.float64)))
+    detector.detection_params.update(max_workers=1, **params)
+    return detector
+
+
+def test_connected_components_match_scipy():
+    """Union-find components agree with scipy's on a random sparse graph"""
+    rng = np.random.default_rng(3)
+    a, b = rng.integers(0, 5000, (2, 4000))
+    components = connected_components(5000, a, b)
+
+    count, expected = csgraph_components(coo_matrix((np.ones(len(a)), (a, b)), shape=(5000, 5000)), directed=False)
+    assert len(np.unique(components)) == count
+    # Same partition, and every node labelled with the smallest node of its component
+    assert len(np.unique(components * count + expected)) == count
+    assert np.all(components <= np.arange(5000))
+    assert np.all(components[components] == components)
+
+
+def test_voxel_components_separate_blobs_and_noise(make_blobs):
+    """Blobs further apart than two voxels are separate clusters; sparse voxels are noise"""
+    points = make_blobs()
+    noise = np.array([[50.0, 50.0, 1.0], [-40.0, 20.0, 1.0]])
+    labels = voxel_connected_components(np.concatenate([points, noise]), 0.5, min_points=2)
+
+    assert np.all(labels[-2:] == -1)
+    assert np.mean(labels[:-2] >= 0) > 0.99
+    clusters = [set(blob[blob >= 0]) for blob in labels[:-2].reshape(12, -1)]
+    assert all(len(cluster) == 1 for cluster in clusters)
+    assert sorted(cluster.pop() for cluster in clusters) == list(range(12))
+
+
+def test_tiled_voxel_matches_untiled(make_blobs):
+    """Voxel clusters cut by tile borders are stitched back together"""
+    points = make_blobs()
+    indices = np.arange(len(points))
+    detector = make_detector(points, cluster_method='voxel', cluster_min_samples=10)
+
+    untiled = as_partition(detector.cluster_points(points, indices))
+    detector.detection_params['tile_size'] = 2.0
+    assert as_partition(detector.cluster_points_tiled(points, indices)) == untiled
+    assert len(untiled) == 12
+
+
+def test_tiled_dbscan_matches_untiled(make_blobs):
+    """Tiled DBSCAN gives the same clusters as one DBSCAN pass, for float64 and float32 input"""
+    for dtype in (np.float64, np.float32):
+        points = make_blobs().astype(dtype)
+        indices = np.arange(len(points))
+        detector = make_detector(points, cluster_method='dbscan', cluster_min_samples=10)
+        params = detector.detection_params
+
+        labels = DBSCAN(eps=params['cluster_eps'], min_samples=params['cluster_min_samples']).fit(points).labels_
+        untiled = as_partition(detector._clusters_from_labels(indices, labels))
+        assert len(untiled) == 12
+
+        # A tile narrower than the margin is widened to it instead of losing neighbours
+        for tile_size in (2.0, params['cluster_eps'] * TILE_MARGIN_CELLS / 4):
+            params['tile_size'] = tile_size
+            assert as_partition(detector.cluster_points_tiled(points, indices)) == untiled
+
+
+def test_tiled_dbscan_matches_full_dbscan_above_sampling_threshold(make_blobs):
+    """Above 30000 points the tiled clusters still equal one full DBSCAN pass, where the untiled path samples"""
+    points = make_blobs(num_blobs=60, points_per_blob=1000, columns=10)
+    indices = np.arange(len(points))
+    detector = make_detector(points, cluster_method='dbscan', cluster_min_samples=10, tile_size=4.0)
+    params = detector.detection_params
+
+    labels = DBSCAN(eps=params['cluster_eps'], min_samples=params['cluster_min_samples']).fit(points).labels_
+    full = as_partition(detector._clusters_from_labels(indices, labels))
+    assert len(points) > 30000 and len(full) == 60
+    assert as_partition(detector.cluster_points_tiled(points, indices)) == full
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Regression tests for point deletion: tombstones and compaction
+"""
+
+import numpy as np
+import pytest
+
+from point_cloud_loader import PointCloudLoader, memmap_pcd, read_pcd_header
+from visualizer import InteractiveVisualizer
+
+
+def test_indices_stay_valid_until_compaction(make_cloud, load_pcd_file):
+    """Deletions in several calls refer to the indices before any of them, reads in between or not"""
+    loader = load_pcd_file(make_cloud(1000))
+    points = loader.get_point_data().points
+
+    loader.remove_points(np.array([5, 7, 7]))
+    live = loader.get_point_data()
+    assert loader.get_point_data() is live
+    loader.remove_points(np.array([7, 10, 999]))
+    assert loader.get_info()['num_points'] == 996
+
+    keep = np.ones(len(points), dtype=bool)
+    keep[[5, 7, 10, 999]] = False
+    np.testing.assert_array_equal(loader.get_point_data().points, points[keep])
+    # Reads leave the tombstones in place; only compaction drops them
+    np.testing.assert_array_equal(loader.compact(), keep)
+    assert loader.compact() is None
+    np.testing.assert_array_equal(loader.get_point_data().points, points[keep])
+
+
+def test_compacted_cloud_is_saved(tmp_path, make_cloud, load_pcd_file):
+    """Saving compacts pending deletions first"""
+    loader = load_pcd_file(make_cloud(1000))
+    points = loader.get_point_data().points
+    loader.remove_points(np.arange(0, 1000, 2))
+
+    path = tmp_path / "saved.pcd"
+    assert loader.save_pcd(str(path))
+    reloaded = PointCloudLoader()
+    assert reloaded.load_pcd(str(path), downsample_for_preview=False)
+    np.testing.assert_allclose(reloaded.get_point_data().points, points[1::2], atol=1e-2)
+
+
+def test_out_of_range_indices_are_rejected(make_cloud, load_pcd_file):
+    """Negative or too large indices raise before anything is marked deleted"""
+    loader = load_pcd_file(make_cloud(1000))
+
+    for indices in ([3, -1], [3, 1000]):
+        with pytest.raises(ValueError):
+            loader.remove_points(np.array(indices))
+    assert loader.get_info()['num_points'] == 1000
+    assert len(loader.get_point_data()) == 1000
+
+
+def test_saving_a_copy_keeps_fields_left_on_disk(tmp_path, make_records, load_pcd_file):
+    """The GUI saves a copy of the cloud; fields the container does not hold are still written"""
+    data = make_records(2000)
+    loader = load_pcd_file(data)
+    cloud = loader.get_point_data()
+    assert 'intensity' not in cloud.attributes
+
+    for name, pc, rows in (("copy.pcd", cloud.copy(), np.arange(2000)),
+                           ("subset.pcd", cloud.select(np.arange(1, 2000, 3)), np.arange(1, 2000, 3))):
+        path = tmp_path / name
+        assert loader.save_pcd(str(path), pc)
+        written = memmap_pcd(str(path))
+        assert read_pcd_header(str(path)).fields == ['x', 'y', 'z', 'intensity']
+        np.testing.assert_array_equal(written['intensity'], data['intensity'][rows])
+
+
+def test_visualizer_deletes_are_tombstones(tmp_path, make_records, load_pcd_file):
+    """Deleting in the 3D view hides points without moving rows; the saved cloud leaves them out"""
+    data = make_records(2000)
+    loader = load_pcd_file(data)
+    visualizer = InteractiveVisualizer()
+    visualizer.set_point_cloud(loader.get_point_data())
+    geometry = visualizer.get_current_point_cloud()
+
+    visualizer.highlight_selection(np.arange(0, 2000, 2))
+    assert visualizer.delete_selected_points() == 1000
+    assert visualizer.get_current_point_cloud() is geometry and len(geometry.points) == 2000
+    np.testing.assert_allclose(np.asarray(geometry.colors)[::2], np.tile(visualizer.colors['background'], (1000, 1)))
+    np.testing.assert_array_equal(visualizer.get_deleted_indices(), np.arange(0, 2000, 2))
+
+    # Deleted points can no longer be selected, and classification colors keep them hidden
+    center = loader.get_point_data().points.mean(axis=0)
+    assert np.all(visualizer.select_box_region(center, np.full(3, 200.0)) % 2 == 1)
+    visualizer.color_points_by_classification(np.arange(2000), np.array([], dtype=np.int64))
+    np.testing.assert_allclose(np.asarray(geometry.colors)[::2], np.tile(visualizer.colors['background'], (1000, 1)))
+
+    path = tmp_path / "edited.pcd"
+    assert loader.save_pcd(str(path), visualizer.get_current_point_data())
+    written = memmap_pcd(str(path))
+    np.testing.assert_array_equal(written['intensity'], data['intensity'][1::2])
+
+
+def test_preview_deletions_reach_the_full_resolution_save(tmp_path, make_records, load_pcd_file):
+    """Every original point maps to its voxel's preview point; deleting preview points drops their voxels"""
+    data = make_records(20000)
+    loader = load_pcd_file(data, downsample_for_preview=True, max_points_preview=2000)
+    preview = loader.get_point_data()
+    original = loader.get_original_point_data()
+    assert loader.is_downsampled() and len(preview) < len(original) == 20000
+
+    # Preview points are the centroids of the original points mapped to them
+    inverse = loader.preview_inverse
+    counts = np.bincount(inverse, minlength=len(preview))
+    assert np.all(counts > 0)
+    centroids = np.stack([np.bincount(inverse, original.points[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+    np.testing.assert_allclose(centroids, preview.points, atol=1e-3)
+    np.testing.assert_array_equal(loader.map_preview_labels(np.arange(len(preview))), inverse)
+
+    # Delete preview points, then leave more out at save time through the exclude list
+    deleted = np.arange(0, len(preview), 5)
+    loader.remove_points(deleted)
+    excluded = np.arange(1, 100)
+    full = loader.get_full_resolution_cloud(excluded)
+
+    kept_preview = np.setdiff1d(np.arange(len(preview)), deleted)
+    removed = np.isin(inverse, deleted) | np.isin(inverse, kept_preview[excluded])
+    assert len(loader.preview_inverse) == np.count_nonzero(~np.isin(inverse, deleted))
+    np.testing.assert_array_equal(loader.map_preview_labels(kept_preview), inverse[~np.isin(inverse, deleted)])
+
+    path = tmp_path / "full.pcd"
+    assert loader.save_pcd(str(path), full)
+    written = memmap_pcd(str(path))
+    assert len(written) == np.count_nonzero(~removed)
+    for axis in ('x', 'y', 'z'):
+        np.testing.assert_allclose(written[axis], data[axis][~removed], atol=1e-4)
+    np.testing.assert_array_equal(written['intensity'], data['intensity'][~removed])
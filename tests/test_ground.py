@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Regression tests for local ground fitting
+"""
+
+import numpy as np
+
+from utils import GroundGrid, fit_ground_grid
+
+
+def test_ground_follows_hills(make_terrain):
+    """Every ground point of hilly terrain sits on the fitted surface"""
+    points = make_terrain()
+    height = fit_ground_grid(points).height(points)
+    assert np.abs(height).max() < 0.2
+
+
+def test_objects_stand_above_ground(make_terrain, world_offset):
+    """A car on a slope is measured from the ground under it, not from the lowest point of the map"""
+    points = make_terrain()
+    rng = np.random.default_rng(2)
+    car = np.column_stack([rng.uniform(20, 24, 2000), rng.uniform(30, 32, 2000), rng.uniform(0.3, 1.5, 2000)])
+    car[:, 2] += 2.0 * np.sin(car[:, 0] / 8) + 0.05 * car[:, 1]
+    car += world_offset
+
+    height = fit_ground_grid(np.concatenate([points, car])).height(car)
+    assert height.min() > 0.2 and height.max() < 1.7
+
+
+def test_canopy_and_multipath_cells(make_terrain, world_offset):
+    """A canopy hiding the ground and points below the road take the ground of their neighbours"""
+    points = make_terrain()
+    x, y = (points[:, :2] - world_offset[:2]).T
+    roof = (np.abs(x - 15) < 2) & (np.abs(y - 15) < 2)
+    points[roof, 2] += 3.0
+    multipath = np.flatnonzero((np.abs(x - 30) < 1.4) & (np.abs(y - 30) < 1.4))[:8]
+    points[multipath, 2] -= 2.0
+
+    height = fit_ground_grid(points).height(points)
+    ground = ~roof
+    ground[multipath] = False
+    # Repaired cells borrow a neighbour's plane, which the hills bend away from a little
+    assert np.abs(height[ground]).max() < 0.5
+    assert np.mean(np.abs(height[ground]) < 0.1) > 0.99
+    assert height[roof].min() > 2.5
+    assert height[multipath].max() < -1.5
+
+
+def test_ground_outside_fitted_cells_uses_nearest_cell():
+    """Points off the fitted cells take the nearest cell's plane, held level past its edge"""
+    # Fitted cells (0, 0), (0, 2) and (3, 0) of a 4 x 3 grid of 2 m cells, each on its own slope
+    grid = GroundGrid(origin=np.array([0.0, 0.0]), cell_size=2.0, rows=3, keys=np.array([0, 2, 9]),
+                      planes=np.array([[0.1, 0.0, 1.0], [0.0, 0.2, 2.0], [-0.1, 0.0, 3.0]]))
+    points = np.array([
+        [1.5, 0.5, 0.0],    # In cell (0, 0): its own plane
+        [1.0, 2.9, 0.0],    # Cell (0, 1), empty: nearest is (0, 0), held at its top edge
+        [3.0, 5.0, 0.0],    # Cell (1, 2), empty: nearest is (0, 2), not the next key (3, 0)
+        [5.0, 1.0, 0.0],    # Cell (2, 0), empty: nearest is (3, 0)
+        [-20.0, 1.0, 0.0],  # Far left of (0, 0): held at the plane's left edge
+        [7.0, 30.0, 0.0],   # Above the grid, past (0, 2) and (3, 0): nearest centre is (0, 2)
+    ])
+    expected = [1.0 + 0.1 * 0.5, 1.0, 2.0 + 0.2 * 0.0, 3.0 - 0.1 * -1.0, 1.0 - 0.1, 2.0 + 0.2]
+    np.testing.assert_allclose(grid.ground_z(points), expected)
+    np.testing.assert_allclose(grid.height(points + [0, 0, 5.0]), 5.0 - np.array(expected))
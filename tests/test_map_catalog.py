@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the map catalogue: incremental indexing, bbox queries and point estimates
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from map_catalog import MapCatalog
+
+
+def write_maps(make_records, write_pcd_file, count: int = 3):
+    """Maps of 4000 points each, side by side along x at 100 m spacing"""
+    maps = []
+    for i in range(count):
+        data = make_records(4000, seed=i)
+        data['x'] += 100 * i
+        maps.append((write_pcd_file(data, f"map_{i}.pcd"), data))
+    return maps
+
+
+def points_in(data: np.ndarray, low, high) -> int:
+    """Number of records inside a box"""
+    xyz = np.column_stack([data['x'], data['y'], data['z']])
+    return int(np.count_nonzero(np.all((xyz >= low) & (xyz <= high), axis=1)))
+
+
+def test_reindex_reads_only_changed_files(tmp_path, make_records, write_pcd_file):
+    """Size or mtime changes trigger a re-read; vanished files leave the catalogue"""
+    maps = write_maps(make_records, write_pcd_file)
+    paths = [path for path, _ in maps]
+    with MapCatalog(str(tmp_path / "catalog.db")) as catalog:
+        assert catalog.index_files(paths) == {'added': 3, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+        assert catalog.index_files(paths)['unchanged'] == 3
+
+        # A rewrite with another size, and a touch that only moves the mtime
+        write_pcd_file(make_records(1000), "map_0.pcd")
+        stat = os.stat(paths[1])
+        os.utime(paths[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        counts = catalog.index_files(paths)
+        assert (counts['updated'], counts['unchanged']) == (2, 1)
+        assert catalog.get(paths[0])['num_points'] == 1000
+
+        Path(paths[2]).unlink()
+        counts = catalog.index_files(paths)
+        assert (counts['removed'], counts['failed'], counts['unchanged']) == (1, 0, 2)
+        assert catalog.get(paths[2]) is None and len(catalog) == 2
+        assert catalog.query((np.array([150, -60, -60]), np.array([260, 60, 60]))) == []
+
+
+def test_query_returns_files_overlapping_the_box(tmp_path, make_records, write_pcd_file):
+    """The R-tree finds exactly the files whose bounds meet the box"""
+    maps = write_maps(make_records, write_pcd_file)
+    with MapCatalog(str(tmp_path / "catalog.db")) as catalog:
+        counts = catalog.index_directory(str(tmp_path))
+        assert counts['added'] == 3
+
+        paths = [str(Path(path).resolve()) for path, _ in maps]
+        assert catalog.paths_in_bbox((np.array([-10, -10, -10]), np.array([10, 10, 10]))) == paths[:1]
+        assert catalog.paths_in_bbox((np.array([40, -10, -10]), np.array([60, 10, 10]))) == paths[:2]
+        assert catalog.paths_in_bbox((np.array([-200, -200, -200]), np.array([400, 200, 200]))) == paths
+        assert catalog.paths_in_bbox((np.array([60, 60, -10]), np.array([70, 70, 10]))) == []
+        entry = catalog.get(paths[1])
+        np.testing.assert_allclose(entry['min'], [min(maps[1][1][axis]) for axis in 'xyz'])
+        np.testing.assert_allclose(entry['max'], [max(maps[1][1][axis]) for axis in 'xyz'])
+
+
+def test_point_estimates_follow_the_histogram(tmp_path, make_records, write_pcd_file):
+    """Histogram estimates are close to the true count; bounds-only estimates scale with the area"""
+    maps = write_maps(make_records, write_pcd_file)
+    paths = [path for path, _ in maps]
+    with MapCatalog(str(tmp_path / "catalog.db")) as catalog:
+        catalog.index_files(paths)
+        # A quarter of the first map by area
+        low, high = np.array([-50, -50, -60]), np.array([0, 0, 60])
+        assert abs(catalog.estimate_points((low, high)) - 1000) <= 50
+
+        # Asking for a histogram re-reads the files even though they did not change
+        assert catalog.index_files(paths, histogram_bins=16)['updated'] == 3
+        for low, high in (([-50, -50, -60], [0, 0, 60]), ([30, -20, -60], [130, 20, 60])):
+            low, high = np.array(low), np.array(high)
+            actual = sum(points_in(data, low, high) for _, data in maps)
+            assert abs(catalog.estimate_points((low, high)) - actual) <= 0.05 * actual
+        assert catalog.estimate_points((np.array([1000, 0, 0]), np.array([1010, 10, 10]))) == 0
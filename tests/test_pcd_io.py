@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the native PCD reader and writer
+"""
+
+import logging
+import os
+import stat
+import numpy as np
+import open3d as o3d
+import pytest
+
+import point_cloud_loader
+from point_cloud_data import COUNT_ATTRIBUTE, ROW_ATTRIBUTE
+from lod_cache import CACHE_DIR_NAME, LODCache
+from point_cloud_loader import (PREVIEW_BUDGET_TOLERANCE, PointCloudLoader, atomic_write, block_index_path,
+                                load_block_index, lzf_compress, lzf_decompress, memmap_pcd, parse_ascii_pcd,
+                                read_compressed_pcd, read_pcd_bbox, read_pcd_header, split_point_budget)
+
+
+def test_lzf_round_trip():
+    """The LZF codec gives back its input, for repetitive and random bytes"""
+    rng = np.random.default_rng(1)
+    for body in (bytes(10000), np.arange(5000, dtype=np.float32).tobytes(),
+                 rng.integers(0, 256, 4096, dtype=np.uint8).tobytes()):
+        assert lzf_decompress(lzf_compress(body), len(body)) == body
+
+
+def test_binary_compressed_round_trip(make_cloud, write_pcd_file):
+    """A cloud saved as binary_compressed loads back with the same points and colors"""
+    cloud = make_cloud()
+    path = write_pcd_file(cloud, "compressed.pcd", 'binary_compressed')
+    assert read_pcd_header(path).data_format == 'binary_compressed'
+
+    loader = PointCloudLoader()
+    assert loader.load_pcd(path, downsample_for_preview=False)
+    loaded = loader.get_point_data()
+    assert len(loaded) == len(cloud)
+    np.testing.assert_allclose(loaded.points, cloud.points.astype(np.float32), atol=1e-2)
+    np.testing.assert_array_equal(loaded.colors, cloud.colors)
+
+
+def test_binary_compressed_keeps_extra_fields(make_records, write_pcd_file):
+    """Fields Open3D would drop go through the native codec and survive the round trip"""
+    data = make_records()
+    path = write_pcd_file(data, "intensity.pcd", 'binary_compressed')
+    header = read_pcd_header(path)
+    assert header.fields == ['x', 'y', 'z', 'intensity']
+    np.testing.assert_array_equal(read_compressed_pcd(path, header), data)
+
+
+def crop(data: np.ndarray, low, high) -> np.ndarray:
+    """Records of a structured array inside a box, the slow way"""
+    inside = np.ones(len(data), dtype=bool)
+    for i, axis in enumerate(('x', 'y', 'z')):
+        inside &= (data[axis] >= low[i]) & (data[axis] <= high[i])
+    return data[inside]
+
+
+def test_bbox_read_matches_crop(make_records, write_pcd_file):
+    """Reading a box through the block index returns exactly the points inside it"""
+    data = make_records(20000)
+    data = data[np.argsort(data['x'], kind='stable')]
+    path = write_pcd_file(data, "blocks.pcd")
+    header = read_pcd_header(path)
+
+    for low, high in (([-10, -50, -50], [10, 50, 50]), ([-50, 0, -20], [-40, 30, 20]), ([60, 60, 60], [70, 70, 70])):
+        got = read_pcd_bbox(path, header, (np.array(low), np.array(high)), block_points=512)
+        np.testing.assert_array_equal(got, crop(data, low, high))
+    assert block_index_path(path).exists()
+
+
+def test_lod_build_keeps_block_index_sidecar(make_records, write_pcd_file):
+    """Rebuilding the pyramid drops older entries of the file, not its block index"""
+    data = make_records(2000)
+    path = write_pcd_file(data, "sidecars.pcd")
+    load_block_index(path, read_pcd_header(path), block_points=256)
+    stale = block_index_path(path).parent / f"sidecars.pcd.{'0' * 32}"
+    stale.mkdir()
+
+    cache = LODCache()
+    manifest = cache.build(path, np.column_stack([data['x'], data['y'], data['z']]))
+    assert block_index_path(path).exists()
+    assert not stale.exists()
+    assert cache.lookup(path)['key'] == manifest['key']
+
+
+def test_eviction_counts_block_index_sidecars(make_records, write_pcd_file):
+    """Sidecars are held to the cache size bound like pyramid entries, least recently used first"""
+    data = make_records(2000)
+    paths = [write_pcd_file(data, f"map_{i}.pcd") for i in range(2)]
+    for path in paths:
+        load_block_index(path, read_pcd_header(path), block_points=64)
+    sidecars = [block_index_path(path) for path in paths]
+    os.utime(sidecars[0], (1, 1))
+
+    cache = LODCache(max_cache_bytes=sidecars[1].stat().st_size)
+    cache.evict(sidecars[0].parent)
+    assert not sidecars[0].exists()
+    assert sidecars[1].exists()
+
+    # A pyramid build makes room for its entry by evicting sidecars too
+    cache.max_cache_bytes = 0
+    manifest = cache.build(paths[0], np.column_stack([data['x'], data['y'], data['z']]))
+    assert not sidecars[1].exists()
+    assert os.path.isdir(manifest['entry_dir'])
+
+
+def test_block_index_without_writable_cache(tmp_path, make_records, write_pcd_file):
+    """A map directory where the sidecar cannot be stored still gets its index"""
+    data = make_records(2000)
+    path = write_pcd_file(data, "readonly.pcd")
+    header = read_pcd_header(path)
+    # A file in place of the cache directory makes every write under it fail, even as root
+    (tmp_path / CACHE_DIR_NAME).write_bytes(b'')
+
+    index = load_block_index(path, header, block_points=256)
+    assert len(index['min']) == 8
+    np.testing.assert_array_equal(index['min'].min(axis=0), [data[axis].min() for axis in ('x', 'y', 'z')])
+    low, high = np.array([0, 0, 0]), np.array([50, 50, 50])
+    np.testing.assert_array_equal(read_pcd_bbox(path, header, (low, high)), crop(data, low, high))
+
+
+def test_point_budget_split_is_exact():
+    """Preview shares add up to the budget and follow the point counts"""
+    counts = [1000000, 333333, 333333, 333334, 7, 0]
+    shares = split_point_budget(50000, counts)
+    assert sum(shares) == 50000
+    assert shares[-1] == 0
+    assert all(abs(share - 50000 * count / sum(counts)) < 1 for share, count in zip(shares, counts))
+
+
+def test_preview_budget_covers_tiles_without_header(tmp_path, make_cloud, write_pcd_file):
+    """A tile Open3D reads gets a share of the preview by its file size, not a single point"""
+    paths = [write_pcd_file(make_cloud(20000, seed=i), f"tile_{i}.pcd") for i in range(2)]
+    paths.append(str(tmp_path / "tile_2.ply"))
+    assert o3d.io.write_point_cloud(paths[-1], make_cloud(20000, seed=2).to_open3d())
+
+    loader = PointCloudLoader()
+    assert loader.load_tiles(paths, max_points_preview=12000, max_workers=1)
+    tile_ids = loader.get_point_data().attributes['tile_id']
+    assert len(tile_ids) <= 12000 * (1 + PREVIEW_BUDGET_TOLERANCE)
+    assert np.bincount(tile_ids, minlength=3)[2] > 1000
+
+
+def test_binary_round_trip_keeps_every_field(make_records, write_pcd_file):
+    """Binary PCDs are written and memory-mapped back record for record"""
+    data = make_records()
+    path = write_pcd_file(data, "binary.pcd")
+    header = read_pcd_header(path)
+    assert (header.data_format, header.points, header.fields) == ('binary', len(data), ['x', 'y', 'z', 'intensity'])
+    np.testing.assert_array_equal(memmap_pcd(path, header), data)
+
+
+def test_truncated_binary_body_is_rejected(make_records, write_pcd_file):
+    """A body shorter than the header declares is an error, not a short cloud"""
+    path = write_pcd_file(make_records(100), "truncated.pcd")
+    with open(path, 'r+b') as f:
+        f.seek(0, 2)
+        f.truncate(f.tell() - 1)
+    with pytest.raises(ValueError):
+        memmap_pcd(path)
+
+
+def test_ascii_pcd_loads(make_records, write_pcd_file):
+    """ASCII bodies are parsed natively, into the same points a binary file gives"""
+    data = make_records(1000)
+    path = write_pcd_file(data, "ascii.pcd", 'ascii')
+
+    np.testing.assert_array_equal(parse_ascii_pcd(path), data)
+    loader = PointCloudLoader()
+    assert loader.load_pcd(path, downsample_for_preview=False)
+    points = np.column_stack([data[axis] for axis in ('x', 'y', 'z')])
+    np.testing.assert_allclose(loader.get_point_data().points, points, atol=1e-4)
+
+
+def test_morton_order_is_written_back_in_file_order(tmp_path, make_records, load_pcd_file):
+    """Reordered points keep their file rows, and saving the cloud or a copy of it restores the file order"""
+    data = make_records()
+    loader = load_pcd_file(data, "file_order.pcd", reorder=True)
+    cloud = loader.get_point_data()
+    rows = cloud.attributes[ROW_ATTRIBUTE]
+    file_points = np.column_stack([data[axis] for axis in ('x', 'y', 'z')])
+    assert not np.array_equal(rows, np.arange(len(data)))
+    np.testing.assert_allclose(cloud.points, file_points[rows], atol=1e-4)
+
+    # Coordinates go through float32 offsets from the origin, other fields are copied as they are
+    for name, pc in (("saved.pcd", None), ("copy.pcd", cloud.copy())):
+        assert loader.save_pcd(str(tmp_path / name), pc)
+        written = memmap_pcd(str(tmp_path / name))
+        assert written.dtype.names == ('x', 'y', 'z', 'intensity')
+        for axis in ('x', 'y', 'z'):
+            np.testing.assert_allclose(written[axis], data[axis], atol=1e-4)
+        np.testing.assert_array_equal(written['intensity'], data['intensity'])
+
+
+def test_duplicates_are_merged_with_counts(make_records, load_pcd_file):
+    """Points repeated by merged scans load once, weighted by how many they stand for"""
+    data = make_records(3000)
+    repeated = np.concatenate([data, data[:1000], data[:200]])
+    loader = load_pcd_file(repeated, "duplicates.pcd", dedup_tolerance=0.001, dedup_counts=True)
+    cloud = loader.get_point_data()
+    assert len(cloud) == len(data)
+    counts = cloud.attributes[COUNT_ATTRIBUTE]
+    assert counts.sum() == len(repeated)
+    assert np.bincount(counts.astype(np.int64)).tolist() == [0, 2000, 800, 200]
+
+
+def test_atomic_write_keeps_umask_mode_and_old_file(tmp_path):
+    """Written files get the mode a plain open() gives; a failed write leaves the previous file and no temporary"""
+    path = tmp_path / "atomic.bin"
+    previous = os.umask(0o027)
+    try:
+        with atomic_write(path) as tmp:
+            tmp.write_bytes(b'first')
+    finally:
+        os.umask(previous)
+    assert path.read_bytes() == b'first'
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as tmp:
+            tmp.write_bytes(b'partial')
+            raise RuntimeError("writer failed")
+    assert path.read_bytes() == b'first'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["atomic.bin"]
+
+
+def test_pure_python_lzf_is_never_silent(monkeypatch, caplog, make_cloud, make_records, write_pcd_file):
+    """Without python-lzf, Open3D takes the files it can; the Python codec warns for the others"""
+    monkeypatch.setattr(point_cloud_loader, 'lzf', None)
+    with caplog.at_level(logging.WARNING, logger='point_cloud_loader'):
+        write_pcd_file(make_cloud(), "colors.pcd", 'binary_compressed')
+    assert 'pure Python LZF' not in caplog.text
+
+    with caplog.at_level(logging.WARNING, logger='point_cloud_loader'):
+        write_pcd_file(make_records(), "intensity.pcd", 'binary_compressed')
+    assert 'pure Python LZF' in caplog.text
+
+
+def test_save_filtered_streams_kept_records(tmp_path, make_records, write_pcd_file):
+    """Filtering by a mask file and dropped labels keeps exactly the other records, every field included"""
+    data = make_records(5000)
+    rng = np.random.default_rng(4)
+    keep_mask = rng.random(len(data)) > 0.3
+    labels = rng.integers(0, 4, len(data))
+    np.save(tmp_path / "keep.npy", keep_mask)
+    expected = data[keep_mask & ~np.isin(labels, [1, 3])]
+
+    loader = PointCloudLoader()
+    for data_format in ('binary', 'binary_compressed'):
+        source = write_pcd_file(data, f"source_{data_format}.pcd", data_format)
+        output = tmp_path / f"filtered_{data_format}.pcd"
+        count = loader.save_filtered(source, str(output), str(tmp_path / "keep.npy"), labels, [1, 3], chunk_points=777)
+        assert count == len(expected)
+        header = read_pcd_header(str(output))
+        assert (header.data_format, header.points, header.fields) == ('binary', count, ['x', 'y', 'z', 'intensity'])
+        np.testing.assert_array_equal(memmap_pcd(str(output), header), expected)
+
+    with pytest.raises(ValueError):
+        loader.save_filtered(source, str(tmp_path / "bad.pcd"), keep_mask[:-1])
+    assert not (tmp_path / "bad.pcd").exists()
+
+
+def test_iter_chunks_covers_every_record_in_order(make_records, write_pcd_file):
+    """Blocks of every body format concatenate to the file, and the scan statistics match"""
+    data = make_records(5000)
+    data['x'][17] = np.nan
+    finite = np.isfinite(data['x'])
+    xyz = np.column_stack([data[axis][finite] for axis in ('x', 'y', 'z')]).astype(np.float64)
+
+    loader = PointCloudLoader()
+    for data_format in ('binary', 'binary_compressed', 'ascii'):
+        path = write_pcd_file(data, f"chunks_{data_format}.pcd", data_format)
+        chunks = list(loader.iter_chunks(path, chunk_points=1200))
+        assert [len(chunk) for chunk in chunks] == [1200] * 4 + [200]
+        records = np.concatenate(chunks)
+        for name in data.dtype.names:
+            np.testing.assert_array_equal(records[name], data[name])
+
+        stats = loader.scan_statistics(path, chunk_points=1200)
+        assert stats['num_points'] == len(data) - 1
+        np.testing.assert_allclose(stats['min'], xyz.min(axis=0))
+        np.testing.assert_allclose(stats['max'], xyz.max(axis=0))
+        np.testing.assert_allclose(stats['mean'], xyz.mean(axis=0), rtol=1e-9, atol=1e-9)
+
+
+def test_probe_reads_headers_only(tmp_path, make_records, write_pcd_file):
+    """Probing reports the layout of each file; unreadable files map to None instead of failing the batch"""
+    data = make_records(3000)
+    paths = {data_format: write_pcd_file(data, f"probe_{data_format}.pcd", data_format)
+             for data_format in ('binary', 'binary_compressed', 'ascii')}
+    broken = tmp_path / "broken.pcd"
+    broken.write_text("not a point cloud\n")
+
+    loader = PointCloudLoader()
+    info = loader.probe(paths['binary'])
+    assert (info['fields'], info['points'], info['data_format']) == (['x', 'y', 'z', 'intensity'], 3000, 'binary')
+    assert info['point_step'] == 16 and info['data_size'] == info['uncompressed_size'] == 3000 * 16
+    assert info['file_size'] == os.path.getsize(paths['binary'])
+
+    compressed = loader.probe(paths['binary_compressed'])
+    assert compressed['uncompressed_size'] == 3000 * 16
+    assert compressed['compressed_size'] + 8 <= compressed['data_size']
+
+    results = loader.probe_many(list(paths.values()) + [str(broken)], max_workers=4)
+    assert list(results) == list(paths.values()) + [str(broken)]
+    assert results[str(broken)] is None
+    assert [results[path]['data_format'] for path in paths.values()] == list(paths)
+    assert all(results[path]['points'] == 3000 for path in paths.values())
+    assert sorted(loader.probe_directory(str(tmp_path))) == sorted(results)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the tile store: region editing across tile borders, LRU eviction and flush
+"""
+
+import numpy as np
+import pytest
+
+from point_cloud_data import PointCloudData
+from tile_store import TileStore
+
+
+def make_store_cloud(make_cloud, num_points: int = 4000) -> PointCloudData:
+    """Colored cloud with an intensity column and a point id to match rows by"""
+    cloud = make_cloud(num_points)
+    rng = np.random.default_rng(5)
+    cloud.attributes = {'intensity': rng.uniform(0, 1, num_points).astype(np.float32),
+                        'point_id': np.arange(num_points, dtype=np.int64)}
+    return cloud
+
+
+def by_id(cloud: PointCloudData) -> PointCloudData:
+    """Cloud with its rows in point id order"""
+    return cloud.select(np.argsort(cloud.attributes['point_id'], kind='stable'))
+
+
+def assert_same_points(actual: PointCloudData, expected: PointCloudData):
+    """Same points, colors and attributes, whatever the row order and frame"""
+    actual, expected = by_id(actual), by_id(expected)
+    np.testing.assert_array_equal(actual.attributes['point_id'], expected.attributes['point_id'])
+    np.testing.assert_allclose(actual.points, expected.points, atol=1e-2)
+    np.testing.assert_array_equal(actual.colors, expected.colors)
+    np.testing.assert_array_equal(actual.attributes['intensity'], expected.attributes['intensity'])
+
+
+def tile_nbytes(store: TileStore) -> int:
+    """Size of the largest tile of a store"""
+    return max(store.get_tile(key).nbytes for key in store.keys())
+
+
+def test_region_round_trip_across_tiles(tmp_path, make_cloud, world_offset):
+    """Deleting, moving and pasting in a region spanning tiles survives eviction and reopening"""
+    cloud = make_store_cloud(make_cloud)
+    store = TileStore.from_point_data(str(tmp_path / "store"), cloud, tile_size=20.0)
+    assert len(store.keys()) == 25
+
+    # Resident tiles are bounded to about two, so editing the region evicts tiles to disk
+    store.max_resident_bytes = 2 * tile_nbytes(store)
+    bbox = (world_offset + [30, 30, -10], world_offset + [70, 70, 110])
+    data, region = store.read_region(bbox)
+    assert len(region.keys) == 9
+    assert len(data) == sum(store.index['tiles'][key]['num_points'] for key in region.keys)
+
+    # Delete every third point, move a few into a tile outside the region and paste new ones
+    edited = data.select(np.flatnonzero(np.arange(len(data)) % 3 != 0))
+    moved = edited.points
+    moved[:10, :2] = world_offset[:2] + 5.0
+    pasted = PointCloudData.from_points(
+        world_offset + [[45.0, 45.0, 1.0], [59.9, 10.0, 2.0]],
+        np.full((2, 3), 7, dtype=np.uint8),
+        attributes={'intensity': np.full(2, 0.5, dtype=np.float32),
+                    'point_id': np.array([10 ** 6, 10 ** 6 + 1])})
+    edited = PointCloudData.from_points(moved, edited.colors, attributes=edited.attributes).append(pasted)
+
+    spilled = store.write_region(region, edited)
+    assert spilled == ['0_0', '2_0']
+    store.flush()
+
+    outside = cloud.select(~np.isin(cloud.attributes['point_id'], data.attributes['point_id']))
+    expected = PointCloudData.from_points(
+        np.concatenate([outside.points, edited.points]),
+        np.concatenate([outside.colors, edited.colors]),
+        attributes={name: np.concatenate([outside.attributes[name], edited.attributes[name]])
+                    for name in ('intensity', 'point_id')})
+
+    reopened = TileStore(str(tmp_path / "store"))
+    assert reopened.num_points() == len(expected)
+    assert_same_points(reopened.read_region()[0], expected)
+
+    # Every tile holds exactly the points that lie in it
+    for key in reopened.keys():
+        tile = reopened.get_tile(key)
+        assert np.all(tile.xyz[:, :2] >= 0) and np.all(tile.xyz[:, :2] < 20.0)
+
+
+def test_eviction_writes_back_only_dirty_tiles(tmp_path, make_cloud, monkeypatch):
+    """Tiles over the resident bound are dropped least recently used first; edited ones are written"""
+    cloud = make_store_cloud(make_cloud)
+    bound = 3 * tile_nbytes(TileStore.from_point_data(str(tmp_path / "store"), cloud, tile_size=20.0))
+    store = TileStore(str(tmp_path / "store"), max_resident_bytes=bound)
+    keys = store.keys()
+
+    written = []
+    write_tile = store._write_tile
+    monkeypatch.setattr(store, '_write_tile', lambda key, tile: (written.append(key), write_tile(key, tile)))
+
+    # Halve the first tile, then read the others past the bound
+    first = store.get_tile(keys[0])
+    store.put_tile(keys[0], first.select(np.arange(0, len(first), 2)))
+    for key in keys[1:]:
+        store.get_tile(key)
+        assert store._resident_bytes <= store.max_resident_bytes
+    assert written == [keys[0]]
+    assert keys[0] not in store._resident and not store._dirty
+
+    # The written tile and the index are on disk without a flush
+    reopened = TileStore(str(tmp_path / "store"))
+    assert reopened.index['tiles'][keys[0]]['num_points'] == (len(first) + 1) // 2
+    assert_same_points(reopened.get_tile(keys[0]), first.select(np.arange(0, len(first), 2)))
+    assert reopened.num_points() == len(cloud) - len(first) // 2
+
+
+def test_flush_writes_dirty_tiles_once(tmp_path, make_cloud):
+    """flush() writes each dirty tile once, and an emptied tile leaves the store"""
+    cloud = make_store_cloud(make_cloud)
+    store = TileStore.from_point_data(str(tmp_path / "store"), cloud, tile_size=20.0)
+    assert store.flush() == 0
+
+    data, region = store.read_tiles(['0_0', '1_0'])
+    keep = data.points[:, 0] >= store.origin[0] + 20.0
+    assert store.write_region(region, data.select(keep)) == []
+    assert store.flush() == 2
+    assert store.flush() == 0
+
+    assert '0_0' not in store.index['tiles'] and not store.tile_dir('0_0').exists()
+    reopened = TileStore(str(tmp_path / "store"))
+    assert '0_0' not in reopened.keys()
+    assert reopened.num_points() == len(cloud) - np.count_nonzero(~keep)
+    with pytest.raises(FileExistsError):
+        TileStore.create(str(tmp_path / "store"), store.origin)